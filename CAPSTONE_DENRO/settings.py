@@ -45,8 +45,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'DENRO.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'DENRO.activity_log.ActivityLogMiddleware',
+    'DENRO.principal.PrincipalMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -106,6 +109,43 @@ else:
         }
     }
 
+    # Connection pooling (DB_POOL=true; needs psycopg 3 and psycopg_pool, e.g. pip install "psycopg[pool]")
+    # DB_POOL_SIZE connections are kept open per process and up to DB_POOL_OVERFLOW more are opened
+    # under load; a request waits at most DB_POOL_TIMEOUT seconds for one. Connections are checked
+    # before being handed out and recycled after DB_POOL_MAX_LIFETIME seconds.
+    # Set DB_TRANSACTION_POOLER=true when DB_HOST/DB_PORT point at a transaction-mode pooler
+    # (e.g. Supabase's port 6543): prepared statements are then disabled, since consecutive
+    # statements may run on different server connections. The export's server-side cursor
+    # (operation.iter_enumerator_reports) is safe either way, as it runs inside transaction.atomic().
+    DB_TRANSACTION_POOLER = os.getenv('DB_TRANSACTION_POOLER', 'false').lower() == 'true'
+    if DB_TRANSACTION_POOLER:
+        DATABASES['default']['OPTIONS']['prepare_threshold'] = None
+
+    if os.getenv('DB_POOL', 'false').lower() == 'true':
+        try:
+            from psycopg_pool import ConnectionPool
+        except ImportError as e:
+            from django.core.exceptions import ImproperlyConfigured
+            raise ImproperlyConfigured(
+                'DB_POOL=true needs psycopg 3 with psycopg_pool (pip install "psycopg[pool]"); '
+                'install it or set DB_POOL=false.'
+            ) from e
+
+        DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '4'))
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': DB_POOL_SIZE,
+            'max_size': DB_POOL_SIZE + int(os.getenv('DB_POOL_OVERFLOW', '4')),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+            'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+            'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),
+            'check': ConnectionPool.check_connection,
+            'name': 'denro',
+        }
+    else:
+        # Without the pool, keep each thread's connection for a while and check it before reuse
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+        DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -149,4 +189,156 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 STATIC_URL = '/static/'
-STATICFILES_DIRS = [BASE_DIR / "static"]
\ No newline at end of file
+STATICFILES_DIRS = [BASE_DIR / "static"]
+
+# Report exports
+# Rendered exports are written here and reused while they are fresher than EXPORT_ARTIFACT_TTL seconds.
+
+EXPORT_ARTIFACT_DIR = Path(os.getenv('EXPORT_ARTIFACT_DIR', BASE_DIR / 'exports'))
+EXPORT_ARTIFACT_TTL = int(os.getenv('EXPORT_ARTIFACT_TTL', '900'))
+EXPORT_JOB_WORKERS = int(os.getenv('EXPORT_JOB_WORKERS', '2'))
+
+
+# Protected-area GeoJSON cache
+# Converted shapefiles are kept in memory per process and on disk across processes (sizes in bytes).
+
+GEOJSON_CACHE_DIR = Path(os.getenv('GEOJSON_CACHE_DIR', BASE_DIR / 'cache' / 'geojson'))
+GEOJSON_CACHE_MEMORY_BYTES = int(os.getenv('GEOJSON_CACHE_MEMORY_BYTES', str(32 * 1024 * 1024)))
+GEOJSON_CACHE_DISK_BYTES = int(os.getenv('GEOJSON_CACHE_DISK_BYTES', str(512 * 1024 * 1024)))
+
+
+# Storage gateway (DENRO/storage.py)
+# STORAGE_BACKEND is 'supabase' (Storage + PostgREST over HTTP), 'local' (files under STORAGE_LOCAL_ROOT),
+# 'memory' (in this process only) or 'simulated' (STORAGE_SIM_BACKEND behind the STORAGE_SIM_* faults below).
+
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'supabase')
+STORAGE_TIMEOUT = float(os.getenv('STORAGE_TIMEOUT', '10'))
+STORAGE_RETRIES = int(os.getenv('STORAGE_RETRIES', '2'))
+STORAGE_POOL_SIZE = int(os.getenv('STORAGE_POOL_SIZE', '10'))
+STORAGE_LOCAL_ROOT = Path(os.getenv('STORAGE_LOCAL_ROOT', BASE_DIR / 'local_storage'))
+STORAGE_LOCAL_URL = os.getenv('STORAGE_LOCAL_URL', '/local-storage/')
+
+# Simulated storage: per-call latency (+ random jitter), bandwidth for object bytes (0 = unlimited),
+# share of calls failing with HTTP 503 / hanging until timeout, and which operations are affected.
+STORAGE_SIM_BACKEND = os.getenv('STORAGE_SIM_BACKEND', 'memory')
+STORAGE_SIM_LATENCY_MS = float(os.getenv('STORAGE_SIM_LATENCY_MS', '50'))
+STORAGE_SIM_JITTER_MS = float(os.getenv('STORAGE_SIM_JITTER_MS', '20'))
+STORAGE_SIM_BANDWIDTH_KBPS = float(os.getenv('STORAGE_SIM_BANDWIDTH_KBPS', '0'))
+STORAGE_SIM_ERROR_RATE = float(os.getenv('STORAGE_SIM_ERROR_RATE', '0'))
+STORAGE_SIM_TIMEOUT_RATE = float(os.getenv('STORAGE_SIM_TIMEOUT_RATE', '0'))
+STORAGE_SIM_OPERATIONS = [op.strip() for op in os.getenv(
+    'STORAGE_SIM_OPERATIONS', 'upload,download,remove,select,insert,delete').split(',') if op.strip()]
+STORAGE_SIM_SEED = int(os.getenv('STORAGE_SIM_SEED')) if os.getenv('STORAGE_SIM_SEED') else None
+
+
+# Cache
+# Defaults to a per-process memory cache; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) when running several workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'denro'),
+    }
+}
+
+# Whether every process sees the same cache. Features that rely on it for correctness across
+# workers (report details payload caching) stay off otherwise; set CACHE_SHARED=true to vouch
+# for a per-process backend when only one process serves requests.
+CACHE_SHARED = os.getenv('CACHE_SHARED', str(CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+))).lower() == 'true'
+
+REPORT_DETAILS_CACHE_TTL = int(os.getenv('REPORT_DETAILS_CACHE_TTL', '3600'))
+
+
+# Async views
+# Upper bound on blocking DB/storage calls an async view may have in flight at once (per process).
+
+ASYNC_IO_CONCURRENCY = int(os.getenv('ASYNC_IO_CONCURRENCY', '8'))
+
+
+# Signature uploads
+# Normalized signatures wait in SIGNATURE_OUTBOX_DIR until the background worker has stored them.
+# With SIGNATURE_OUTBOX_WORKER the worker also starts as soon as a server process loads the app, so
+# signatures left by a restart are uploaded without waiting for a new one. manage.py drain_signature_outbox
+# uploads the whole backlog once.
+
+SIGNATURE_OUTBOX_DIR = Path(os.getenv('SIGNATURE_OUTBOX_DIR', BASE_DIR / 'outbox' / 'signatures'))
+SIGNATURE_OUTBOX_WORKER = os.getenv('SIGNATURE_OUTBOX_WORKER', 'true').lower() == 'true'
+SIGNATURE_OUTBOX_POLL_SECONDS = float(os.getenv('SIGNATURE_OUTBOX_POLL_SECONDS', '30'))
+SIGNATURE_MAX_BYTES = int(os.getenv('SIGNATURE_MAX_BYTES', str(2 * 1024 * 1024)))
+
+
+# Activity log
+# Events are buffered per process and written in multi-row INSERTs of up to ACTIVITY_LOG_BATCH_SIZE rows,
+# at least every ACTIVITY_LOG_FLUSH_INTERVAL seconds. Enable USE_X_FORWARDED_FOR only behind a trusted proxy.
+
+ACTIVITY_LOG_ENABLED = os.getenv('ACTIVITY_LOG_ENABLED', 'true').lower() == 'true'
+ACTIVITY_LOG_BATCH_SIZE = int(os.getenv('ACTIVITY_LOG_BATCH_SIZE', '200'))
+ACTIVITY_LOG_FLUSH_INTERVAL = float(os.getenv('ACTIVITY_LOG_FLUSH_INTERVAL', '2'))
+ACTIVITY_LOG_BUFFER_MAX = int(os.getenv('ACTIVITY_LOG_BUFFER_MAX', '10000'))
+USE_X_FORWARDED_FOR = os.getenv('USE_X_FORWARDED_FOR', 'false').lower() == 'true'
+# Number of proxies in front of the app that append to X-Forwarded-For
+TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', '1'))
+
+
+# Office hierarchy cache (DENRO/office_tree.py)
+# The region/PENRO/CENRO tree is reloaded after OFFICE_TREE_TTL seconds, or sooner when its shared
+# version changes (checked every OFFICE_TREE_VERSION_CHECK seconds).
+
+OFFICE_TREE_TTL = int(os.getenv('OFFICE_TREE_TTL', '3600'))
+OFFICE_TREE_VERSION_CHECK = float(os.getenv('OFFICE_TREE_VERSION_CHECK', '5'))
+# Seconds a browser may reuse office option responses before revalidating them with If-None-Match
+OFFICE_OPTIONS_MAX_AGE = int(os.getenv('OFFICE_OPTIONS_MAX_AGE', '300'))
+
+
+# Login throttling (DENRO/login_guard.py)
+# Failed logins per username / client IP are counted over a sliding LOGIN_THROTTLE_WINDOW (seconds).
+# Reaching a limit locks the key for LOGIN_THROTTLE_BASE_LOCKOUT seconds, doubling per further failure.
+# LOGIN_THROTTLE_BACKEND is 'memory' (per process) or 'cache' (shared through CACHES['default']).
+
+LOGIN_THROTTLE_ENABLED = os.getenv('LOGIN_THROTTLE_ENABLED', 'true').lower() == 'true'
+LOGIN_THROTTLE_BACKEND = os.getenv('LOGIN_THROTTLE_BACKEND', 'memory')
+LOGIN_THROTTLE_WINDOW = int(os.getenv('LOGIN_THROTTLE_WINDOW', '900'))
+LOGIN_THROTTLE_USERNAME_LIMIT = int(os.getenv('LOGIN_THROTTLE_USERNAME_LIMIT', '5'))
+LOGIN_THROTTLE_IP_LIMIT = int(os.getenv('LOGIN_THROTTLE_IP_LIMIT', '20'))
+LOGIN_THROTTLE_BASE_LOCKOUT = int(os.getenv('LOGIN_THROTTLE_BASE_LOCKOUT', '30'))
+LOGIN_THROTTLE_MAX_LOCKOUT = int(os.getenv('LOGIN_THROTTLE_MAX_LOCKOUT', '3600'))
+LOGIN_THROTTLE_MAX_KEYS = int(os.getenv('LOGIN_THROTTLE_MAX_KEYS', '100000'))
+
+
+# Sessions
+# cached_db serves sessions from the cache and only reads the database on a cache miss. It is the
+# default only with a shared cache (CACHE_SHARED): with a per-process cache, a logout would only clear
+# the session from the worker that handled it, and the others would keep accepting it.
+# 'django.contrib.sessions.backends.signed_cookies' removes server-side session storage entirely.
+# Revoking a user's sessions (manage.py revoke_sessions) stores a cut-off in users.sessions_revoked_at;
+# each process re-reads it at least every SESSION_REVOCATION_CHECK_TTL seconds.
+
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db' if CACHE_SHARED
+                           else 'django.contrib.sessions.backends.db')
+SESSION_COOKIE_AGE = int(os.getenv('SESSION_COOKIE_AGE', str(60 * 60 * 24 * 14)))
+SESSION_REVOCATION_CHECK_TTL = int(os.getenv('SESSION_REVOCATION_CHECK_TTL', '30'))
+
+
+# Metrics (DENRO/metrics.py)
+# Prometheus text format at /metrics. Scrapers authenticate with "Authorization: Bearer METRICS_TOKEN";
+# without a token the endpoint only answers METRICS_ALLOWED_IPS.
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+
+
+# Dashboard statistics (DENRO/dashboard_stats.py)
+# Super Admin user counts are read from the trigger-maintained user_role_counts table
+# (create_user_stats.sql) and may be up to SA_DASHBOARD_STATS_TTL seconds old.
+
+SA_DASHBOARD_STATS_TTL = int(os.getenv('SA_DASHBOARD_STATS_TTL', '60'))
+# CENRO/PENRO report statistics: ended buckets are kept for REPORT_STATS_CLOSED_TTL seconds (this bounds how
+# long a late-filed or edited report can be missing from them), the bucket containing today is recounted
+# every REPORT_STATS_CURRENT_TTL seconds.
+REPORT_STATS_CLOSED_TTL = int(os.getenv('REPORT_STATS_CLOSED_TTL', str(60 * 60 * 24)))
+REPORT_STATS_CURRENT_TTL = int(os.getenv('REPORT_STATS_CURRENT_TTL', '60'))
@@ -0,0 +1,272 @@
+# activity_log.py
+"""
+Buffered writer for the activity_logs audit table.
+
+log_activity() only appends to an in-process buffer and never touches the
+database, so recording an action adds no I/O to the request. A background
+thread writes the buffer out with one multi-row INSERT per batch, as soon as
+ACTIVITY_LOG_BATCH_SIZE events are waiting or every ACTIVITY_LOG_FLUSH_INTERVAL
+seconds, and once more when the process exits.
+
+ActivityLogMiddleware remembers the current request, so code deep inside
+operation.py can log an action without being handed the acting user or
+client IP. Each row also records the region, PENRO and CENRO the user
+belonged to, so office-scoped log pages are index range scans (apply
+create_activity_logs_function.sql before deploying this writer). When the database is unreachable events are kept and retried; if
+the buffer reaches ACTIVITY_LOG_BUFFER_MAX the oldest events are dropped (and
+counted) rather than ever blocking a request. A batch the database rejects
+(e.g. a user_id that no longer exists) is retried row by row, and only the
+rows that still fail are dropped, so one bad event cannot hold up the rest.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import threading
+from collections import deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import (
+    DatabaseError,
+    InterfaceError,
+    OperationalError,
+    close_old_connections,
+    connection,
+    transaction,
+)
+from django.utils import timezone
+
+from .office_tree import get_office_tree
+from .principal import get_principal
+
+logger = logging.getLogger(__name__)
+
+# Actions recorded by the app
+LOGIN = 'login'
+CREATE_ACCOUNT = 'create_account'
+ATTEST = 'attest'
+NOTE = 'note'
+EXPORT = 'export'
+PROTECTED_AREA_ADD = 'protected_area_add'
+PROTECTED_AREA_DELETE = 'protected_area_delete'
+
+_current_request = contextvars.ContextVar('denro_activity_request', default=None)
+
+_buffer = deque()
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_wakeup = threading.Event()
+_worker = None
+_stats = {'logged': 0, 'written': 0, 'dropped': 0, 'rejected': 0, 'failed_flushes': 0}
+
+# Errors meaning the database could not be reached, as opposed to rejecting the rows
+_RETRYABLE_ERRORS = (OperationalError, InterfaceError)
+
+
+def client_ip(request):
+    """
+    Client address of a request. X-Forwarded-For is only trusted when
+    USE_X_FORWARDED_FOR is on, and then only the entries our own proxies
+    appended: each adds the address it saw on the right, so the client is the
+    TRUSTED_PROXY_COUNT-th entry from the right (anything further left was
+    written by the client itself).
+    """
+    if settings.USE_X_FORWARDED_FOR:
+        entries = [entry.strip() for entry in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if entry.strip()]
+        if settings.TRUSTED_PROXY_COUNT and len(entries) >= settings.TRUSTED_PROXY_COUNT:
+            return entries[-settings.TRUSTED_PROXY_COUNT]
+    return request.META.get('REMOTE_ADDR')
+
+
+def log_activity(action, details=None, user_id=None, request=None):
+    """
+    Queue one activity-log event. Never blocks on the database and never raises.
+
+    The acting user and client IP come from `request` (or the request being
+    served, via ActivityLogMiddleware); pass user_id to override the user, e.g.
+    right after login. Dict details are stored as JSON.
+    """
+    if not settings.ACTIVITY_LOG_ENABLED:
+        return
+    try:
+        request = request or _current_request.get()
+        ip_address = None
+        office = (None, None, None)
+        if request is not None:
+            ip_address = client_ip(request)
+            principal = get_principal(request)
+            if user_id is None:
+                user_id = principal.id
+            if user_id is not None and user_id == principal.id:
+                office = (principal.region_id, principal.penro_id, principal.cenro_id)
+        if isinstance(details, (dict, list)):
+            details = json.dumps(details, default=str, separators=(',', ':'))
+
+        event = (user_id, action, details, ip_address, timezone.now(), *office)
+        with _lock:
+            _buffer.append(event)
+            _stats['logged'] += 1
+            _trim_buffer()
+            full = len(_buffer) >= settings.ACTIVITY_LOG_BATCH_SIZE
+        _ensure_worker()
+        if full:
+            _wakeup.set()
+    except Exception:
+        logger.exception('Could not queue activity log event %s', action)
+
+
+def _trim_buffer():
+    """Drop the oldest events past ACTIVITY_LOG_BUFFER_MAX. Call with _lock held."""
+    for _ in range(max(0, len(_buffer) - settings.ACTIVITY_LOG_BUFFER_MAX)):
+        _buffer.popleft()
+        _stats['dropped'] += 1
+
+
+def _requeue(events):
+    """Put unwritten events back in front, in order, for the next flush."""
+    with _lock:
+        _buffer.extendleft(reversed(events))
+        _trim_buffer()
+        _stats['failed_flushes'] += 1
+
+
+def _office_chain(region_id, penro_id, cenro_id):
+    """Fill in the PENRO and region above a CENRO, and the region above a PENRO."""
+    if cenro_id or penro_id:
+        tree = get_office_tree()
+        penro_id = penro_id or tree.cenro_penro_id(cenro_id)
+        region_id = region_id or tree.penro_region_id(penro_id)
+    return region_id, penro_id, cenro_id
+
+
+def _write_batch(events):
+    placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s)'] * len(events))
+    params = []
+    for user_id, action, details, ip_address, created_at, *office in events:
+        params += [user_id, action, details, ip_address, created_at, *_office_chain(*office)]
+    with transaction.atomic(), connection.cursor() as cur:
+        cur.execute(
+            f"""
+            INSERT INTO activity_logs (user_id, action, details, ip_address, created_at, region_id, penro_id, cenro_id)
+            VALUES {placeholders};
+            """,
+            params,
+        )
+
+
+def flush():
+    """Write every buffered event to the database in batches. Returns the number written."""
+    written = 0
+    with _flush_lock:
+        while True:
+            with _lock:
+                batch = [_buffer.popleft() for _ in range(min(len(_buffer), settings.ACTIVITY_LOG_BATCH_SIZE))]
+            if not batch:
+                return written
+            try:
+                _write_batch(batch)
+            except _RETRYABLE_ERRORS as e:
+                _requeue(batch)
+                logger.warning('Activity log flush of %s events failed: %s', len(batch), e)
+                return written
+            except DatabaseError as e:
+                # Some row can never be written (IntegrityError, DataError, ...): find it
+                logger.warning('Activity log batch of %s events rejected, writing one by one: %s', len(batch), e)
+                count, unwritten = _write_singly(batch)
+                written += count
+                if unwritten:
+                    _requeue(unwritten)
+                    return written
+                continue
+            written += len(batch)
+            with _lock:
+                _stats['written'] += len(batch)
+
+
+def _write_singly(events):
+    """
+    Write events one at a time, dropping (and counting) those the database
+    rejects. Returns (written, unwritten events) - the latter non-empty only
+    if the database became unreachable part way.
+    """
+    written = 0
+    for index, event in enumerate(events):
+        try:
+            _write_batch([event])
+        except _RETRYABLE_ERRORS:
+            return written, events[index:]
+        except DatabaseError as e:
+            logger.error('Dropping activity log event %s rejected by the database: %s', event[1], e)
+            with _lock:
+                _stats['rejected'] += 1
+            continue
+        written += 1
+        with _lock:
+            _stats['written'] += 1
+    return written, []
+
+
+def _run_worker():
+    while True:
+        _wakeup.wait(settings.ACTIVITY_LOG_FLUSH_INTERVAL)
+        _wakeup.clear()
+        try:
+            flush()
+        except Exception:
+            logger.exception('Activity log flush failed')
+        finally:
+            close_old_connections()
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name='denro-activity-log', daemon=True)
+            _worker.start()
+
+
+def stats():
+    """Events logged, written, dropped and rejected, failed flushes, and events still buffered (this process)."""
+    with _lock:
+        return dict(_stats, buffered=len(_buffer))
+
+
+@atexit.register
+def _flush_at_exit():
+    if _buffer:
+        try:
+            flush()
+        except Exception:
+            logger.exception('Activity log flush at exit failed')
+
+
+class ActivityLogMiddleware:
+    """Makes the current request available to log_activity() for the duration of each request."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+    async def __acall__(self, request):
+        token = _current_request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _current_request.reset(token)
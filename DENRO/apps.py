@@ -1,6 +1,23 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def _serving():
+    """False for management commands other than runserver, and for runserver's autoreload parent."""
+    if os.path.basename(sys.argv[0]) != 'manage.py' or len(sys.argv) < 2:
+        return True
+    return sys.argv[1] == 'runserver' and os.environ.get('RUN_MAIN') == 'true'
 
 
 class DenroConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'DENRO'
+
+    def ready(self):
+        # Upload signatures left in the outbox by an earlier run without waiting for a new one
+        if settings.SIGNATURE_OUTBOX_WORKER and _serving():
+            from . import signatures
+            signatures.ensure_worker()
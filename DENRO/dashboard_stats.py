@@ -0,0 +1,227 @@
+# dashboard_stats.py
+"""
+Numbers shown on the dashboards.
+
+Super Admin user counts come from user_role_counts, a handful of rows kept
+current by a trigger on users (see create_user_stats.sql), so reading them
+costs the same however many users there are. The result is cached for
+SA_DASHBOARD_STATS_TTL seconds, which bounds how stale the dashboard can be;
+creating an account through the app drops the cached copy at once.
+
+CENRO and PENRO report statistics are counted per day, week or month bucket
+in a single GROUP BY over the office's reports and cached per set of CENROs
+and bucket. Buckets that have ended are kept for REPORT_STATS_CLOSED_TTL
+(a day by default, which bounds how long a late or edited report can go
+uncounted); the bucket that contains today is refreshed far more often.
+"""
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_USER_COUNTS_KEY = 'dashboard:user_counts'
+
+# Template variable for each (lowercase) role
+_ROLE_COUNT_NAMES = {
+    'admin': 'admin_count',
+    'penro': 'penro_count',
+    'cenro': 'cenro_count',
+    'evaluator': 'evaluator_count',
+}
+
+
+def _load_user_counts():
+    counts = dict.fromkeys(_ROLE_COUNT_NAMES.values(), 0)
+    counts.update(active_users=0, inactive_users=0)
+    with connection.cursor() as cur:
+        try:
+            # Savepoint, so a missing table doesn't abort an enclosing transaction
+            with transaction.atomic():
+                cur.execute("SELECT role, is_active, user_count FROM user_role_counts;")
+                rows = cur.fetchall()
+        except DatabaseError as e:
+            # create_user_stats.sql has not been applied yet: count directly
+            logger.warning('user_role_counts unavailable, counting users instead: %s', e)
+            cur.execute("SELECT LOWER(TRIM(COALESCE(role, ''))), TRUE, COUNT(*) FROM users GROUP BY 1;")
+            rows = cur.fetchall()
+
+    for role, is_active, user_count in rows:
+        name = _ROLE_COUNT_NAMES.get(role)
+        if name:
+            counts[name] += user_count
+        counts['active_users' if is_active else 'inactive_users'] += user_count
+    return counts
+
+
+def get_user_counts():
+    """admin_count, penro_count, cenro_count, evaluator_count, active_users and inactive_users."""
+    counts = cache.get(_USER_COUNTS_KEY)
+    if counts is None:
+        try:
+            counts = _load_user_counts()
+        except DatabaseError as e:
+            logger.error(f"Error loading dashboard user counts: {e}")
+            return {}
+        cache.set(_USER_COUNTS_KEY, counts, settings.SA_DASHBOARD_STATS_TTL)
+    return counts
+
+
+def invalidate_user_counts():
+    """Make the next dashboard load read fresh counts (call after adding or changing accounts)."""
+    cache.delete(_USER_COUNTS_KEY)
+
+
+# =========================
+# Report statistics by time bucket
+# =========================
+REPORT_STATS_GRANULARITIES = ('day', 'week', 'month')
+REPORT_STATS_MAX_BUCKETS = 400
+_DEFAULT_BUCKETS = {'day': 30, 'week': 12, 'month': 12}
+
+
+def bucket_start(day, granularity):
+    """Start of the bucket containing `day` (weeks start on Monday, like Postgres date_trunc)."""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, granularity):
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def default_range(granularity, today):
+    """(from, to) covering the last few buckets up to today."""
+    start = bucket_start(today, granularity)
+    for _ in range(_DEFAULT_BUCKETS[granularity] - 1):
+        start = bucket_start(start - timedelta(days=1), granularity)
+    return start, today
+
+
+def bucket_starts(from_date, to_date, granularity):
+    """Start of every bucket overlapping from_date..to_date; ValueError past REPORT_STATS_MAX_BUCKETS."""
+    starts = []
+    start = bucket_start(from_date, granularity)
+    while start <= to_date:
+        if len(starts) == REPORT_STATS_MAX_BUCKETS:
+            raise ValueError(f"At most {REPORT_STATS_MAX_BUCKETS} {granularity} buckets can be requested at once")
+        starts.append(start)
+        start = next_bucket(start, granularity)
+    return starts
+
+
+def _bucket_key(scope, cenro_ids, granularity, start):
+    # The CENRO set is part of the key, so a CENRO added to a PENRO starts fresh buckets
+    offices = hashlib.md5(','.join(str(i) for i in sorted(cenro_ids)).encode()).hexdigest()[:12]
+    return f"report_stats:{scope}:{offices}:{granularity}:{start.isoformat()}"
+
+
+def _empty_bucket(start):
+    return {'start': start.isoformat(), 'total': 0, 'by_type': {}, 'by_status': {}, 'by_pa': []}
+
+
+def _load_buckets(cenro_ids, granularity, starts):
+    """Count reports for the given buckets in one GROUP BY pass; returns {start: bucket}."""
+    first, last = min(starts), max(starts)
+    buckets = {start: _empty_bucket(start) for start in starts}
+    pas = {start: {} for start in starts}
+
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            SELECT r.bucket,
+                   GROUPING(r.establishment_type, r.establishment_status, r.pa_id) AS grouping_id,
+                   r.establishment_type,
+                   r.establishment_status,
+                   r.pa_id,
+                   MAX(r.pa_name) AS pa_name,
+                   COUNT(*) AS report_count
+            FROM (
+                SELECT date_trunc(%s, er.report_date)::date AS bucket,
+                       COALESCE(NULLIF(TRIM(ep.establishment_type), ''), 'Unspecified') AS establishment_type,
+                       COALESCE(NULLIF(TRIM(ep.establishment_status), ''), 'Unspecified') AS establishment_status,
+                       er.pa_id,
+                       er.pa_name
+                FROM enumerators_report er
+                JOIN users u ON er.enumerator_id = u.id
+                LEFT JOIN establishment_profile ep ON er.establishment_id = ep.id
+                WHERE u.cenro_id = ANY(%s)
+                  AND er.report_date >= %s AND er.report_date < %s
+            ) r
+            GROUP BY GROUPING SETS (
+                (r.bucket),
+                (r.bucket, r.establishment_type),
+                (r.bucket, r.establishment_status),
+                (r.bucket, r.pa_id)
+            );
+            """,
+            [granularity, list(cenro_ids), first, next_bucket(last, granularity)],
+        )
+        # GROUPING() bits: 4 = type rolled up, 2 = status rolled up, 1 = pa rolled up
+        for start, grouping_id, establishment_type, establishment_status, pa_id, pa_name, count in cur.fetchall():
+            bucket = buckets.get(start)
+            if bucket is None:
+                continue
+            if grouping_id == 7:
+                bucket['total'] = count
+            elif grouping_id == 3:
+                bucket['by_type'][establishment_type] = count
+            elif grouping_id == 5:
+                bucket['by_status'][establishment_status] = count
+            elif grouping_id == 6:
+                pas[start][pa_id] = {'pa_id': pa_id, 'pa_name': pa_name, 'count': count}
+
+    for start, bucket in buckets.items():
+        bucket['by_pa'] = sorted(pas[start].values(), key=lambda pa: -pa['count'])
+    return buckets
+
+
+def get_report_stats(scope, cenro_ids, granularity, from_date, to_date, today):
+    """
+    Report counts per bucket between from_date and to_date for the reports of
+    the given CENROs, each broken down by establishment type, establishment
+    status and protected area.
+
+    `scope` names the office the CENROs stand for (e.g. 'penro:3') and, with
+    the CENRO ids, keys the cache. Buckets that have ended are cached for
+    REPORT_STATS_CLOSED_TTL seconds; the bucket containing today is refreshed
+    every REPORT_STATS_CURRENT_TTL seconds. Raises ValueError when the range
+    spans more than REPORT_STATS_MAX_BUCKETS buckets.
+    """
+    starts = bucket_starts(from_date, to_date, granularity)
+    if not starts or not cenro_ids:
+        return [_empty_bucket(start) for start in starts]
+
+    keys = {start: _bucket_key(scope, cenro_ids, granularity, start) for start in starts}
+    cached = cache.get_many(keys.values())
+    buckets = {start: cached[key] for start, key in keys.items() if key in cached}
+
+    missing = [start for start in starts if start not in buckets]
+    if missing:
+        try:
+            loaded = _load_buckets(cenro_ids, granularity, missing)
+        except DatabaseError as e:
+            logger.error(f"Error loading report statistics: {e}")
+            loaded = {start: _empty_bucket(start) for start in missing}
+        else:
+            current = bucket_start(today, granularity)
+            closed = {keys[start]: bucket for start, bucket in loaded.items() if start < current}
+            if closed:
+                cache.set_many(closed, settings.REPORT_STATS_CLOSED_TTL)
+            for start, bucket in loaded.items():
+                if start >= current:
+                    cache.set(keys[start], bucket, settings.REPORT_STATS_CURRENT_TTL)
+        buckets.update(loaded)
+
+    return [buckets[start] for start in starts]
@@ -0,0 +1,39 @@
+# db_pool.py
+"""
+Connection pool metrics for sizing workers against the database.
+
+Reads the psycopg_pool statistics of Django's pooled PostgreSQL connection
+(DATABASES['default']['OPTIONS']['pool']) for this process.
+"""
+from django.db import connections
+
+
+def pool_stats(alias='default'):
+    """
+    Counters and gauges of a database alias's connection pool, or None when it is not pooled.
+
+    Besides psycopg_pool's own counters (requests_num, requests_waiting,
+    requests_wait_ms, requests_errors, connections_num, ...), the result has:
+      - max_size: the most connections the pool may open
+      - in_use: connections currently lent out
+      - saturation: in_use / max_size (1.0 means requests start waiting)
+      - avg_wait_ms: mean time a request waited for a connection
+    """
+    pool = getattr(connections[alias], 'pool', None)
+    if pool is None:
+        return None
+
+    stats = pool.get_stats()
+    size = stats.get('pool_size', 0)
+    available = stats.get('pool_available', 0)
+    in_use = max(0, size - available)
+    requests = stats.get('requests_num', 0)
+
+    stats.update({
+        'min_size': pool.min_size,
+        'max_size': pool.max_size,
+        'in_use': in_use,
+        'saturation': in_use / pool.max_size if pool.max_size else 0.0,
+        'avg_wait_ms': stats.get('requests_wait_ms', 0) / requests if requests else 0.0,
+    })
+    return stats
@@ -2,28 +2,54 @@
 from django.shortcuts import redirect
 from django.contrib import messages
 from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from .principal import get_principal
+
+
+def _wrap(view_func, check):
+    """
+    Wrap a sync or async view with an access check that returns a redirect
+    (deny) or None (allow). For async views the check runs in a thread, since
+    resolving the principal may hit the session store.
+    """
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _async_wrapped_view(request, *args, **kwargs):
+            denied = await sync_to_async(check)(request)
+            if denied:
+                return denied
+            return await view_func(request, *args, **kwargs)
+        return _async_wrapped_view
 
-def login_required(view_func):
-    """Decorator to ensure user is logged in"""
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
-        if not request.session.get("user_id"):
-            messages.error(request, "Please log in to access this page.")
-            return redirect("login")
+        denied = check(request)
+        if denied:
+            return denied
         return view_func(request, *args, **kwargs)
     return _wrapped_view
 
+
+def login_required(view_func):
+    """Decorator to ensure user is logged in"""
+    def check(request):
+        if not get_principal(request).is_authenticated:
+            messages.error(request, "Please log in to access this page.")
+            return redirect("login")
+        return None
+    return _wrap(view_func, check)
+
 def role_required(allowed_roles):
     """Decorator to ensure user has one of the specified roles"""
     def decorator(view_func):
-        @wraps(view_func)
-        def _wrapped_view(request, *args, **kwargs):
-            if not request.session.get("user_id"):
+        def check(request):
+            principal = get_principal(request)
+            if not principal.is_authenticated:
                 messages.error(request, "Please log in to access this page.")
                 return redirect("login")
             
-            user_role = request.session.get("role", "").lower()
-            if user_role not in [role.lower() for role in allowed_roles]:
+            user_role = principal.role
+            if not principal.has_role(allowed_roles):
                 messages.error(request, "You don't have permission to access this page.")
                 # Redirect to appropriate dashboard based on user's role
                 role_redirects = {
@@ -34,19 +60,19 @@ def role_required(allowed_roles):
                 }
                 return redirect(role_redirects.get(user_role, "login"))
             
-            return view_func(request, *args, **kwargs)
-        return _wrapped_view
+            return None
+        return _wrap(view_func, check)
     return decorator
 
 def can_create_users(view_func):
     """Decorator to ensure user can create other users"""
-    @wraps(view_func)
-    def _wrapped_view(request, *args, **kwargs):
-        if not request.session.get("user_id"):
+    def check(request):
+        principal = get_principal(request)
+        if not principal.is_authenticated:
             messages.error(request, "Please log in to access this page.")
             return redirect("login")
         
-        user_role = request.session.get("role", "").lower()
+        user_role = principal.role
         # Only these roles can create users
         can_create_roles = ["super admin", "admin", "penro", "cenro"]
         
@@ -62,5 +88,5 @@ def can_create_users(view_func):
             }
             return redirect(role_redirects.get(user_role, "login"))
         
-        return view_func(request, *args, **kwargs)
-    return _wrapped_view
\ No newline at end of file
+        return None
+    return _wrap(view_func, check)
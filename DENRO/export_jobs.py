@@ -0,0 +1,245 @@
+# export_jobs.py
+"""
+Background report exports.
+
+A job is identified by a hash of its owner and filter set, so enqueueing the
+same export twice returns the same job. Jobs run on a small bounded thread
+pool; their status and the finished artifact live side by side in
+settings.EXPORT_ARTIFACT_DIR, which lets any worker process answer status and
+download requests for a job, and lets identical exports reuse a fresh artifact
+instead of rendering again.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+from .operation import (
+    EXPORT_FORMATS,
+    count_enumerator_reports,
+    iter_enumerator_reports,
+    normalize_export_format,
+    write_export,
+)
+
+logger = logging.getLogger(__name__)
+
+# A running job whose status file has not been touched for this long is treated as dead
+EXPORT_JOB_STALE_AFTER = 300
+# Rows rendered between status file updates
+EXPORT_PROGRESS_EVERY = 500
+
+_executor = None
+_executor_lock = threading.Lock()
+_inflight = set()
+_inflight_lock = threading.Lock()
+
+
+def _artifact_dir():
+    path = settings.EXPORT_ARTIFACT_DIR
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.EXPORT_JOB_WORKERS,
+                thread_name_prefix='denro-export',
+            )
+        return _executor
+
+
+def export_job_key(cenro_id, format_type, filters):
+    """Stable job id for an export: the same owner, format and filters always give the same id."""
+    payload = {
+        'cenro_id': cenro_id,
+        'format': normalize_export_format(format_type),
+    }
+    for name, value in filters.items():
+        payload[name] = value.isoformat() if hasattr(value, 'isoformat') else value
+    raw = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def _status_path(job_id):
+    return os.path.join(_artifact_dir(), f"{job_id}.json")
+
+
+def _artifact_path(job_id, format_type):
+    extension = EXPORT_FORMATS[format_type][1].rsplit('.', 1)[1]
+    return os.path.join(_artifact_dir(), f"{job_id}.{extension}")
+
+
+def _write_status(status):
+    status['updated_at'] = time.time()
+    path = _status_path(status['job_id'])
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(status, f)
+    os.replace(tmp_path, path)
+
+
+def _read_status(job_id):
+    try:
+        with open(_status_path(job_id), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_fresh(status):
+    """True when a job finished recently enough for its artifact to be reused."""
+    if status.get('status') != 'done':
+        return False
+    if time.time() - (status.get('finished_at') or 0) > settings.EXPORT_ARTIFACT_TTL:
+        return False
+    return os.path.exists(_artifact_path(status['job_id'], status['format']))
+
+
+def _is_alive(status):
+    """True when a job is queued or running and has reported progress recently."""
+    if status.get('status') not in ('queued', 'running'):
+        return False
+    return time.time() - (status.get('updated_at') or 0) <= EXPORT_JOB_STALE_AFTER
+
+
+def get_export_status(job_id):
+    """Return the public status dict of a job, or None if it is unknown."""
+    status = _read_status(job_id)
+    if not status:
+        return None
+    if status.get('status') == 'done' and not _is_fresh(status):
+        status['status'] = 'expired'
+    elif status.get('status') in ('queued', 'running') and not _is_alive(status):
+        status['status'] = 'failed'
+        status['error'] = status.get('error') or 'Export job stopped responding'
+    return status
+
+
+def get_export_artifact(job_id):
+    """Return (path, content_type, filename) for a finished, still-valid job, else None."""
+    status = _read_status(job_id)
+    if not status or not _is_fresh(status):
+        return None
+    content_type, filename = EXPORT_FORMATS[status['format']]
+    return _artifact_path(job_id, status['format']), content_type, filename
+
+
+def enqueue_export(cenro_id, format_type, filters):
+    """
+    Start (or reuse) a background export of the reports matching `filters`.
+
+    Returns the job status dict. A fresh artifact or a job that is already
+    queued/running for the same key is returned as-is instead of rendering again.
+    """
+    format_type = normalize_export_format(format_type)
+    job_id = export_job_key(cenro_id, format_type, filters)
+
+    with _inflight_lock:
+        existing = _read_status(job_id)
+        if existing and (_is_fresh(existing) or _is_alive(existing)):
+            return existing
+        if job_id in _inflight:
+            return existing
+
+        status = {
+            'job_id': job_id,
+            'cenro_id': cenro_id,
+            'format': format_type,
+            'status': 'queued',
+            'processed': 0,
+            'total': None,
+            'progress': 0.0,
+            'created_at': time.time(),
+            'finished_at': None,
+            'error': None,
+        }
+        _write_status(status)
+        _inflight.add(job_id)
+
+    purge_expired_exports()
+    _get_executor().submit(_run_export, status, dict(filters))
+    return status
+
+
+def _run_export(status, filters):
+    job_id = status['job_id']
+    path = _artifact_path(job_id, status['format'])
+    part_path = f"{path}.part"
+
+    def counted(reports):
+        for report in reports:
+            yield report
+            status['processed'] += 1
+            if status['processed'] % EXPORT_PROGRESS_EVERY == 0:
+                if status['total']:
+                    status['progress'] = min(status['processed'] / status['total'], 0.99)
+                _write_status(status)
+
+    try:
+        status['status'] = 'running'
+        status['total'] = count_enumerator_reports(status['cenro_id'], **filters)
+        _write_status(status)
+
+        with open(part_path, 'wb') as f, metrics.EXPORT_RENDER_SECONDS.time(status['format'], 'job'):
+            write_export(counted(iter_enumerator_reports(status['cenro_id'], **filters)), status['format'], f)
+        os.replace(part_path, path)
+
+        status['status'] = 'done'
+        status['progress'] = 1.0
+        status['finished_at'] = time.time()
+        _write_status(status)
+
+    except Exception as e:
+        logger.exception('Export job %s failed: %s', job_id, e)
+        status['status'] = 'failed'
+        status['error'] = str(e)
+        status['finished_at'] = time.time()
+        _write_status(status)
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+
+    finally:
+        with _inflight_lock:
+            _inflight.discard(job_id)
+        # Worker threads get their own DB connection; don't leak it between jobs
+        connections.close_all()
+
+
+def purge_expired_exports():
+    """Delete artifacts and status files of jobs that can no longer be reused."""
+    try:
+        names = os.listdir(_artifact_dir())
+    except OSError:
+        return
+
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        job_id = name[:-len('.json')]
+        status = _read_status(job_id)
+        if not status or _is_alive(status):
+            continue
+        # Keep finished and failed jobs around for one TTL so their status can still be polled
+        if time.time() - (status.get('updated_at') or 0) <= settings.EXPORT_ARTIFACT_TTL:
+            continue
+        with _inflight_lock:
+            if job_id in _inflight:
+                continue
+            for path in (_artifact_path(job_id, status['format']), _status_path(job_id)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,139 @@
+# geojson_cache.py
+"""
+Two-tier cache for GeoJSON converted from protected-area shapefiles.
+
+Entries are content-addressed by (storage path, object version) and hold the
+already-serialized JSON bytes, so a hit can be returned without touching
+Supabase or fiona. The memory tier is a per-process LRU; the disk tier lives in
+settings.GEOJSON_CACHE_DIR and is shared by every worker process. Both tiers
+are bounded by total size and evict the least recently used entries first.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(value):
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+class GeoJSONCache:
+    def __init__(self, cache_dir, memory_bytes, disk_bytes):
+        self.cache_dir = str(cache_dir)
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+
+    def _disk_path(self, storage_path, version):
+        # Files for one storage path share a prefix so they can all be dropped at once
+        name = f"{_digest(storage_path)[:32]}-{_digest(str(version or ''))[:16]}.geojson"
+        return os.path.join(self.cache_dir, name)
+
+    def get(self, storage_path, version=None):
+        """Return the cached GeoJSON bytes for a storage object version, or None."""
+        path = self._disk_path(storage_path, version)
+
+        with self._lock:
+            data = self._memory.get(path)
+            if data is not None:
+                # Another process may have invalidated the entry on disk
+                if os.path.exists(path):
+                    self._memory.move_to_end(path)
+                    return data
+                self._drop_memory(path)
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # mtime doubles as the disk tier's LRU clock
+        except OSError:
+            return None
+
+        self._remember(path, data)
+        return data
+
+    def set(self, storage_path, version, data):
+        """Store serialized GeoJSON bytes for a storage object version."""
+        path = self._disk_path(storage_path, version)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning('Failed to write GeoJSON cache entry for %s: %s', storage_path, e)
+        else:
+            self._evict_disk()
+
+        self._remember(path, data)
+
+    def invalidate(self, storage_path):
+        """Drop every cached version of a storage object from both tiers."""
+        prefix = os.path.basename(self._disk_path(storage_path, None)).split('-', 1)[0] + '-'
+
+        with self._lock:
+            for path in [p for p in self._memory if os.path.basename(p).startswith(prefix)]:
+                self._drop_memory(path)
+
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if name.startswith(prefix):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def _remember(self, path, data):
+        if len(data) > self.memory_bytes:
+            return
+        with self._lock:
+            if path in self._memory:
+                self._drop_memory(path)
+            self._memory[path] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.memory_bytes:
+                self._drop_memory(next(iter(self._memory)))
+
+    def _drop_memory(self, path):
+        data = self._memory.pop(path, None)
+        if data is not None:
+            self._memory_size -= len(data)
+
+    def _evict_disk(self):
+        try:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file() and entry.name.endswith('.geojson'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+geojson_cache = GeoJSONCache(
+    settings.GEOJSON_CACHE_DIR,
+    settings.GEOJSON_CACHE_MEMORY_BYTES,
+    settings.GEOJSON_CACHE_DISK_BYTES,
+)
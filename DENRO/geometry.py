@@ -0,0 +1,217 @@
+# geometry.py
+"""
+Multi-resolution protected-area geometry for the Leaflet map.
+
+A FeatureCollection is reduced once per zoom level in SIMPLIFY_ZOOM_LEVELS:
+each geometry is simplified with shapely's topology-preserving algorithm at a
+tolerance of about one screen pixel for that zoom, and its coordinates are
+rounded to the precision that pixel can show. The results are cached next to
+the full-resolution GeoJSON, so a map view only filters and serializes.
+"""
+import math
+
+# Zoom levels precomputed per protected area; finer requests get full resolution
+SIMPLIFY_ZOOM_LEVELS = (6, 8, 10, 12, 14)
+# Leaflet tiles are 256px wide and cover 360 degrees at zoom 0
+TILE_SIZE = 256
+TOPOJSON_QUANTIZATION = 100000
+
+
+def zoom_to_tolerance(zoom):
+    """Degrees covered by one screen pixel at a Leaflet zoom level."""
+    return 360.0 / (TILE_SIZE * 2 ** zoom)
+
+
+def resolve_zoom_level(zoom=None, tolerance=None):
+    """
+    Pick the precomputed zoom level for a request.
+
+    Returns the coarsest level that is at least as detailed as asked for, or
+    None when the request needs full resolution (or asks for no simplification).
+    """
+    if zoom is None and tolerance is not None:
+        if tolerance <= 0:
+            return None
+        zoom = math.log2(360.0 / (TILE_SIZE * tolerance))
+    if zoom is None:
+        return None
+    for level in SIMPLIFY_ZOOM_LEVELS:
+        # Allow for float noise when the zoom was derived from a tolerance
+        if level >= zoom - 1e-9:
+            return level
+    return None
+
+
+def parse_bbox(value):
+    """Parse 'minx,miny,maxx,maxy' into a tuple of floats, or None if absent/invalid."""
+    if not value:
+        return None
+    try:
+        minx, miny, maxx, maxy = (float(v) for v in value.split(','))
+    except ValueError:
+        return None
+    if minx > maxx or miny > maxy:
+        return None
+    return minx, miny, maxx, maxy
+
+
+def _round_coords(coords, digits):
+    if isinstance(coords[0], (int, float)):
+        return [round(c, digits) for c in coords]
+    return [_round_coords(c, digits) for c in coords]
+
+
+def _round_geometry(geometry, digits):
+    if geometry['type'] == 'GeometryCollection':
+        return {
+            'type': 'GeometryCollection',
+            'geometries': [_round_geometry(g, digits) for g in geometry['geometries']],
+        }
+    return {'type': geometry['type'], 'coordinates': _round_coords(geometry['coordinates'], digits)}
+
+
+def simplify_feature_collection(feature_collection, zoom):
+    """
+    Return a copy of a FeatureCollection simplified and quantized for a zoom level.
+
+    Every feature gets a GeoJSON 'bbox' member so later bounding-box filtering
+    does not need shapely.
+    """
+    from shapely.geometry import mapping, shape
+
+    tolerance = zoom_to_tolerance(zoom)
+    # Enough decimals to resolve a tenth of a pixel
+    digits = max(0, int(math.ceil(-math.log10(tolerance / 10))))
+
+    features = []
+    for feature in feature_collection.get('features', []):
+        geometry = feature.get('geometry')
+        if not geometry:
+            continue
+        geom = shape(geometry)
+        if geom.is_empty:
+            continue
+        simplified = geom.simplify(tolerance, preserve_topology=True)
+        if simplified.is_empty:
+            continue
+        features.append({
+            'type': 'Feature',
+            'properties': feature.get('properties') or {},
+            'bbox': [round(v, digits) for v in simplified.bounds],
+            'geometry': _round_geometry(mapping(simplified), digits),
+        })
+
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def _feature_bounds(feature):
+    if feature.get('bbox'):
+        return feature['bbox']
+    from shapely.geometry import shape
+    return shape(feature['geometry']).bounds
+
+
+def filter_bbox(feature_collection, bbox):
+    """Keep only the features whose bounds intersect bbox (minx, miny, maxx, maxy)."""
+    minx, miny, maxx, maxy = bbox
+    features = []
+    for feature in feature_collection.get('features', []):
+        if not feature.get('geometry'):
+            continue
+        fminx, fminy, fmaxx, fmaxy = _feature_bounds(feature)[:4]
+        if fmaxx < minx or fminx > maxx or fmaxy < miny or fminy > maxy:
+            continue
+        features.append(feature)
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def _walk_positions(geometry):
+    if geometry['type'] == 'GeometryCollection':
+        for child in geometry['geometries']:
+            yield from _walk_positions(child)
+        return
+
+    def walk(coords):
+        if isinstance(coords[0], (int, float)):
+            yield coords
+        else:
+            for c in coords:
+                yield from walk(c)
+
+    if geometry.get('coordinates'):
+        yield from walk(geometry['coordinates'])
+
+
+def to_topojson(feature_collection, object_name='protected_area', quantization=TOPOJSON_QUANTIZATION):
+    """
+    Encode a FeatureCollection as quantized, delta-encoded TopoJSON.
+
+    Every line and ring becomes its own arc; arcs are not shared between
+    neighbouring features, which keeps encoding linear in the vertex count.
+    """
+    features = [f for f in feature_collection.get('features', []) if f.get('geometry')]
+
+    xs, ys = [], []
+    for feature in features:
+        for position in _walk_positions(feature['geometry']):
+            xs.append(position[0])
+            ys.append(position[1])
+
+    if xs:
+        x0, y0 = min(xs), min(ys)
+        kx = (max(xs) - x0) / (quantization - 1) or 1
+        ky = (max(ys) - y0) / (quantization - 1) or 1
+    else:
+        x0 = y0 = 0
+        kx = ky = 1
+
+    def quantize(position):
+        return [int(round((position[0] - x0) / kx)), int(round((position[1] - y0) / ky))]
+
+    arcs = []
+
+    def add_arc(line):
+        points = []
+        for position in line:
+            q = quantize(position)
+            if not points or q != points[-1]:
+                points.append(q)
+        if len(points) == 1:
+            points.append(points[0])
+        encoded = [points[0]]
+        for prev, cur in zip(points, points[1:]):
+            encoded.append([cur[0] - prev[0], cur[1] - prev[1]])
+        arcs.append(encoded)
+        return len(arcs) - 1
+
+    def encode(geometry):
+        kind = geometry['type']
+        coords = geometry.get('coordinates')
+        if kind == 'GeometryCollection':
+            return {'type': kind, 'geometries': [encode(g) for g in geometry['geometries']]}
+        if kind == 'Point':
+            return {'type': kind, 'coordinates': quantize(coords)}
+        if kind == 'MultiPoint':
+            return {'type': kind, 'coordinates': [quantize(p) for p in coords]}
+        if kind == 'LineString':
+            return {'type': kind, 'arcs': [add_arc(coords)]}
+        if kind == 'MultiLineString':
+            return {'type': kind, 'arcs': [[add_arc(line)] for line in coords]}
+        if kind == 'Polygon':
+            return {'type': kind, 'arcs': [[add_arc(ring)] for ring in coords]}
+        if kind == 'MultiPolygon':
+            return {'type': kind, 'arcs': [[[add_arc(ring)] for ring in polygon] for polygon in coords]}
+        raise ValueError(f'Unsupported geometry type: {kind}')
+
+    geometries = []
+    for feature in features:
+        encoded = encode(feature['geometry'])
+        encoded['properties'] = feature.get('properties') or {}
+        geometries.append(encoded)
+
+    return {
+        'type': 'Topology',
+        'transform': {'scale': [kx, ky], 'translate': [x0, y0]},
+        'objects': {object_name: {'type': 'GeometryCollection', 'geometries': geometries}},
+        'arcs': arcs,
+    }
@@ -0,0 +1,50 @@
+# io_pool.py
+"""
+Bounded thread pool for running blocking I/O (raw SQL, storage calls) from
+async views.
+
+Each call runs on a pool thread with its own database connection, so calls
+gathered together run concurrently instead of one after the other. The pool
+size (ASYNC_IO_CONCURRENCY) caps how many such calls are in flight across the
+whole process, whichever event loop they come from.
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.ASYNC_IO_CONCURRENCY, thread_name_prefix='denro-io')
+    return _executor
+
+
+def _call(fn, args, kwargs):
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        # Honour CONN_MAX_AGE for the pool thread's connection, as the request cycle would
+        close_old_connections()
+
+
+async def run_io(fn, *args, **kwargs):
+    """Run a blocking function on the I/O pool and await its result."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_get_executor(), functools.partial(context.run, _call, fn, args, kwargs))
+
+
+async def gather_io(*calls):
+    """
+    Run several (fn, *args) calls concurrently on the I/O pool.
+
+    Results are returned in call order; the first exception is re-raised.
+    """
+    return await asyncio.gather(*(run_io(fn, *args) for fn, *args in calls))
@@ -0,0 +1,198 @@
+# login_guard.py
+"""
+Login throttling in front of the auth_login() database function.
+
+Failed logins are counted per username and per client IP with a sliding-window
+counter: the current fixed window plus the previous one weighted by how much
+of it still overlaps the sliding window. Once a key reaches its limit it is
+locked out for LOGIN_THROTTLE_BASE_LOCKOUT seconds, doubling with every
+further failure up to LOGIN_THROTTLE_MAX_LOCKOUT. While locked, attempts are
+rejected before any database work is done.
+
+Counters live in process memory by default; set LOGIN_THROTTLE_BACKEND=cache
+to keep them in the Django cache so every worker shares them.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+_stats = {'checked': 0, 'failures': 0, 'rejected_username': 0, 'rejected_ip': 0, 'lockouts': 0}
+_stats_lock = threading.Lock()
+
+
+class MemoryBackend:
+    """Expiring counters in a bounded in-process LRU map."""
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= now:
+            del self._data[key]
+            return None
+        return value
+
+    def _put(self, key, value, ttl, now):
+        self._data[key] = (value, now + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_keys:
+            self._data.popitem(last=False)
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            found = {key: self._get(key, now) for key in keys}
+        return {key: value for key, value in found.items() if value is not None}
+
+    def incr(self, key, ttl):
+        now = time.monotonic()
+        with self._lock:
+            value = (self._get(key, now) or 0) + 1
+            self._put(key, value, ttl, now)
+        return value
+
+    def set(self, key, value, ttl):
+        now = time.monotonic()
+        with self._lock:
+            self._put(key, value, ttl, now)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+
+class CacheBackend:
+    """Counters in the Django cache, shared by every worker that uses the same cache."""
+
+    def get_many(self, keys):
+        return cache.get_many(keys)
+
+    def incr(self, key, ttl):
+        if cache.add(key, 1, ttl):
+            return 1
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr()
+            cache.set(key, 1, ttl)
+            return 1
+
+    def set(self, key, value, ttl):
+        cache.set(key, value, ttl)
+
+    def delete_many(self, keys):
+        cache.delete_many(keys)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if settings.LOGIN_THROTTLE_BACKEND == 'cache':
+                    _backend = CacheBackend()
+                else:
+                    _backend = MemoryBackend(settings.LOGIN_THROTTLE_MAX_KEYS)
+    return _backend
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def _identities(username, ip_address):
+    """(kind, key, limit) for every identity an attempt is counted against."""
+    identities = []
+    if username:
+        identities.append(('username', f"user:{username.strip().lower()}", settings.LOGIN_THROTTLE_USERNAME_LIMIT))
+    if ip_address:
+        identities.append(('ip', f"ip:{ip_address}", settings.LOGIN_THROTTLE_IP_LIMIT))
+    return identities
+
+
+def _window_keys(ident, now):
+    bucket = int(now // settings.LOGIN_THROTTLE_WINDOW)
+    return f"login_fail:{ident}:{bucket}", f"login_fail:{ident}:{bucket - 1}"
+
+
+def _lock_key(ident):
+    return f"login_lock:{ident}"
+
+
+def check_login_allowed(username, ip_address):
+    """
+    Decide whether a login attempt may reach the database.
+
+    Returns (True, 0), or (False, seconds_to_wait) while the username or the
+    client IP is locked out.
+    """
+    if not settings.LOGIN_THROTTLE_ENABLED:
+        return True, 0
+    _count('checked')
+    identities = _identities(username, ip_address)
+    now = time.time()
+    locks = _get_backend().get_many([_lock_key(ident) for _, ident, _ in identities])
+    for kind, ident, _ in identities:
+        locked_until = locks.get(_lock_key(ident))
+        if locked_until and locked_until > now:
+            _count(f'rejected_{kind}')
+            return False, int(locked_until - now) + 1
+    return True, 0
+
+
+def record_login_failure(username, ip_address):
+    """Count a failed login and lock out any identity that has reached its limit."""
+    if not settings.LOGIN_THROTTLE_ENABLED:
+        return
+    _count('failures')
+    backend = _get_backend()
+    window = settings.LOGIN_THROTTLE_WINDOW
+    now = time.time()
+    elapsed = (now % window) / window
+
+    for kind, ident, limit in _identities(username, ip_address):
+        current_key, previous_key = _window_keys(ident, now)
+        current = backend.incr(current_key, 2 * window)
+        previous = backend.get_many([previous_key]).get(previous_key, 0)
+        failures = current + previous * (1 - elapsed)
+        if failures < limit:
+            continue
+        # Exponential backoff: every failure past the limit doubles the lockout
+        excess = int(failures - limit)
+        lockout = min(settings.LOGIN_THROTTLE_BASE_LOCKOUT * 2 ** min(excess, 20), settings.LOGIN_THROTTLE_MAX_LOCKOUT)
+        backend.set(_lock_key(ident), now + lockout, int(lockout) + 1)
+        _count('lockouts')
+        logger.warning('Login throttled for %s %s: %.1f failures in window, locked for %ss',
+                       kind, ident.split(':', 1)[1], failures, lockout)
+
+
+def record_login_success(username, ip_address):
+    """Clear the username's failure history after a successful login (the IP keeps its count)."""
+    if not settings.LOGIN_THROTTLE_ENABLED or not username:
+        return
+    _, ident, _ = _identities(username, None)[0]
+    _get_backend().delete_many([*_window_keys(ident, time.time()), _lock_key(ident)])
+
+
+def stats():
+    """Attempts checked, failures, lockouts and rejections per identity kind (this process)."""
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from DENRO.signatures import drain_outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Upload every signature waiting in SIGNATURE_OUTBOX_DIR to storage once "
+        "(e.g. from cron, or before retiring a server with a non-empty outbox)."
+    )
+
+    def handle(self, *args, **options):
+        uploaded, failed = drain_outbox()
+        self.stdout.write(f"Uploaded {uploaded} signature(s), {failed} failed")
+        if failed:
+            raise CommandError(f"{failed} signature upload(s) failed; they stay queued for the next run")
@@ -0,0 +1,362 @@
+import io
+import os
+import random
+import tempfile
+import time
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from DENRO.office_tree import invalidate_office_tree
+from DENRO.storage import storage
+
+# Every generated row is recognizable by this prefix so --purge can remove it again
+BENCH_PREFIX = 'BENCH'
+BENCH_STORAGE_DIR = 'bench/protected-areas'
+
+SCALES = {
+    '10k': {'reports': 10_000, 'regions': 2, 'penros_per_region': 2, 'cenros_per_penro': 3,
+            'enumerators_per_cenro': 4, 'protected_areas': 6, 'shapefile_vertices': 500},
+    '100k': {'reports': 100_000, 'regions': 4, 'penros_per_region': 3, 'cenros_per_penro': 4,
+             'enumerators_per_cenro': 6, 'protected_areas': 12, 'shapefile_vertices': 5_000},
+    '1m': {'reports': 1_000_000, 'regions': 8, 'penros_per_region': 4, 'cenros_per_penro': 5,
+           'enumerators_per_cenro': 10, 'protected_areas': 24, 'shapefile_vertices': 50_000},
+}
+
+ESTABLISHMENT_TYPES = ['Resort', 'Restaurant', 'Residential', 'Commercial', 'Industrial', 'Agricultural', 'Institutional']
+ESTABLISHMENT_STATUSES = ['Operational', 'Non-operational', 'Under construction']
+LOT_STATUSES = ['Titled', 'Untitled', 'Tax declared']
+LAND_CLASSIFICATIONS = ['Alienable and disposable', 'Timberland', 'Forestland']
+PA_ZONES = ['Strict protection zone', 'Multiple use zone', 'Buffer zone']
+FIRST_NAMES = ['Maria', 'Jose', 'Juan', 'Ana', 'Pedro', 'Rosa', 'Carlos', 'Elena', 'Miguel', 'Lourdes']
+LAST_NAMES = ['Santos', 'Reyes', 'Cruz', 'Bautista', 'Garcia', 'Mendoza', 'Torres', 'Flores', 'Ramos', 'Aquino']
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic DENRO data set (offices, users, reports, establishment profiles, "
+        "geo-tagged images, attestations and protected-area shapefiles) for benchmarking."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='10k', help='Preset data set size')
+        parser.add_argument('--reports', type=int, help='Override the number of reports of the preset')
+        parser.add_argument('--images-per-report', type=int, default=2)
+        parser.add_argument('--attested-ratio', type=float, default=0.4, help='Share of reports with an attestation')
+        parser.add_argument('--days', type=int, default=730, help='Reports are spread over this many past days')
+        parser.add_argument('--batch-size', type=int, default=20_000)
+        parser.add_argument('--seed', type=int, default=42, help='Same seed, same data set')
+        parser.add_argument('--password', default='bench-password', help='Password of the generated users')
+        parser.add_argument('--skip-shapefiles', action='store_true', help='Do not upload protected-area shapefiles')
+        parser.add_argument('--purge', action='store_true', help='Remove a previously generated data set and exit')
+
+    def handle(self, *args, **options):
+        if options['purge']:
+            self._purge()
+            return
+
+        with connection.cursor() as cur:
+            cur.execute("SELECT 1 FROM regions WHERE name LIKE %s LIMIT 1;", [f"{BENCH_PREFIX} %"])
+            if cur.fetchone():
+                raise CommandError("A benchmark data set already exists; run with --purge first.")
+
+        scale = dict(SCALES[options['scale']])
+        if options['reports']:
+            scale['reports'] = options['reports']
+        random.seed(options['seed'])
+
+        started = time.perf_counter()
+        offices = self._create_offices(scale)
+        users = self._create_users(offices, scale, options['password'])
+        protected_areas = self._create_protected_areas(scale, options['skip_shapefiles'])
+        self._create_reports(users, protected_areas, scale, options)
+        invalidate_office_tree()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {scale['reports']} reports, {len(users)} enumerators and {len(protected_areas)} "
+            f"protected areas in {time.perf_counter() - started:.1f}s"
+        ))
+
+    # =========================
+    # Offices and users
+    # =========================
+    def _create_offices(self, scale):
+        """Returns a list of (region_id, penro_id, cenro_id) for every generated CENRO."""
+        offices = []
+        with transaction.atomic(), connection.cursor() as cur:
+            for r in range(1, scale['regions'] + 1):
+                cur.execute("INSERT INTO regions (name) VALUES (%s) RETURNING id;", [f"{BENCH_PREFIX} Region {r}"])
+                region_id = cur.fetchone()[0]
+                for p in range(1, scale['penros_per_region'] + 1):
+                    cur.execute("INSERT INTO penros (name, region_id) VALUES (%s, %s) RETURNING id;",
+                                [f"{BENCH_PREFIX} PENRO {r}-{p}", region_id])
+                    penro_id = cur.fetchone()[0]
+                    for c in range(1, scale['cenros_per_penro'] + 1):
+                        cur.execute("INSERT INTO cenros (name, penro_id) VALUES (%s, %s) RETURNING id;",
+                                    [f"{BENCH_PREFIX} CENRO {r}-{p}-{c}", penro_id])
+                        offices.append((region_id, penro_id, cur.fetchone()[0]))
+        self.stdout.write(f"Created {len(offices)} CENROs")
+        return offices
+
+    def _create_user(self, cur, role, username, office, password):
+        first_name, last_name = random.choice(FIRST_NAMES), random.choice(LAST_NAMES)
+        region_id, penro_id, cenro_id = office
+        cur.execute(
+            "SELECT create_user(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);",
+            [first_name, last_name, random.choice(['Male', 'Female']), f"{username}@example.invalid",
+             None, role, username, password, None, region_id, penro_id, cenro_id, True],
+        )
+        return cur.fetchone()[0], f"{first_name} {last_name}"
+
+    def _create_users(self, offices, scale, password):
+        """One CENRO account and several enumerators per CENRO; returns the enumerators as (id, name)."""
+        enumerators = []
+        with transaction.atomic(), connection.cursor() as cur:
+            for office in offices:
+                cenro_id = office[2]
+                self._create_user(cur, 'CENRO', f"bench_cenro_{cenro_id}", office, password)
+                for i in range(1, scale['enumerators_per_cenro'] + 1):
+                    enumerators.append(self._create_user(cur, 'Evaluator', f"bench_enum_{cenro_id}_{i}", office, password))
+        self.stdout.write(f"Created {len(offices)} CENRO accounts and {len(enumerators)} enumerators")
+        return enumerators
+
+    # =========================
+    # Protected areas
+    # =========================
+    def _shapefile_zip(self, name, vertices):
+        """A zipped single-polygon shapefile with roughly `vertices` points."""
+        import math
+        import fiona
+
+        cx, cy = random.uniform(120.0, 125.0), random.uniform(6.0, 18.0)
+        radius = random.uniform(0.05, 0.3)
+        ring = []
+        for i in range(vertices):
+            angle = 2 * math.pi * i / vertices
+            r = radius * (1 + 0.1 * math.sin(7 * angle) + random.uniform(-0.02, 0.02))
+            ring.append((cx + r * math.cos(angle), cy + r * math.sin(angle)))
+        ring.append(ring[0])
+
+        schema = {'geometry': 'Polygon', 'properties': {'name': 'str', 'area_ha': 'float'}}
+        buffer = io.BytesIO()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            shp_path = os.path.join(tmpdir, 'area.shp')
+            with fiona.open(shp_path, 'w', driver='ESRI Shapefile', crs='EPSG:4326', schema=schema) as dst:
+                dst.write({
+                    'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+                    'properties': {'name': name, 'area_ha': round(math.pi * (radius * 111) ** 2 * 100, 2)},
+                })
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for filename in os.listdir(tmpdir):
+                    archive.write(os.path.join(tmpdir, filename), filename)
+        return buffer.getvalue()
+
+    def _create_protected_areas(self, scale, skip_shapefiles):
+        """Returns the generated protected areas as (id, name)."""
+        areas = []
+        for i in range(1, scale['protected_areas'] + 1):
+            name = f"{BENCH_PREFIX} Protected Area {i}"
+            file_path = f"{BENCH_STORAGE_DIR}/area-{i}.zip"
+            if not skip_shapefiles:
+                storage.upload(file_path, self._shapefile_zip(name, scale['shapefile_vertices']),
+                               content_type='application/zip', upsert=True)
+            rows = storage.insert('protected_areas', {'name': name, 'file_type': 'shapefile', 'file_path': file_path})
+            areas.append((rows[0]['id'], name))
+        self.stdout.write(f"Created {len(areas)} protected areas")
+        return areas
+
+    # =========================
+    # Reports
+    # =========================
+    def _create_reports(self, enumerators, protected_areas, scale, options):
+        total = scale['reports']
+        batch_size = options['batch_size']
+        images_per_report = max(1, options['images_per_report'])
+        enumerator_ids = [user_id for user_id, _ in enumerators]
+        enumerator_names = [name for _, name in enumerators]
+        pa_ids = [pa_id for pa_id, _ in protected_areas]
+        pa_names = [name for _, name in protected_areas]
+
+        with connection.cursor() as cur:
+            # Seed Postgres' random() too, so the same seed gives the same data set
+            cur.execute("SELECT setseed(%s);", [(options['seed'] % 1000) / 1000.0])
+
+        for start in range(1, total + 1, batch_size):
+            end = min(start + batch_size - 1, total)
+            count = end - start + 1
+            with transaction.atomic(), connection.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO establishment_profile (
+                        establishment_type, establishment_status, description, lot_status, land_classification,
+                        lot_owner, area_covered, pa_zone, within_easement,
+                        mayor_permit_no, mayor_permit_issued, mayor_permit_exp,
+                        business_permit_no, business_permit_issued, business_permit_exp,
+                        ecc_no, ecc_date_issued
+                    )
+                    SELECT (%s::text[])[1 + floor(random() * cardinality(%s::text[]))::int],
+                           (%s::text[])[1 + floor(random() * cardinality(%s::text[]))::int],
+                           'Synthetic establishment ' || n,
+                           (%s::text[])[1 + floor(random() * cardinality(%s::text[]))::int],
+                           (%s::text[])[1 + floor(random() * cardinality(%s::text[]))::int],
+                           (%s::text[])[1 + floor(random() * cardinality(%s::text[]))::int],
+                           round((random() * 5000)::numeric, 2),
+                           (%s::text[])[1 + floor(random() * cardinality(%s::text[]))::int],
+                           random() < 0.1,
+                           CASE WHEN random() < 0.7 THEN 'MP-' || n END,
+                           CURRENT_DATE - (random() * 700)::int,
+                           CURRENT_DATE + (random() * 365)::int,
+                           CASE WHEN random() < 0.6 THEN 'BP-' || n END,
+                           CURRENT_DATE - (random() * 700)::int,
+                           CURRENT_DATE + (random() * 365)::int,
+                           CASE WHEN random() < 0.3 THEN 'ECC-' || n END,
+                           CURRENT_DATE - (random() * 1500)::int
+                    FROM generate_series(%s, %s) AS n
+                    ORDER BY n
+                    RETURNING id;
+                    """,
+                    [ESTABLISHMENT_TYPES, ESTABLISHMENT_TYPES, ESTABLISHMENT_STATUSES, ESTABLISHMENT_STATUSES,
+                     LOT_STATUSES, LOT_STATUSES, LAND_CLASSIFICATIONS, LAND_CLASSIFICATIONS,
+                     LAST_NAMES, LAST_NAMES, PA_ZONES, PA_ZONES, start, end],
+                )
+                profile_ids = sorted(row[0] for row in cur.fetchall())
+
+                cur.execute(
+                    """
+                    INSERT INTO geo_tagged_images (image, qr_code, latitude, longitude, location, captured_at)
+                    SELECT %s || '/img-' || n || '.jpg',
+                           %s || '-' || n,
+                           round((6 + random() * 12)::numeric, 7),
+                           round((120 + random() * 5)::numeric, 7),
+                           'Synthetic site ' || n,
+                           now() - random() * (%s * interval '1 day')
+                    FROM generate_series(%s, %s) AS n
+                    ORDER BY n
+                    RETURNING id;
+                    """,
+                    ['bench/images', BENCH_PREFIX, options['days'],
+                     (start - 1) * images_per_report + 1, end * images_per_report],
+                )
+                image_ids = sorted(row[0] for row in cur.fetchall())
+
+                attested = int(count * options['attested_ratio'])
+                attestation_ids = []
+                if attested:
+                    cur.execute(
+                        """
+                        INSERT INTO attestation_notations (attested_by_name, attested_by_position,
+                                                           noted_by_name, noted_by_position)
+                        SELECT 'Attesting Officer ' || (n %% 50), 'CENR Officer',
+                               CASE WHEN random() < 0.5 THEN 'Noting Officer ' || (n %% 20) END,
+                               CASE WHEN random() < 0.5 THEN 'PENR Officer' END
+                        FROM generate_series(1, %s) AS n
+                        RETURNING id;
+                        """,
+                        [attested],
+                    )
+                    attestation_ids = sorted(row[0] for row in cur.fetchall())
+                attestation_ids += [None] * (count - attested)
+                random.shuffle(attestation_ids)
+
+                cur.execute(
+                    """
+                    INSERT INTO enumerators_report (
+                        establishment_id, establishment_name, proponent_name, pa_id, pa_name,
+                        enumerator_id, enumerator_name, geo_tagged_image_id, attestation_id,
+                        report_date, informant_name, remarks, created_at
+                    )
+                    SELECT t.ep_id,
+                           'Establishment ' || (%s + t.n - 1),
+                           (%s::text[])[1 + floor(random() * cardinality(%s::text[]))::int] || ' '
+                               || (%s::text[])[1 + floor(random() * cardinality(%s::text[]))::int],
+                           (%s::bigint[])[e.pa],
+                           (%s::text[])[e.pa],
+                           (%s::bigint[])[e.enum],
+                           (%s::text[])[e.enum],
+                           t.gti_id,
+                           t.an_id,
+                           e.report_date,
+                           'Informant ' || (%s + t.n - 1),
+                           CASE WHEN random() < 0.2 THEN 'Synthetic remarks' END,
+                           e.report_date + random() * interval '10 hours'
+                    FROM unnest(%s::bigint[], %s::bigint[], %s::bigint[]) WITH ORDINALITY AS t(ep_id, gti_id, an_id, n)
+                    -- Referencing t.n keeps the random picks per row instead of evaluated once
+                    CROSS JOIN LATERAL (
+                        SELECT t.n,
+                               1 + floor(random() * cardinality(%s::bigint[]))::int AS pa,
+                               1 + floor(random() * cardinality(%s::bigint[]))::int AS enum,
+                               CURRENT_DATE - (random() * %s)::int AS report_date
+                    ) AS e
+                    ORDER BY t.n
+                    RETURNING id;
+                    """,
+                    [start, FIRST_NAMES, FIRST_NAMES, LAST_NAMES, LAST_NAMES, pa_ids, pa_names,
+                     enumerator_ids, enumerator_names, start,
+                     profile_ids, image_ids[::images_per_report], attestation_ids,
+                     pa_ids, enumerator_ids, options['days']],
+                )
+                report_ids = sorted(row[0] for row in cur.fetchall())
+
+                cur.execute(
+                    """
+                    INSERT INTO reported_images (report_id, image_id, report_type, is_primary, image_sequence)
+                    SELECT (%s::bigint[])[1 + (i.n - 1) / %s], i.image_id, 'enumerator',
+                           (i.n - 1) %% %s = 0, 1 + (i.n - 1) %% %s
+                    FROM unnest(%s::bigint[]) WITH ORDINALITY AS i(image_id, n);
+                    """,
+                    [report_ids, images_per_report, images_per_report, images_per_report, image_ids],
+                )
+
+            self.stdout.write(f"  reports {start}-{end} of {total}")
+
+        with connection.cursor() as cur:
+            cur.execute("ANALYZE enumerators_report, establishment_profile, geo_tagged_images, "
+                        "attestation_notations, reported_images, users;")
+
+    # =========================
+    # Purge
+    # =========================
+    def _purge(self):
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute("SELECT id FROM users WHERE username LIKE %s;", ['bench\\_%'])
+            user_ids = [row[0] for row in cur.fetchall()]
+            cur.execute(
+                """
+                WITH reports AS (
+                    DELETE FROM enumerators_report WHERE enumerator_id = ANY(%s)
+                    RETURNING id, establishment_id, attestation_id
+                ),
+                links AS (
+                    DELETE FROM reported_images ri USING reports r
+                    WHERE ri.report_id = r.id AND ri.report_type = 'enumerator'
+                    RETURNING ri.image_id
+                ),
+                profiles AS (
+                    DELETE FROM establishment_profile WHERE id IN (SELECT establishment_id FROM reports)
+                ),
+                attestations AS (
+                    DELETE FROM attestation_notations WHERE id IN (SELECT attestation_id FROM reports)
+                )
+                SELECT count(*) FROM reports;
+                """,
+                [user_ids],
+            )
+            report_count = cur.fetchone()[0]
+            cur.execute("DELETE FROM geo_tagged_images WHERE qr_code LIKE %s;", [f"{BENCH_PREFIX}-%"])
+            cur.execute("DELETE FROM activity_logs WHERE user_id = ANY(%s);", [user_ids])
+            cur.execute("DELETE FROM users WHERE id = ANY(%s);", [user_ids])
+            cur.execute("DELETE FROM cenros WHERE name LIKE %s;", [f"{BENCH_PREFIX} %"])
+            cur.execute("DELETE FROM penros WHERE name LIKE %s;", [f"{BENCH_PREFIX} %"])
+            cur.execute("DELETE FROM regions WHERE name LIKE %s;", [f"{BENCH_PREFIX} %"])
+
+        areas = [row for row in storage.select('protected_areas', 'id, name, file_path')
+                 if (row.get('name') or '').startswith(f"{BENCH_PREFIX} ")]
+        if areas:
+            storage.remove([row['file_path'] for row in areas if row.get('file_path')])
+            storage.delete('protected_areas', {'id': [row['id'] for row in areas]})
+        invalidate_office_tree()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {report_count} reports, {len(user_ids)} users and {len(areas)} protected areas"
+        ))
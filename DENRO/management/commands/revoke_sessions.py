@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from DENRO.principal import revoke_user_sessions
+
+
+class Command(BaseCommand):
+    help = "Log users out of every session immediately (e.g. after deactivating their accounts)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='+', type=int, help='IDs of the users to log out')
+
+    def handle(self, *args, **options):
+        for user_id in options['user_ids']:
+            if revoke_user_sessions(user_id):
+                self.stdout.write(f"Revoked sessions of user {user_id}")
+            else:
+                self.stderr.write(f"No user with id {user_id}")
@@ -0,0 +1,243 @@
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from DENRO.management.commands.generate_bench_data import BENCH_PREFIX
+from DENRO.operation import (
+    EXPORT_FORMATS,
+    export_reports,
+    get_enumerator_reports,
+    get_enumerator_reports_page,
+    get_report_details,
+    load_shapefile_geojson,
+    search_enumerator_reports,
+)
+from DENRO.storage import storage
+
+CASES = ('reports', 'reports_page', 'report_details', 'search', 'export', 'geojson')
+
+
+def _summary(samples):
+    ordered = sorted(samples)
+    return {
+        'runs': len(ordered),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'median_ms': round(statistics.median(ordered) * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Time report listing, report details, exports in every format and shapefile-to-GeoJSON "
+        "conversion against the data set from generate_bench_data, and save the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cases', nargs='+', choices=CASES, default=list(CASES))
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case')
+        parser.add_argument('--warmup', type=int, default=1, help='Untimed runs per case')
+        parser.add_argument('--cenro', type=int, help='CENRO to benchmark (default: the benchmark CENRO with most reports)')
+        parser.add_argument('--export-rows', type=int, default=2000, help='Reports rendered per export run')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Result file (default: benchmarks/results-<timestamp>.json)')
+        parser.add_argument('--baseline', help='Earlier result file to compare against')
+        parser.add_argument('--threshold', type=float, default=1.2,
+                            help='Median slowdown versus the baseline that counts as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        self.repeat = max(1, options['repeat'])
+        self.warmup = max(0, options['warmup'])
+
+        cenro_id, cenro_reports = self._pick_cenro(options['cenro'])
+        self.stdout.write(f"Benchmarking CENRO {cenro_id} ({cenro_reports} reports)")
+
+        results = {}
+        for case in options['cases']:
+            results.update(getattr(self, f'_bench_{case}')(cenro_id, options))
+
+        payload = {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'git_commit': _git_commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'storage_backend': settings.STORAGE_BACKEND,
+                'dataset': self._dataset_size(),
+                'cenro_id': cenro_id,
+                'cenro_reports': cenro_reports,
+                'repeat': self.repeat,
+                'warmup': self.warmup,
+                'export_rows': options['export_rows'],
+            },
+            'results': results,
+        }
+
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', f"results-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+        if options['baseline']:
+            regressions = self._compare(results, options['baseline'], options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{len(regressions)} case(s) regressed: {', '.join(regressions)}")
+
+    # =========================
+    # Helpers
+    # =========================
+    def _pick_cenro(self, cenro_id):
+        with connection.cursor() as cur:
+            query = """
+                SELECT u.cenro_id, COUNT(*)
+                FROM enumerators_report er
+                JOIN users u ON er.enumerator_id = u.id
+                JOIN cenros c ON c.id = u.cenro_id
+                WHERE {where}
+                GROUP BY u.cenro_id
+                ORDER BY COUNT(*) DESC
+                LIMIT 1;
+            """
+            if cenro_id:
+                cur.execute(query.format(where="u.cenro_id = %s"), [cenro_id])
+            else:
+                cur.execute(query.format(where="c.name LIKE %s"), [f"{BENCH_PREFIX} %"])
+            row = cur.fetchone()
+        if not row:
+            raise CommandError("No reports to benchmark; run generate_bench_data first.")
+        return row
+
+    def _dataset_size(self):
+        with connection.cursor() as cur:
+            cur.execute("""
+                SELECT (SELECT COUNT(*) FROM enumerators_report),
+                       (SELECT COUNT(*) FROM geo_tagged_images),
+                       (SELECT COUNT(*) FROM users);
+            """)
+            reports, images, users = cur.fetchone()
+        return {'reports': reports, 'images': images, 'users': users}
+
+    def _time(self, name, fn, **extra):
+        for _ in range(self.warmup):
+            fn()
+        samples = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+        result = dict(_summary(samples), **extra)
+        self.stdout.write(f"  {name:<40} median {result['median_ms']:>10.1f} ms   p95 {result['p95_ms']:>10.1f} ms")
+        return {name: result}
+
+    # =========================
+    # Cases
+    # =========================
+    def _bench_reports(self, cenro_id, options):
+        rows = len(get_enumerator_reports(cenro_id))
+        results = self._time('get_enumerator_reports', lambda: get_enumerator_reports(cenro_id), rows=rows)
+        results.update(self._time('get_enumerator_reports[all_cenros]', lambda: get_enumerator_reports()))
+        return results
+
+    def _bench_reports_page(self, cenro_id, options):
+        results = self._time('get_enumerator_reports_page[first]', lambda: get_enumerator_reports_page(cenro_id))
+
+        # Walk 20 pages in, then time fetching the page after that
+        cursor = None
+        for _ in range(20):
+            page = get_enumerator_reports_page(cenro_id, cursor=cursor)
+            if not page['has_more']:
+                break
+            cursor = page['next_cursor']
+        results.update(self._time('get_enumerator_reports_page[deep]',
+                                  lambda: get_enumerator_reports_page(cenro_id, cursor=cursor)))
+        return results
+
+    def _bench_report_details(self, cenro_id, options):
+        with connection.cursor() as cur:
+            cur.execute("""
+                SELECT er.id FROM enumerators_report er
+                JOIN users u ON er.enumerator_id = u.id
+                WHERE u.cenro_id = %s
+                ORDER BY er.id;
+            """, [cenro_id])
+            report_ids = [row[0] for row in cur.fetchall()]
+        sample = random.sample(report_ids, min(len(report_ids), 200))
+        picks = iter(sample * (self.warmup + self.repeat))
+        return self._time('get_report_details', lambda: get_report_details(next(picks), cenro_id))
+
+    def _bench_search(self, cenro_id, options):
+        results = self._time('search_enumerator_reports[word]',
+                             lambda: search_enumerator_reports('Establishment 1234', cenro_ids=[cenro_id]))
+        results.update(self._time('search_enumerator_reports[misspelled]',
+                                  lambda: search_enumerator_reports('Bautsita', cenro_ids=[cenro_id])))
+        results.update(self._time('search_enumerator_reports[all_cenros]',
+                                  lambda: search_enumerator_reports('Santos')))
+        return results
+
+    def _bench_export(self, cenro_id, options):
+        reports = get_enumerator_reports(cenro_id)[:options['export_rows']]
+        results = {}
+        for format_type in EXPORT_FORMATS:
+            results.update(self._time(f'export_reports[{format_type}]',
+                                      lambda: export_reports(reports, format_type), rows=len(reports)))
+        return results
+
+    def _bench_geojson(self, cenro_id, options):
+        areas = [row for row in storage.select('protected_areas', 'id, name, file_path')
+                 if (row.get('name') or '').startswith(f"{BENCH_PREFIX} ") and row.get('file_path')]
+        if not areas:
+            self.stdout.write("  no benchmark shapefiles, skipping convert_shapefile_to_geojson")
+            return {}
+        file_path = areas[0]['file_path']
+
+        def convert():
+            # What convert_shapefile_to_geojson does on a cache miss
+            return json.dumps(load_shapefile_geojson(file_path), default=str)
+
+        return self._time('convert_shapefile_to_geojson', convert, file_path=file_path,
+                          geojson_bytes=len(convert()))
+
+    def _compare(self, results, baseline_path, threshold):
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f).get('results', {})
+
+        regressions = []
+        self.stdout.write(f"Compared with {baseline_path}:")
+        for name, result in results.items():
+            before = baseline.get(name)
+            if not before or not before.get('median_ms'):
+                continue
+            ratio = result['median_ms'] / before['median_ms']
+            flag = ''
+            if ratio > threshold:
+                regressions.append(name)
+                flag = '  REGRESSION'
+            self.stdout.write(f"  {name:<40} {before['median_ms']:>10.1f} -> {result['median_ms']:>10.1f} ms "
+                              f"({ratio:.2f}x){flag}")
+        return regressions
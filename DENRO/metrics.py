@@ -0,0 +1,283 @@
+# metrics.py
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Instruments:
+  - per-view request latency, and SQL query count / time per request
+    (MetricsMiddleware, plus an execute wrapper installed on every DB connection);
+  - SQL statement latency;
+  - storage gateway calls: count, latency and bytes per operation;
+  - export render time per format and shapefile-to-GeoJSON conversion time;
+  - values read at scrape time from the storage gateway, DB pool, login
+    throttle and activity-log writer.
+
+Recording is a dict lookup, a bisect and an add under a per-metric lock, so it
+can stay on in production. Values are per process: scrape every worker, or
+run one worker per scrape target.
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+
+# Latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+RENDER_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_registry = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last is +Inf), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((labels, [list(entry[0]), entry[1], entry[2]]) for labels, entry in self._values.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % _format_value(float(bound))
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+def register_collector(fn):
+    """
+    Register a function returning [(name, type, help, [(labels_dict, value), ...])]
+    that is called at scrape time, for values that already live elsewhere.
+    """
+    _collectors.append(fn)
+    return fn
+
+
+def render():
+    """All metrics in the Prometheus text format (version 0.0.4)."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            families = collector()
+        except Exception:
+            continue
+        for name, kind, documentation, samples in families:
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                names = tuple(labels)
+                lines.append(f'{name}{_format_labels(names, [labels[n] for n in names])} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# =========================
+# Instruments
+# =========================
+REQUEST_SECONDS = Histogram('denro_request_seconds', 'Request latency by view.', ('view', 'method', 'status'))
+REQUEST_SQL_QUERIES = Histogram('denro_request_sql_queries', 'SQL statements executed per request.',
+                                ('view',), QUERY_COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram('denro_request_sql_seconds', 'Time spent in SQL per request.', ('view',))
+SQL_SECONDS = Histogram('denro_sql_seconds', 'Latency of individual SQL statements.', (), SQL_BUCKETS)
+STORAGE_SECONDS = Histogram('denro_storage_call_seconds', 'Storage gateway call latency by operation.',
+                            ('operation', 'outcome'))
+STORAGE_BYTES = Counter('denro_storage_bytes_total', 'Bytes moved through the storage gateway.', ('operation',))
+EXPORT_RENDER_SECONDS = Histogram('denro_export_render_seconds', 'Report export render time by format.',
+                                  ('format', 'mode'), RENDER_BUCKETS)
+GEOJSON_CONVERT_SECONDS = Histogram('denro_geojson_convert_seconds',
+                                    'Shapefile to GeoJSON conversion time, download included.', ('source',),
+                                    RENDER_BUCKETS)
+
+
+@register_collector
+def _app_stats():
+    """Counters the storage gateway, DB pool, login throttle and activity log already keep."""
+    from . import activity_log, login_guard
+    from .db_pool import pool_stats
+    from .storage import storage
+
+    families = []
+    storage_stats = storage.stats()
+    families.append(('denro_storage_calls_total', 'counter', 'Storage gateway calls by operation.',
+                     [({'operation': op}, entry['count']) for op, entry in sorted(storage_stats.items())]))
+    families.append(('denro_storage_errors_total', 'counter', 'Failed storage gateway calls by operation.',
+                     [({'operation': op}, entry['errors']) for op, entry in sorted(storage_stats.items())]))
+
+    pool = pool_stats()
+    if pool is not None:
+        families.append(('denro_db_pool_connections', 'gauge', 'Database pool connections by state.', [
+            ({'state': 'in_use'}, pool['in_use']),
+            ({'state': 'available'}, pool.get('pool_available', 0)),
+            ({'state': 'max'}, pool['max_size']),
+        ]))
+        families.append(('denro_db_pool_waiting', 'gauge', 'Requests waiting for a pooled connection.',
+                         [({}, pool.get('requests_waiting', 0))]))
+        families.append(('denro_db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a pooled connection.',
+                         [({}, pool.get('requests_wait_ms', 0) / 1000.0)]))
+
+    families.append(('denro_login_throttle_events_total', 'counter', 'Login throttle decisions by event.',
+                     [({'event': name}, value) for name, value in sorted(login_guard.stats().items())]))
+
+    log_stats = activity_log.stats()
+    families.append(('denro_activity_log_events_total', 'counter', 'Activity log events by outcome.',
+                     [({'outcome': name}, log_stats[name]) for name in ('logged', 'written', 'dropped')]))
+    families.append(('denro_activity_log_buffered', 'gauge', 'Activity log events waiting to be written.',
+                     [({}, log_stats['buffered'])]))
+    return families
+
+
+# [query count, seconds] for the request being served, if any
+_request_sql = contextvars.ContextVar('denro_request_sql', default=None)
+
+
+def _sql_wrapper(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        SQL_SECONDS.observe(elapsed)
+        totals = _request_sql.get()
+        if totals is not None:
+            totals[0] += 1
+            totals[1] += elapsed
+
+
+def _install_sql_wrapper(sender, connection, **kwargs):
+    if _sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_sql_wrapper)
+
+
+connection_created.connect(_install_sql_wrapper, dispatch_uid='denro_metrics_sql_wrapper')
+
+
+class MetricsMiddleware:
+    """Times every request and counts the SQL it runs (including on I/O pool threads)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _observe(self, request, response, start, totals):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match._func_path) if match else 'unmatched'
+        status = f'{response.status_code // 100}xx' if response is not None else '5xx'
+        REQUEST_SECONDS.observe(time.perf_counter() - start, view, request.method, status)
+        REQUEST_SQL_QUERIES.observe(totals[0], view)
+        REQUEST_SQL_SECONDS.observe(totals[1], view)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        totals = [0, 0.0]
+        token = _request_sql.set(totals)
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            _request_sql.reset(token)
+            self._observe(request, response, start, totals)
+
+    async def __acall__(self, request):
+        totals = [0, 0.0]
+        token = _request_sql.set(totals)
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            _request_sql.reset(token)
+            self._observe(request, response, start, totals)
@@ -0,0 +1,155 @@
+# office_tree.py
+"""
+Process-wide cache of the office hierarchy (regions > PENROs > CENROs).
+
+The whole tree is loaded with one query into an immutable OfficeTree, indexed
+by id and by parent, and every office lookup in the app answers from it. A
+snapshot is reloaded when it is older than OFFICE_TREE_TTL seconds or when
+invalidate_office_tree() has bumped the shared version in the Django cache
+(checked at most every OFFICE_TREE_VERSION_CHECK seconds), so an office edit
+made by one process reaches every other process within that interval.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_VERSION_KEY = 'office_tree_version'
+
+_tree = None
+_lock = threading.Lock()
+_version_checked_at = 0.0
+
+
+class OfficeTree:
+    """Immutable snapshot of every region, PENRO and CENRO."""
+
+    def __init__(self, rows, version):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.regions = {}
+        self.penros = {}
+        self.cenros = {}
+        penros_by_region = {}
+        cenros_by_penro = {}
+
+        for kind, office_id, name, parent_id in rows:
+            node = {'id': office_id, 'name': name}
+            if kind == 'region':
+                self.regions[office_id] = node
+            elif kind == 'penro':
+                self.penros[office_id] = dict(node, region_id=parent_id)
+                penros_by_region.setdefault(parent_id, []).append(node)
+            else:
+                self.cenros[office_id] = dict(node, penro_id=parent_id)
+                cenros_by_penro.setdefault(parent_id, []).append(node)
+
+        def by_name(nodes):
+            return tuple(sorted(nodes, key=lambda n: ((n['name'] or '').lower(), n['id'])))
+
+        self.region_options = by_name({'id': r['id'], 'name': r['name']} for r in self.regions.values())
+        self.penros_by_region = {rid: by_name(nodes) for rid, nodes in penros_by_region.items()}
+        self.cenros_by_penro = {pid: by_name(nodes) for pid, nodes in cenros_by_penro.items()}
+
+    # Names
+    def region_name(self, region_id):
+        node = self.regions.get(region_id)
+        return node['name'] if node else None
+
+    def penro_name(self, penro_id):
+        node = self.penros.get(penro_id)
+        return node['name'] if node else None
+
+    def cenro_name(self, cenro_id):
+        node = self.cenros.get(cenro_id)
+        return node['name'] if node else None
+
+    # Parents
+    def penro_region_id(self, penro_id):
+        node = self.penros.get(penro_id)
+        return node['region_id'] if node else None
+
+    def cenro_penro_id(self, cenro_id):
+        node = self.cenros.get(cenro_id)
+        return node['penro_id'] if node else None
+
+    def cenro_region_id(self, cenro_id):
+        return self.penro_region_id(self.cenro_penro_id(cenro_id))
+
+    # Option lists ({"id", "name"} dicts ordered by name)
+    def region_list(self, region_id=None):
+        if region_id is None:
+            return [dict(node) for node in self.region_options]
+        node = self.regions.get(region_id)
+        return [dict(node)] if node else []
+
+    def penro_list(self, region_id=None, penro_id=None):
+        if penro_id is not None:
+            node = self.penros.get(penro_id)
+            return [{'id': node['id'], 'name': node['name']}] if node else []
+        return [dict(node) for node in self.penros_by_region.get(region_id, ())]
+
+    def cenro_list(self, penro_id=None, cenro_id=None):
+        if cenro_id is not None:
+            node = self.cenros.get(cenro_id)
+            return [{'id': node['id'], 'name': node['name']}] if node else []
+        return [dict(node) for node in self.cenros_by_penro.get(penro_id, ())]
+
+
+def _load(version):
+    with connection.cursor() as cur:
+        cur.execute("""
+            SELECT 'region', id, name, NULL FROM regions
+            UNION ALL
+            SELECT 'penro', id, name, region_id FROM penros
+            UNION ALL
+            SELECT 'cenro', id, name, penro_id FROM cenros;
+        """)
+        return OfficeTree(cur.fetchall(), version)
+
+
+def _shared_version():
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        # add() keeps whichever process initialized the version first
+        cache.add(_VERSION_KEY, version, None)
+        version = cache.get(_VERSION_KEY, version)
+    return version
+
+
+def get_office_tree():
+    """The current office tree, reloading it when the TTL has passed or the version has changed."""
+    global _tree, _version_checked_at
+    tree = _tree
+    now = time.monotonic()
+
+    if tree is not None and now - tree.loaded_at < settings.OFFICE_TREE_TTL:
+        if now - _version_checked_at < settings.OFFICE_TREE_VERSION_CHECK:
+            return tree
+        _version_checked_at = now
+        if _shared_version() == tree.version:
+            return tree
+
+    with _lock:
+        # Another thread may have reloaded while we waited
+        if _tree is not None and _tree is not tree:
+            return _tree
+        version = _shared_version()
+        _tree = _load(version)
+        _version_checked_at = time.monotonic()
+        logger.debug('Loaded office tree v%s: %s regions, %s PENROs, %s CENROs',
+                     version, len(_tree.regions), len(_tree.penros), len(_tree.cenros))
+        return _tree
+
+
+def invalidate_office_tree():
+    """Make every process reload the office tree on its next lookup (call after editing offices)."""
+    global _tree
+    cache.set(_VERSION_KEY, time.time_ns(), None)
+    _tree = None
@@ -1,20 +1,29 @@
 # operation.py
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.db import connection, DatabaseError, transaction
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotModified
 from django.shortcuts import redirect, render
 from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from functools import wraps
 import logging
-from supabase import create_client
+from .geojson_cache import geojson_cache
+from . import activity_log, dashboard_stats, login_guard, metrics, report_cache, signatures
+from .office_tree import get_office_tree
+from .principal import get_principal, mark_session_login
+from .storage import storage
 import os
 import io
 import base64
+import csv
+import hashlib
+import json
+import tempfile
 import time
 
 logger = logging.getLogger(__name__)
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")  # ⚠️ service role key, never expose to frontend
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 # =========================
 # LOGIN via Postgres function (UPDATED to match your schema)
 # =========================
@@ -29,6 +38,13 @@ def login_user(request):
         messages.error(request, "Please enter username and password.")
         return redirect("login")
 
+    # Throttled attempts are turned away before auth_login() does any password hashing
+    ip_address = activity_log.client_ip(request)
+    allowed, retry_after = login_guard.check_login_allowed(username, ip_address)
+    if not allowed:
+        messages.error(request, f"Too many failed login attempts. Please try again in {retry_after} seconds.")
+        return redirect("login")
+
     try:
         with connection.cursor() as cur:
             cur.execute(
@@ -50,9 +66,12 @@ def login_user(request):
         return redirect("login")
 
     if not row:
+        login_guard.record_login_failure(username, ip_address)
         messages.error(request, "Username or password is incorrect.")
         return redirect("login")
 
+    login_guard.record_login_success(username, ip_address)
+
     # Unpack and set session (matches updated auth_login RETURNS)
     user_id, uname, role, first_name, last_name, region_id, penro_id, cenro_id = row
     request.session["user_id"]    = user_id
@@ -63,6 +82,8 @@ def login_user(request):
     request.session["region_id"]  = region_id
     request.session["penro_id"]   = penro_id
     request.session["cenro_id"]   = cenro_id
+    mark_session_login(request)
+    activity_log.log_activity(activity_log.LOGIN, user_id=user_id, request=request)
 
     # Route by role (stored as 'Super Admin','Admin','PENRO','CENRO','Evaluator')
     r = request.session["role"]  # e.g. "super admin","admin","penro","cenro","evaluator"
@@ -92,15 +113,7 @@ def logout_user(request):
 # =========================
 def get_current_user_info(request):
     """Returns tuple of (user_role, region_id, penro_id, cenro_id) or (None, None, None, None)"""
-    if not request.session.get("user_id"):
-        return None, None, None, None
-    
-    role = request.session.get("role", "").lower()
-    region_id = request.session.get("region_id")
-    penro_id = request.session.get("penro_id")
-    cenro_id = request.session.get("cenro_id")
-    
-    return role, region_id, penro_id, cenro_id
+    return get_principal(request).office()
 
 # =========================
 # Helper: Get allowed roles for current user
@@ -121,39 +134,31 @@ def get_allowed_roles_for_user(current_role):
 # =========================
 def get_available_offices_for_user(current_role, current_region_id, current_penro_id, current_cenro_id):
     """Returns dict with available regions, penros, and cenros based on current user's permissions"""
+    tree = get_office_tree()
     regions = []
     penros = []
     cenros = []
     
-    with connection.cursor() as cur:
-        if current_role == "super admin":
-            # Super Admin can see all regions
-            cur.execute("SELECT id, name FROM regions ORDER BY name;")
-            regions = [{"id": r[0], "name": r[1]} for r in cur.fetchall()]
+    if current_role == "super admin":
+        # Super Admin can see all regions
+        regions = tree.region_list()
+        
+    elif current_role == "admin":
+        # Admin can only see their assigned region and its PENROs
+        if current_region_id:
+            regions = tree.region_list(current_region_id)
+            penros = tree.penro_list(region_id=current_region_id)
             
-        elif current_role == "admin":
-            # Admin can only see their assigned region and its PENROs
-            if current_region_id:
-                cur.execute("SELECT id, name FROM regions WHERE id = %s;", [current_region_id])
-                regions = [{"id": r[0], "name": r[1]} for r in cur.fetchall()]
-                
-                cur.execute("SELECT id, name FROM penros WHERE region_id = %s ORDER BY name;", [current_region_id])
-                penros = [{"id": r[0], "name": r[1]} for r in cur.fetchall()]
-                
-        elif current_role == "penro":
-            # PENRO can only see their assigned PENRO and its CENROs
-            if current_penro_id:
-                cur.execute("SELECT id, name FROM penros WHERE id = %s;", [current_penro_id])
-                penros = [{"id": r[0], "name": r[1]} for r in cur.fetchall()]
-                
-                cur.execute("SELECT id, name FROM cenros WHERE penro_id = %s ORDER BY name;", [current_penro_id])
-                cenros = [{"id": r[0], "name": r[1]} for r in cur.fetchall()]
-                
-        elif current_role == "cenro":
-            # CENRO can only see their assigned CENRO
-            if current_cenro_id:
-                cur.execute("SELECT id, name FROM cenros WHERE id = %s;", [current_cenro_id])
-                cenros = [{"id": r[0], "name": r[1]} for r in cur.fetchall()]
+    elif current_role == "penro":
+        # PENRO can only see their assigned PENRO and its CENROs
+        if current_penro_id:
+            penros = tree.penro_list(penro_id=current_penro_id)
+            cenros = tree.cenro_list(penro_id=current_penro_id)
+            
+    elif current_role == "cenro":
+        # CENRO can only see their assigned CENRO
+        if current_cenro_id:
+            cenros = tree.cenro_list(cenro_id=current_cenro_id)
     
     return {
         "regions": regions,
@@ -201,11 +206,8 @@ def validate_office_assignment(target_role, region_id, penro_id, cenro_id, curre
             pass  # Super admin can assign to any PENRO
         elif current_role == "admin":
             # Check if this PENRO belongs to admin's region
-            with connection.cursor() as cur:
-                cur.execute("SELECT region_id FROM penros WHERE id = %s;", [p])
-                row = cur.fetchone()
-                if not row or row[0] != current_region_id:
-                    return False, "You can only assign PENRO within your region."
+            if get_office_tree().penro_region_id(p) != current_region_id:
+                return False, "You can only assign PENRO within your region."
         elif current_role == "penro" and current_penro_id == p:
             pass  # PENRO can assign to their own office
         else:
@@ -218,23 +220,12 @@ def validate_office_assignment(target_role, region_id, penro_id, cenro_id, curre
             pass  # Super admin can assign to any CENRO
         elif current_role == "admin":
             # Check if this CENRO belongs to admin's region
-            with connection.cursor() as cur:
-                cur.execute("""
-                    SELECT p.region_id 
-                    FROM cenros c 
-                    JOIN penros p ON c.penro_id = p.id 
-                    WHERE c.id = %s;
-                """, [c])
-                row = cur.fetchone()
-                if not row or row[0] != current_region_id:
-                    return False, "You can only assign CENRO within your region."
+            if get_office_tree().cenro_region_id(c) != current_region_id:
+                return False, "You can only assign CENRO within your region."
         elif current_role == "penro":
             # Check if this CENRO belongs to PENRO's office
-            with connection.cursor() as cur:
-                cur.execute("SELECT penro_id FROM cenros WHERE id = %s;", [c])
-                row = cur.fetchone()
-                if not row or row[0] != current_penro_id:
-                    return False, "You can only assign CENRO within your PENRO."
+            if get_office_tree().cenro_penro_id(c) != current_penro_id:
+                return False, "You can only assign CENRO within your PENRO."
         elif current_role == "cenro" and current_cenro_id == c:
             pass  # CENRO can assign to their own office
         else:
@@ -265,9 +256,7 @@ def validate_office_assignment(target_role, region_id, penro_id, cenro_id, curre
 # Helpers: fetch options (SQL) - Updated for hierarchical access
 # =========================
 def _fetch_regions():
-    with connection.cursor() as cur:
-        cur.execute("SELECT id, name FROM regions ORDER BY name;")
-        return [{"id": r[0], "name": r[1]} for r in cur.fetchall()]
+    return get_office_tree().region_list()
 
 # =========================
 # CREATE ACCOUNT (Updated with hierarchical permissions and auto-assignment)
@@ -369,12 +358,9 @@ def create_account(request):
                     return redirect("account-create")
                     
                 # Verify this PENRO belongs to admin's region
-                with connection.cursor() as cur:
-                    cur.execute("SELECT region_id FROM penros WHERE id = %s;", [p])
-                    row = cur.fetchone()
-                    if not row or row[0] != current_region_id:
-                        messages.error(request, "Selected PENRO does not belong to your region.")
-                        return redirect("account-create")
+                if get_office_tree().penro_region_id(p) != current_region_id:
+                    messages.error(request, "Selected PENRO does not belong to your region.")
+                    return redirect("account-create")
                 
                 # PENRO should inherit admin's region AND have penro assignment
                 r = current_region_id  # Inherit region from admin
@@ -400,24 +386,15 @@ def create_account(request):
                     return redirect("account-create")
                     
                 # Verify this CENRO belongs to penro's office
-                with connection.cursor() as cur:
-                    cur.execute("SELECT penro_id FROM cenros WHERE id = %s;", [c])
-                    row = cur.fetchone()
-                    if not row or row[0] != current_penro_id:
-                        messages.error(request, "Selected CENRO does not belong to your PENRO.")
-                        return redirect("account-create")
+                tree = get_office_tree()
+                if tree.cenro_penro_id(c) != current_penro_id:
+                    messages.error(request, "Selected CENRO does not belong to your PENRO.")
+                    return redirect("account-create")
                 
                 # Get the region_id for this CENRO through PENRO
-                with connection.cursor() as cur:
-                    cur.execute("""
-                        SELECT p.region_id 
-                        FROM cenros c 
-                        JOIN penros p ON c.penro_id = p.id 
-                        WHERE c.id = %s;
-                    """, [c])
-                    row = cur.fetchone()
-                    if row:
-                        r = row[0]  # Inherit region through PENRO
+                cenro_region_id = tree.cenro_region_id(c)
+                if cenro_region_id is not None:
+                    r = cenro_region_id  # Inherit region through PENRO
                 
                 # CENRO should inherit region, penro, AND have cenro assignment
                 p = current_penro_id  # Inherit penro from current user
@@ -460,6 +437,9 @@ def create_account(request):
                     )
                     new_id = cur.fetchone()[0]
 
+            dashboard_stats.invalidate_user_counts()
+            activity_log.log_activity(activity_log.CREATE_ACCOUNT, {'new_user_id': new_id, 'username': username, 'role': role},
+                                      request=request)
             messages.success(request, f"Account successfully created! User can now log in.")
             return redirect("account-create")  # Stay on page to create more users
 
@@ -475,28 +455,10 @@ def create_account(request):
     available_offices = get_available_offices_for_user(current_role, current_region_id, current_penro_id, current_cenro_id)
     
     # Get current user's office names for display
-    current_user_region_name = None
-    current_user_penro_name = None
-    current_user_cenro_name = None
-    
-    with connection.cursor() as cur:
-        if current_region_id:
-            cur.execute("SELECT name FROM regions WHERE id = %s;", [current_region_id])
-            row = cur.fetchone()
-            if row:
-                current_user_region_name = row[0]
-        
-        if current_penro_id:
-            cur.execute("SELECT name FROM penros WHERE id = %s;", [current_penro_id])
-            row = cur.fetchone()
-            if row:
-                current_user_penro_name = row[0]
-        
-        if current_cenro_id:
-            cur.execute("SELECT name FROM cenros WHERE id = %s;", [current_cenro_id])
-            row = cur.fetchone()
-            if row:
-                current_user_cenro_name = row[0]
+    tree = get_office_tree()
+    current_user_region_name = tree.region_name(current_region_id)
+    current_user_penro_name = tree.penro_name(current_penro_id)
+    current_user_cenro_name = tree.cenro_name(current_cenro_id)
     
     context = {
         "regions": available_offices["regions"],
@@ -518,6 +480,64 @@ def create_account(request):
 # =========================
 # AJAX APIs for cascading selects (Updated with permission checks)
 # =========================
+def _office_options_etag(request):
+    """ETag for office options: changes with the office tree version, the caller's scope and the URL."""
+    current_user = get_current_user_info(request)
+    if not current_user[0]:
+        return None
+    raw = f"{get_office_tree().version}:{current_user}:{request.path}"
+    return '"%s"' % hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+def office_options_cache(view_func):
+    """
+    Conditional GET for office option endpoints: answers If-None-Match with 304
+    and lets the browser reuse a response for OFFICE_OPTIONS_MAX_AGE seconds.
+    Error responses are never marked cacheable.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        etag = _office_options_etag(request)
+        if etag and request.method in ("GET", "HEAD") and etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            response = view_func(request, *args, **kwargs)
+        if etag and response.status_code in (200, 304):
+            response["ETag"] = etag
+            patch_cache_control(response, private=True, max_age=settings.OFFICE_OPTIONS_MAX_AGE)
+            patch_vary_headers(response, ["Cookie"])
+        return response
+    return _wrapped_view
+
+@office_options_cache
+def api_office_tree(request):
+    """
+    Every office the caller may pick from, in one compact response:
+    {"regions": [[id, name]], "penros": [[id, name, region_id]], "cenros": [[id, name, penro_id]]}
+    """
+    current_role, current_region_id, current_penro_id, current_cenro_id = get_current_user_info(request)
+    if not current_role:
+        return HttpResponseBadRequest("Not authenticated")
+
+    tree = get_office_tree()
+    if current_role == "super admin":
+        region_ids = [r["id"] for r in tree.region_list()]
+    elif current_role == "admin" and current_region_id:
+        region_ids = [current_region_id] if current_region_id in tree.regions else []
+    else:
+        region_ids = []
+
+    regions = [[r["id"], r["name"]] for rid in region_ids for r in tree.region_list(rid)]
+    penros = [[p["id"], p["name"], rid] for rid in region_ids for p in tree.penro_list(region_id=rid)]
+    if current_role == "penro" and current_penro_id:
+        penros = [[p["id"], p["name"], tree.penro_region_id(p["id"])] for p in tree.penro_list(penro_id=current_penro_id)]
+
+    cenros = [[c["id"], c["name"], p[0]] for p in penros for c in tree.cenro_list(penro_id=p[0])]
+    if current_role == "cenro" and current_cenro_id:
+        cenros = [[c["id"], c["name"], tree.cenro_penro_id(c["id"])] for c in tree.cenro_list(cenro_id=current_cenro_id)]
+
+    return JsonResponse({"regions": regions, "penros": penros, "cenros": cenros})
+
+@office_options_cache
 def api_penros_by_region(request, region_id):
     current_role, current_region_id, current_penro_id, current_cenro_id = get_current_user_info(request)
     if not current_role:
@@ -532,16 +552,14 @@ def api_penros_by_region(request, region_id):
     if current_role == "admin" and current_region_id != rid:
         return HttpResponseBadRequest("Access denied to this region")
     
-    with connection.cursor() as cur:
-        if current_role in ["super admin", "admin"]:
-            cur.execute("SELECT id, name FROM penros WHERE region_id=%s ORDER BY name;", [rid])
-        else:
-            # For other roles, return empty list
-            return JsonResponse({"items": []})
-        
-        items = [{"id": r[0], "name": r[1]} for r in cur.fetchall()]
+    if current_role in ["super admin", "admin"]:
+        items = get_office_tree().penro_list(region_id=rid)
+    else:
+        # For other roles, return empty list
+        items = []
     return JsonResponse({"items": items})
 
+@office_options_cache
 def api_cenros_by_penro(request, penro_id):
     current_role, current_region_id, current_penro_id, current_cenro_id = get_current_user_info(request)
     if not current_role:
@@ -555,26 +573,78 @@ def api_cenros_by_penro(request, penro_id):
     # Check if user has access to this PENRO
     if current_role == "admin":
         # Check if this PENRO belongs to admin's region
-        with connection.cursor() as cur:
-            cur.execute("SELECT region_id FROM penros WHERE id = %s;", [pid])
-            row = cur.fetchone()
-            if not row or row[0] != current_region_id:
-                return HttpResponseBadRequest("Access denied to this PENRO")
+        if get_office_tree().penro_region_id(pid) != current_region_id:
+            return HttpResponseBadRequest("Access denied to this PENRO")
     elif current_role == "penro" and current_penro_id != pid:
         return HttpResponseBadRequest("Access denied to this PENRO")
     
-    with connection.cursor() as cur:
-        if current_role in ["super admin", "admin", "penro"]:
-            cur.execute("SELECT id, name FROM cenros WHERE penro_id=%s ORDER BY name;", [pid])
-        else:
-            # For other roles, return empty list
-            return JsonResponse({"items": []})
-        
-        items = [{"id": r[0], "name": r[1]} for r in cur.fetchall()]
+    if current_role in ["super admin", "admin", "penro"]:
+        items = get_office_tree().cenro_list(penro_id=pid)
+    else:
+        # For other roles, return empty list
+        items = []
     return JsonResponse({"items": items})
 # =========================
 # GET ENUMERATOR REPORTS for CENRO (WITH ALL FILTERS)
 # =========================
+REPORTS_PAGE_SIZE = 50
+REPORTS_MAX_PAGE_SIZE = 200
+
+_REPORT_LIST_SELECT = """
+    SELECT 
+        er.id,
+        er.establishment_name,
+        er.proponent_name,
+        er.pa_name,
+        er.enumerator_name,
+        er.report_date,
+        er.informant_name,
+        er.remarks,
+        er.created_at,
+        u.first_name || ' ' || u.last_name as enumerator_full_name,
+        u.cenro_id,
+        ep.establishment_type,
+        er.pa_id,
+        ep.establishment_status
+    FROM enumerators_report er
+    LEFT JOIN users u ON er.enumerator_id = u.id
+    LEFT JOIN establishment_profile ep ON er.establishment_id = ep.id
+    WHERE 1=1
+"""
+
+
+def _build_report_filters(cenro_id=None, from_date=None, to_date=None, establishment_type=None, pa_id=None, establishment_status=None):
+    """Return (sql, params) with the AND-clauses shared by every report listing query."""
+    sql = ""
+    params = []
+
+    if cenro_id:
+        sql += " AND u.cenro_id = %s"
+        params.append(cenro_id)
+
+    if from_date:
+        sql += " AND er.report_date >= %s"
+        params.append(from_date)
+
+    if to_date:
+        sql += " AND er.report_date <= %s"
+        params.append(to_date)
+
+    if establishment_type:
+        sql += " AND LOWER(TRIM(ep.establishment_type)) = LOWER(TRIM(%s))"
+        params.append(establishment_type)
+
+    if pa_id:
+        sql += " AND er.pa_id = %s"
+        params.append(pa_id)
+
+    if establishment_status:
+        sql += " AND LOWER(TRIM(ep.establishment_status)) = LOWER(TRIM(%s))"
+        params.append(establishment_status)
+
+    return sql, params
+
+
 def get_enumerator_reports(cenro_id=None, from_date=None, to_date=None, establishment_type=None, pa_id=None, establishment_status=None):
     """
     Fetch enumerator reports for a CENRO office with all filters.
@@ -594,54 +664,10 @@ def get_enumerator_reports(cenro_id=None, from_date=None, to_date=None, establis
     
     try:
         with connection.cursor() as cur:
-            query = """
-                SELECT 
-                    er.id,
-                    er.establishment_name,
-                    er.proponent_name,
-                    er.pa_name,
-                    er.enumerator_name,
-                    er.report_date,
-                    er.informant_name,
-                    er.remarks,
-                    er.created_at,
-                    u.first_name || ' ' || u.last_name as enumerator_full_name,
-                    u.cenro_id,
-                    ep.establishment_type,
-                    er.pa_id,
-                    ep.establishment_status
-                FROM enumerators_report er
-                LEFT JOIN users u ON er.enumerator_id = u.id
-                LEFT JOIN establishment_profile ep ON er.establishment_id = ep.id
-                WHERE 1=1
-            """
-            
-            params = []
-            
-            if cenro_id:
-                query += " AND u.cenro_id = %s"
-                params.append(cenro_id)
-            
-            if from_date:
-                query += " AND er.report_date >= %s"
-                params.append(from_date)
-            
-            if to_date:
-                query += " AND er.report_date <= %s"
-                params.append(to_date)
-            
-            if establishment_type:
-                query += " AND LOWER(TRIM(ep.establishment_type)) = LOWER(TRIM(%s))"
-                params.append(establishment_type)
-            
-            if pa_id:
-                query += " AND er.pa_id = %s"
-                params.append(pa_id)
-            
-            if establishment_status:
-                query += " AND LOWER(TRIM(ep.establishment_status)) = LOWER(TRIM(%s))"
-                params.append(establishment_status)
-            
+            filters_sql, params = _build_report_filters(
+                cenro_id, from_date, to_date, establishment_type, pa_id, establishment_status
+            )
+            query = _REPORT_LIST_SELECT + filters_sql
             query += " ORDER BY er.report_date DESC, er.created_at DESC;"
             
             cur.execute(query, params)
@@ -656,6 +682,222 @@ def get_enumerator_reports(cenro_id=None, from_date=None, to_date=None, establis
     return reports
 
 
+def _encode_report_cursor(report):
+    """Encode the (report_date, created_at, id) sort key of a report as an opaque page token."""
+    key = [
+        report['report_date'].isoformat() if report.get('report_date') else None,
+        report['created_at'].isoformat() if report.get('created_at') else None,
+        report['id'],
+    ]
+    raw = json.dumps(key, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_report_cursor(token):
+    """Decode a page token back into its sort key, or None if the token is malformed."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        report_date, created_at, report_id = json.loads(raw.decode('utf-8'))
+        return report_date or '-infinity', created_at or '-infinity', int(report_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def get_enumerator_reports_page(cenro_id=None, from_date=None, to_date=None, establishment_type=None,
+                                pa_id=None, establishment_status=None, cursor=None, page_size=REPORTS_PAGE_SIZE):
+    """
+    Fetch one page of enumerator reports using keyset pagination.
+
+    Reports are ordered by (report_date, created_at, id) descending and the page
+    token only records the sort key of the last row shown, so it stays valid when
+    the filters change and every page costs the same no matter how deep it is.
+    NULL dates sort after every real date.
+
+    Args:
+        Same filters as get_enumerator_reports, plus:
+        cursor: Page token returned as next_cursor by the previous page (None for the first page)
+        page_size: Rows per page, capped at REPORTS_MAX_PAGE_SIZE
+
+    Returns:
+        Dict with keys: reports, next_cursor (None on the last page), has_more, page_size
+    """
+    try:
+        page_size = int(page_size)
+    except (ValueError, TypeError):
+        page_size = REPORTS_PAGE_SIZE
+    page_size = max(1, min(page_size, REPORTS_MAX_PAGE_SIZE))
+
+    reports = []
+    has_more = False
+
+    try:
+        with connection.cursor() as cur:
+            filters_sql, params = _build_report_filters(
+                cenro_id, from_date, to_date, establishment_type, pa_id, establishment_status
+            )
+            query = _REPORT_LIST_SELECT + filters_sql
+
+            key = _decode_report_cursor(cursor)
+            if key:
+                report_date, created_at, last_id = key
+                query += """
+                    AND (COALESCE(er.report_date, '-infinity'), COALESCE(er.created_at, '-infinity'), er.id)
+                        < (%s, %s, %s)
+                """
+                params += [report_date, created_at, last_id]
+
+            query += """
+                ORDER BY COALESCE(er.report_date, '-infinity') DESC,
+                         COALESCE(er.created_at, '-infinity') DESC,
+                         er.id DESC
+                LIMIT %s;
+            """
+            # One extra row tells us whether another page exists without a COUNT(*)
+            params.append(page_size + 1)
+
+            cur.execute(query, params)
+
+            columns = [desc[0] for desc in cur.description]
+            for row in cur.fetchall():
+                reports.append(dict(zip(columns, row)))
+
+    except DatabaseError as e:
+        logger.error(f"Error fetching enumerator reports page: {e}")
+
+    if len(reports) > page_size:
+        has_more = True
+        reports = reports[:page_size]
+
+    return {
+        'reports': reports,
+        'next_cursor': _encode_report_cursor(reports[-1]) if has_more else None,
+        'has_more': has_more,
+        'page_size': page_size,
+    }
+
+
+REPORT_SEARCH_MIN_LENGTH = 2
+REPORT_SEARCH_MAX_LENGTH = 200
+
+# Ranks full-text matches (weighted: establishment A, proponent/informant B, remarks C)
+# above typo-tolerant trigram matches; both predicates are served by GIN indexes
+# (see create_report_search.sql).
+_REPORT_SEARCH_SELECT = """
+    WITH q AS (
+        SELECT websearch_to_tsquery('simple', %s) AS tsq, lower(%s) AS raw
+    )
+    SELECT
+        er.id,
+        er.establishment_name,
+        er.proponent_name,
+        er.pa_name,
+        er.enumerator_name,
+        er.report_date,
+        er.informant_name,
+        er.remarks,
+        er.created_at,
+        u.first_name || ' ' || u.last_name as enumerator_full_name,
+        u.cenro_id,
+        ep.establishment_type,
+        er.pa_id,
+        ep.establishment_status,
+        (2 * ts_rank_cd(er.search_vector, q.tsq, 32) + word_similarity(q.raw, er.search_text))::float8 AS rank
+    FROM q, enumerators_report er
+    LEFT JOIN users u ON er.enumerator_id = u.id
+    LEFT JOIN establishment_profile ep ON er.establishment_id = ep.id
+    WHERE (er.search_vector @@ q.tsq OR q.raw <%% er.search_text)
+"""
+
+
+def _encode_search_cursor(report):
+    raw = json.dumps([report['rank'], report['id']], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_search_cursor(token):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        rank, report_id = json.loads(raw.decode('utf-8'))
+        return float(rank), int(report_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def search_enumerator_reports(query, cenro_ids=None, from_date=None, to_date=None, establishment_type=None,
+                              pa_id=None, establishment_status=None, cursor=None, page_size=REPORTS_PAGE_SIZE):
+    """
+    Search enumerator reports by establishment, proponent, informant and remark text.
+
+    Words are matched with full-text search (web-search syntax: quotes, OR, -word)
+    and misspellings with trigram similarity; results come best match first.
+
+    Args:
+        query: Search text (REPORT_SEARCH_MIN_LENGTH to REPORT_SEARCH_MAX_LENGTH characters)
+        cenro_ids: CENROs whose reports may be returned (None for all)
+        The report listing filters, plus:
+        cursor: Page token returned as next_cursor by the previous page
+        page_size: Rows per page, capped at REPORTS_MAX_PAGE_SIZE
+
+    Returns:
+        Dict with keys: reports (each with a 'rank'), next_cursor, has_more, page_size
+    """
+    try:
+        page_size = int(page_size)
+    except (ValueError, TypeError):
+        page_size = REPORTS_PAGE_SIZE
+    page_size = max(1, min(page_size, REPORTS_MAX_PAGE_SIZE))
+
+    query = ' '.join((query or '').split())[:REPORT_SEARCH_MAX_LENGTH]
+    empty = {'reports': [], 'next_cursor': None, 'has_more': False, 'page_size': page_size}
+    if len(query) < REPORT_SEARCH_MIN_LENGTH or (cenro_ids is not None and not cenro_ids):
+        return empty
+
+    reports = []
+    try:
+        with connection.cursor() as cur:
+            filters_sql, filter_params = _build_report_filters(
+                None, from_date, to_date, establishment_type, pa_id, establishment_status
+            )
+            sql = _REPORT_SEARCH_SELECT + filters_sql
+            params = [query, query] + filter_params
+
+            if cenro_ids is not None:
+                sql += " AND u.cenro_id = ANY(%s)"
+                params.append(list(cenro_ids))
+
+            key = _decode_search_cursor(cursor)
+            if key:
+                sql += """
+                    AND ((2 * ts_rank_cd(er.search_vector, q.tsq, 32) + word_similarity(q.raw, er.search_text))::float8, er.id)
+                        < (%s, %s)
+                """
+                params += list(key)
+
+            sql += " ORDER BY rank DESC, er.id DESC LIMIT %s;"
+            params.append(page_size + 1)
+
+            cur.execute(sql, params)
+            columns = [desc[0] for desc in cur.description]
+            reports = [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    except DatabaseError as e:
+        logger.error(f"Error searching enumerator reports: {e}")
+        return empty
+
+    has_more = len(reports) > page_size
+    reports = reports[:page_size]
+    return {
+        'reports': reports,
+        'next_cursor': _encode_search_cursor(reports[-1]) if has_more else None,
+        'has_more': has_more,
+        'page_size': page_size,
+    }
+
+
 def get_establishment_types_for_cenro(cenro_id):
     """
     Get list of establishment types for a specific CENRO.
@@ -706,8 +948,7 @@ def get_protected_areas_for_cenro(cenro_id):
     
     try:
         # Fetch all PA details from Supabase
-        result = supabase.table('protected_areas').select('id, name').order('name').execute()
-        protected_areas = result.data if result.data else []
+        protected_areas = storage.select('protected_areas', 'id, name', order='name')
                 
     except Exception as e:
         logger.error(f"Error fetching protected areas: {e}")
@@ -715,490 +956,828 @@ def get_protected_areas_for_cenro(cenro_id):
     return protected_areas
 
 
-def get_report_details(report_id, cenro_id=None):
+REPORT_DETAILS_BATCH_MAX = 25
+
+# Select all enumerators_report columns and relevant joined fields. Using er.* makes it easier
+# to return every report column even if NULL, satisfying the requirement to "get all the form".
+_REPORT_DETAILS_COLUMNS = """
+        er.*, 
+        u.first_name || ' ' || u.last_name AS enumerator_full_name,
+        u.cenro_id,
+        ep.establishment_type,
+        ep.establishment_status,
+        ep.description,
+        
+        ep.lot_status,
+        ep.land_classification,
+        ep.title_no,
+        ep.lot_no,
+        ep.lot_owner,
+        ep.area_covered,
+        ep.pa_zone,
+        ep.within_easement,
+        ep.tax_declaration_no,
+        ep.mayor_permit_no,
+        ep.mayor_permit_issued,
+        ep.mayor_permit_exp,
+        ep.business_permit_no,
+        ep.business_permit_issued,
+        ep.business_permit_exp,
+        ep.building_permit_no,
+        ep.building_permit_issued,
+        ep.building_permit_exp,
+        ep.pamb_resolution_no,
+        ep.pamb_date_issued,
+        ep.sapa_no,
+        ep.sapa_date_issued,
+        ep.pacbrma_no,
+        ep.pacbrma_date_issued,
+        ep.ecc_no,
+        ep.ecc_date_issued,
+        ep.discharge_permit_no,
+        ep.discharge_date_issued,
+        ep.pto_no,
+        ep.pto_date_issued,
+        ep.other_emb,
+        gti.image AS geo_image_url,
+        gti.latitude AS geo_latitude,
+        gti.longitude AS geo_longitude,
+        gti.location AS geo_location,
+        gti.captured_at AS geo_captured_at,
+        an.attested_by_name,
+        an.attested_by_position,
+        an.attested_by_signature,
+        an.noted_by_name,
+        an.noted_by_position,
+        an.noted_by_signature
+"""
+
+_REPORT_DETAILS_FROM = """
+    FROM enumerators_report er
+    LEFT JOIN users u ON er.enumerator_id = u.id
+    LEFT JOIN establishment_profile ep ON er.establishment_id = ep.id
+    LEFT JOIN geo_tagged_images gti ON er.geo_tagged_image_id = gti.id
+    LEFT JOIN attestation_notations an ON er.attestation_id = an.id
+"""
+
+# Proponent fallback sources, probed once per process: (columns_sql, joins_sql)
+_proponent_fallback = None
+
+
+def _probe_proponent_fallback():
     """
-    Get detailed information about a specific enumerator report.
+    Proponent name fallback: report value, then leased property profile, then
+    proponents table. Not every deployment has those tables (or the report
+    columns pointing at them), so only join the ones that exist.
+    """
+    global _proponent_fallback
+    if _proponent_fallback is not None:
+        return _proponent_fallback
+
+    terms = ["NULLIF(TRIM(er.proponent_name), '')"]
+    joins = ""
+    try:
+        with connection.cursor() as cur:
+            # Savepoint, so a failed probe doesn't abort an enclosing transaction
+            with transaction.atomic():
+                cur.execute("""
+                    SELECT table_name, column_name
+                    FROM information_schema.columns
+                    WHERE table_schema = ANY(current_schemas(false))
+                      AND table_name IN ('enumerators_report', 'leasedpropertyprofile',
+                                         'DENRO_leasedpropertyprofile', 'proponents')
+                      AND column_name IN ('profile_id', 'profile', 'proponent_id', 'proponent_name', 'id', 'name');
+                """)
+                found = {(table, column) for table, column in cur.fetchall()}
+    except DatabaseError as e:
+        # Try again on the next call rather than caching a guess
+        logger.warning(f"Could not probe proponent fallback tables: {e}")
+        return ",\n        er.proponent_name AS resolved_proponent_name\n", ""
+
+    profile_column = next((c for c in ('profile_id', 'profile') if ('enumerators_report', c) in found), None)
+    profile_table = next((t for t in ('leasedpropertyprofile', 'DENRO_leasedpropertyprofile')
+                          if {(t, 'id'), (t, 'proponent_name')} <= found), None)
+    if profile_column and profile_table:
+        joins += f'\n    LEFT JOIN "{profile_table}" lpp ON er."{profile_column}" = lpp.id'
+        terms.append("NULLIF(TRIM(lpp.proponent_name), '')")
+    if {('enumerators_report', 'proponent_id'), ('proponents', 'id'), ('proponents', 'name')} <= found:
+        joins += "\n    LEFT JOIN proponents pr ON er.proponent_id = pr.id"
+        terms.append("NULLIF(TRIM(pr.name), '')")
+    terms.append("er.proponent_name")
+
+    columns = ",\n        COALESCE(" + ", ".join(terms) + ") AS resolved_proponent_name\n"
+    _proponent_fallback = (columns, joins + "\n")
+    return _proponent_fallback
+
+_REPORT_IMAGE_FIELDS = """
+    'id', gti.id,
+    'image', gti.image,
+    'latitude', gti.latitude,
+    'longitude', gti.longitude,
+    'location', gti.location,
+    'captured_at', gti.captured_at,
+    'qr_code', gti.qr_code,
+    'is_primary', ri.is_primary,
+    'image_sequence', ri.image_sequence
+"""
+
+# Images of the current report as a JSON array, ordered in the database; lets the
+# details query return everything the report modal needs in one round trip.
+_REPORT_IMAGES_SUBQUERY = """
+    (
+        SELECT COALESCE(
+            json_agg(json_build_object(""" + _REPORT_IMAGE_FIELDS + """) ORDER BY ri.image_sequence NULLS LAST, ri.image_id),
+            '[]'::json
+        )
+        FROM reported_images ri
+        JOIN geo_tagged_images gti ON gti.id = ri.image_id
+        WHERE ri.report_id = er.id AND ri.report_type = 'enumerator'
+    ) AS images
+"""
+
+
+# Bucket holding the geo-tagged report photos
+REPORT_IMAGE_BUCKET = os.getenv('SUPABASE_BUCKET', 'images')
+
+
+def _report_image_url(path):
+    """Public URL of a report photo stored under `path` (absolute URLs are returned unchanged)."""
+    if not path or path.startswith(('http://', 'https://')):
+        return path
+    return storage.public_url(path.lstrip('/'), REPORT_IMAGE_BUCKET)
+
+
+def _build_report_details(data):
+    """Shape one row of the report details query into the payload the report modal expects."""
+    data['proponent_name'] = data.get('resolved_proponent_name')
+
+    # Build permits array using keys that may be present from ep.*
+    permits = []
+    if data.get('mayor_permit_no') or data.get('mayor_permit_issued') or data.get('mayor_permit_exp'):
+        permits.append({
+            'name': "Mayor's Permit",
+            'number': data.get('mayor_permit_no'),
+            'issued': data.get('mayor_permit_issued').isoformat() if data.get('mayor_permit_issued') else None,
+            'expiry': data.get('mayor_permit_exp').isoformat() if data.get('mayor_permit_exp') else None
+        })
+
+    if data.get('business_permit_no') or data.get('business_permit_issued') or data.get('business_permit_exp'):
+        permits.append({
+            'name': 'Business Permit',
+            'number': data.get('business_permit_no'),
+            'issued': data.get('business_permit_issued').isoformat() if data.get('business_permit_issued') else None,
+            'expiry': data.get('business_permit_exp').isoformat() if data.get('business_permit_exp') else None
+        })
+
+    if data.get('building_permit_no') or data.get('building_permit_issued') or data.get('building_permit_exp'):
+        permits.append({
+            'name': 'Building Permit',
+            'number': data.get('building_permit_no'),
+            'issued': data.get('building_permit_issued').isoformat() if data.get('building_permit_issued') else None,
+            'expiry': data.get('building_permit_exp').isoformat() if data.get('building_permit_exp') else None
+        })
+
+    if data.get('pamb_resolution_no') or data.get('pamb_date_issued'):
+        permits.append({
+            'name': 'PAMB Resolution',
+            'number': data.get('pamb_resolution_no'),
+            'issued': data.get('pamb_date_issued').isoformat() if data.get('pamb_date_issued') else None,
+            'expiry': None
+        })
+
+    if data.get('sapa_no') or data.get('sapa_date_issued'):
+        permits.append({
+            'name': 'SAPA',
+            'number': data.get('sapa_no'),
+            'issued': data.get('sapa_date_issued').isoformat() if data.get('sapa_date_issued') else None,
+            'expiry': None
+        })
+
+    if data.get('pacbrma_no') or data.get('pacbrma_date_issued'):
+        permits.append({
+            'name': 'PACBRMA',
+            'number': data.get('pacbrma_no'),
+            'issued': data.get('pacbrma_date_issued').isoformat() if data.get('pacbrma_date_issued') else None,
+            'expiry': None
+        })
+
+    if data.get('ecc_no') or data.get('ecc_date_issued'):
+        permits.append({
+            'name': 'Environmental Compliance Certificate (ECC)',
+            'number': data.get('ecc_no'),
+            'issued': data.get('ecc_date_issued').isoformat() if data.get('ecc_date_issued') else None,
+            'expiry': None
+        })
+
+    if data.get('discharge_permit_no') or data.get('discharge_date_issued'):
+        permits.append({
+            'name': 'Discharge Permit',
+            'number': data.get('discharge_permit_no'),
+            'issued': data.get('discharge_date_issued').isoformat() if data.get('discharge_date_issued') else None,
+            'expiry': None
+        })
+
+    if data.get('pto_no') or data.get('pto_date_issued'):
+        permits.append({
+            'name': 'Permit to Operate (PTO)',
+            'number': data.get('pto_no'),
+            'issued': data.get('pto_date_issued').isoformat() if data.get('pto_date_issued') else None,
+            'expiry': None
+        })
+
+    # Helper to build full URL for signatures stored as relative paths
+    def build_signature_url(sig_path):
+        if not sig_path:
+            return None
+        # If already absolute URL, return as-is
+        if sig_path.startswith('http://') or sig_path.startswith('https://') or sig_path.startswith('data:'):
+            return sig_path
+        # Build storage URL (served by the app while the upload is still queued)
+        return signatures.signature_url(sig_path)
+
+    # Prepare response ensuring key names expected by frontend are present
+    report_details = {
+        # fields coming from er.* - ensure presence even if None
+        'id': data.get('id'),
+        'establishment_id': data.get('establishment_id'),
+        'establishment_name': data.get('establishment_name'),
+        'proponent_id': data.get('proponent_id') or data.get('proponent_id'),
+        'proponent_name': data.get('proponent_name'),
+        'pa_id': data.get('pa_id'),
+        'pa_name': data.get('pa_name'),
+        'enumerator_id': data.get('enumerator_id'),
+        'enumerator_name': data.get('enumerator_name') or data.get('enumerator_full_name'),
+        'geo_tagged_image_id': data.get('geo_tagged_image_id'),
+        'report_date': data.get('report_date').isoformat() if data.get('report_date') else None,
+        'enumerator_signature_date': data.get('enumerator_signature_date').isoformat() if data.get('enumerator_signature_date') else None,
+        'informant_signature_date': data.get('informant_signature_date').isoformat() if data.get('informant_signature_date') else None,
+        'enumerator_signature': build_signature_url(data.get('enumerator_signature')),
+        'informant_signature': build_signature_url(data.get('informant_signature')),
+        'informant_name': data.get('informant_name'),
+        'remarks': data.get('remarks'),
+        'created_at': data.get('created_at').isoformat() if data.get('created_at') else None,
+        'updated_at': data.get('updated_at').isoformat() if data.get('updated_at') else None,
+
+        # establishment_profile derived fields
+        'establishment_type': data.get('establishment_type'),
+        'establishment_status': data.get('establishment_status'),
+        'description': data.get('description'),
+        'lot_status': data.get('lot_status'),
+        'land_classification': data.get('land_classification'),
+        'title_no': data.get('title_no'),
+        'lot_no': data.get('lot_no'),
+        'lot_owner': data.get('lot_owner'),
+        'area_covered': data.get('area_covered'),
+        'pa_zone': data.get('pa_zone'),
+        'within_easement': data.get('within_easement'),
+        'tax_declaration_no': data.get('tax_declaration_no'),
+
+        'permits': permits,
+        'other_emb': data.get('other_emb'),
+
+        # geo image fields
+        'geo_image_url': _report_image_url(data.get('geo_image_url')),
+        'latitude': data.get('geo_latitude') or data.get('latitude'),
+        'longitude': data.get('geo_longitude') or data.get('longitude'),
+        'location': data.get('geo_location') or data.get('location'),
+        'geo_captured_at': data.get('geo_captured_at').isoformat() if data.get('geo_captured_at') else None,
+
+        # attestation fields - build full URLs
+        'attestation_id': data.get('attestation_id'),
+        'attested_by_name': data.get('attested_by_name'),
+        'attested_by_position': data.get('attested_by_position'),
+        'attested_by_signature': build_signature_url(data.get('attested_by_signature')),
+        'noted_by_name': data.get('noted_by_name'),
+        'noted_by_position': data.get('noted_by_position'),
+        'noted_by_signature': build_signature_url(data.get('noted_by_signature'))
+    }
+
+    if 'images' in data:
+        report_details['images'] = [dict(image, image_url=_report_image_url(image.get('image')))
+                                    for image in data['images'] or []]
+
+    return report_details
+
+
+def get_report_details_batch(report_ids, cenro_id=None, with_images=False):
+    """
+    Get detailed information about several enumerator reports in one query.
     
     Args:
-        report_id: The report ID
+        report_ids: Iterable of report IDs (at most REPORT_DETAILS_BATCH_MAX are used)
         cenro_id: Optional CENRO ID to verify access
+        with_images: Also return each report's images (as 'images') from the same query
     
     Returns:
-        Dictionary with complete report details or None if not found
+        Dictionary of report ID -> report details; reports that do not exist or
+        are outside the CENRO are left out
     """
+    ids = []
+    for report_id in report_ids:
+        try:
+            report_id = int(report_id)
+        except (ValueError, TypeError):
+            continue
+        if report_id not in ids:
+            ids.append(report_id)
+    ids = ids[:REPORT_DETAILS_BATCH_MAX]
+    if not ids:
+        return {}
+
     try:
         with connection.cursor() as cur:
-            # Select all enumerators_report columns and relevant joined fields. Using er.* makes it easier
-            # to return every report column even if NULL, satisfying the requirement to "get all the form".
-            query = """
-                SELECT
-                    er.*, 
-                    u.first_name || ' ' || u.last_name AS enumerator_full_name,
-                    u.cenro_id,
-                    ep.establishment_type,
-                    ep.establishment_status,
-                    ep.description,
-                    
-                    ep.lot_status,
-                    ep.land_classification,
-                    ep.title_no,
-                    ep.lot_no,
-                    ep.lot_owner,
-                    ep.area_covered,
-                    ep.pa_zone,
-                    ep.within_easement,
-                    ep.tax_declaration_no,
-                    ep.mayor_permit_no,
-                    ep.mayor_permit_issued,
-                    ep.mayor_permit_exp,
-                    ep.business_permit_no,
-                    ep.business_permit_issued,
-                    ep.business_permit_exp,
-                    ep.building_permit_no,
-                    ep.building_permit_issued,
-                    ep.building_permit_exp,
-                    ep.pamb_resolution_no,
-                    ep.pamb_date_issued,
-                    ep.sapa_no,
-                    ep.sapa_date_issued,
-                    ep.pacbrma_no,
-                    ep.pacbrma_date_issued,
-                    ep.ecc_no,
-                    ep.ecc_date_issued,
-                    ep.discharge_permit_no,
-                    ep.discharge_date_issued,
-                    ep.pto_no,
-                    ep.pto_date_issued,
-                    ep.other_emb,
-                    gti.image AS geo_image_url,
-                    gti.latitude AS geo_latitude,
-                    gti.longitude AS geo_longitude,
-                    gti.location AS geo_location,
-                    gti.captured_at AS geo_captured_at,
-                    an.attested_by_name,
-                    an.attested_by_position,
-                    an.attested_by_signature,
-                    an.noted_by_name,
-                    an.noted_by_position,
-                    an.noted_by_signature
-                FROM enumerators_report er
-                LEFT JOIN users u ON er.enumerator_id = u.id
-                LEFT JOIN establishment_profile ep ON er.establishment_id = ep.id
-                LEFT JOIN geo_tagged_images gti ON er.geo_tagged_image_id = gti.id
-                LEFT JOIN attestation_notations an ON er.attestation_id = an.id
-                WHERE er.id = %s
-            """
-
-            params = [report_id]
+            proponent_columns, proponent_joins = _probe_proponent_fallback()
+            columns_sql = _REPORT_DETAILS_COLUMNS.rstrip() + proponent_columns
+            if with_images:
+                columns_sql += "," + _REPORT_IMAGES_SUBQUERY
+            query = ("SELECT" + columns_sql + _REPORT_DETAILS_FROM.rstrip() + proponent_joins
+                     + " WHERE er.id = ANY(%s)")
+            params = [ids]
 
             if cenro_id:
                 query += " AND u.cenro_id = %s"
                 params.append(cenro_id)
 
             cur.execute(query, params)
-            row = cur.fetchone()
-
-            if not row:
-                return None
 
             # Build dictionary using cursor description so every column from er.* is present
             columns = [desc[0] for desc in cur.description]
-            data = dict(zip(columns, row))
-
-            # If proponent_name is missing, try plausible fallbacks in order:
-            # 1) If report links to a leased property profile (profile_id), use its proponent_name
-            # 2) If report has proponent_id, fetch from proponents table
-            if (not data.get('proponent_name') or str(data.get('proponent_name')).strip() == ''):
-                # Try leased property profile (common in this schema)
-                profile_id = data.get('profile_id') or data.get('profile')
-                if profile_id:
-                    try:
-                        cur.execute("SELECT proponent_name FROM leasedpropertyprofile WHERE id = %s;", [profile_id])
-                        p_row = cur.fetchone()
-                        if p_row and p_row[0]:
-                            data['proponent_name'] = p_row[0]
-                    except Exception:
-                        # ignore lookup errors and continue to next fallback
-                        pass
-
-                # Fallback: try proponents table if still missing
-                if (not data.get('proponent_name') or str(data.get('proponent_name')).strip() == '') and data.get('proponent_id'):
-                    try:
-                        cur.execute("SELECT name FROM proponents WHERE id = %s;", [data.get('proponent_id')])
-                        p_row = cur.fetchone()
-                        if p_row and p_row[0]:
-                            data['proponent_name'] = p_row[0]
-                    except Exception:
-                        # ignore lookup errors - leave proponent_name as-is
-                        pass
-
-            # Build permits array using keys that may be present from ep.*
-            permits = []
-            if data.get('mayor_permit_no') or data.get('mayor_permit_issued') or data.get('mayor_permit_exp'):
-                permits.append({
-                    'name': "Mayor's Permit",
-                    'number': data.get('mayor_permit_no'),
-                    'issued': data.get('mayor_permit_issued').isoformat() if data.get('mayor_permit_issued') else None,
-                    'expiry': data.get('mayor_permit_exp').isoformat() if data.get('mayor_permit_exp') else None
-                })
-
-            if data.get('business_permit_no') or data.get('business_permit_issued') or data.get('business_permit_exp'):
-                permits.append({
-                    'name': 'Business Permit',
-                    'number': data.get('business_permit_no'),
-                    'issued': data.get('business_permit_issued').isoformat() if data.get('business_permit_issued') else None,
-                    'expiry': data.get('business_permit_exp').isoformat() if data.get('business_permit_exp') else None
-                })
-
-            if data.get('building_permit_no') or data.get('building_permit_issued') or data.get('building_permit_exp'):
-                permits.append({
-                    'name': 'Building Permit',
-                    'number': data.get('building_permit_no'),
-                    'issued': data.get('building_permit_issued').isoformat() if data.get('building_permit_issued') else None,
-                    'expiry': data.get('building_permit_exp').isoformat() if data.get('building_permit_exp') else None
-                })
+            return {
+                data['id']: _build_report_details(data)
+                for data in (dict(zip(columns, row)) for row in cur.fetchall())
+            }
+                
+    except DatabaseError as e:
+        logger.error(f"Error fetching report details: {e}")
+        return {}
 
-            if data.get('pamb_resolution_no') or data.get('pamb_date_issued'):
-                permits.append({
-                    'name': 'PAMB Resolution',
-                    'number': data.get('pamb_resolution_no'),
-                    'issued': data.get('pamb_date_issued').isoformat() if data.get('pamb_date_issued') else None,
-                    'expiry': None
-                })
 
-            if data.get('sapa_no') or data.get('sapa_date_issued'):
-                permits.append({
-                    'name': 'SAPA',
-                    'number': data.get('sapa_no'),
-                    'issued': data.get('sapa_date_issued').isoformat() if data.get('sapa_date_issued') else None,
-                    'expiry': None
-                })
+def get_report_details(report_id, cenro_id=None):
+    """
+    Get detailed information about a specific enumerator report.
+    
+    Args:
+        report_id: The report ID
+        cenro_id: Optional CENRO ID to verify access
+    
+    Returns:
+        Dictionary with complete report details or None if not found
+    """
+    try:
+        report_id = int(report_id)
+    except (ValueError, TypeError):
+        return None
+    return get_report_details_batch([report_id], cenro_id).get(report_id)
+    
 
-            if data.get('pacbrma_no') or data.get('pacbrma_date_issued'):
-                permits.append({
-                    'name': 'PACBRMA',
-                    'number': data.get('pacbrma_no'),
-                    'issued': data.get('pacbrma_date_issued').isoformat() if data.get('pacbrma_date_issued') else None,
-                    'expiry': None
-                })
+def get_report_images_batch(report_ids):
+    """
+    Fetch images related to several reports with one indexed SQL query.
 
-            if data.get('ecc_no') or data.get('ecc_date_issued'):
-                permits.append({
-                    'name': 'Environmental Compliance Certificate (ECC)',
-                    'number': data.get('ecc_no'),
-                    'issued': data.get('ecc_date_issued').isoformat() if data.get('ecc_date_issued') else None,
-                    'expiry': None
-                })
+    Returns a dict of report ID -> list of image dicts (see get_report_images);
+    every requested ID is present, with an empty list when it has no images.
+    """
+    ids = [int(report_id) for report_id in report_ids if report_id]
+    images_by_report = {report_id: [] for report_id in ids}
+    if not ids:
+        return images_by_report
 
-            if data.get('discharge_permit_no') or data.get('discharge_date_issued'):
-                permits.append({
-                    'name': 'Discharge Permit',
-                    'number': data.get('discharge_permit_no'),
-                    'issued': data.get('discharge_date_issued').isoformat() if data.get('discharge_date_issued') else None,
-                    'expiry': None
+    try:
+        with connection.cursor() as cur:
+            cur.execute(
+                """
+                SELECT ri.report_id,
+                       gti.id, gti.image, gti.latitude, gti.longitude, gti.location,
+                       gti.captured_at, gti.qr_code, ri.is_primary, ri.image_sequence
+                FROM reported_images ri
+                JOIN geo_tagged_images gti ON gti.id = ri.image_id
+                WHERE ri.report_id = ANY(%s) AND ri.report_type = 'enumerator'
+                ORDER BY ri.report_id, ri.image_sequence NULLS LAST, ri.image_id;
+                """,
+                [ids],
+            )
+            for row in cur.fetchall():
+                report_id, image_id, image, latitude, longitude, location, captured_at, qr_code, is_primary, image_sequence = row
+                images_by_report[report_id].append({
+                    'id': image_id,
+                    'image': image,
+                    'latitude': latitude,
+                    'longitude': longitude,
+                    'location': location,
+                    'captured_at': captured_at,
+                    'qr_code': qr_code,
+                    'is_primary': is_primary,
+                    'image_sequence': image_sequence,
                 })
 
-            if data.get('pto_no') or data.get('pto_date_issued'):
-                permits.append({
-                    'name': 'Permit to Operate (PTO)',
-                    'number': data.get('pto_no'),
-                    'issued': data.get('pto_date_issued').isoformat() if data.get('pto_date_issued') else None,
-                    'expiry': None
-                })
+    except DatabaseError as e:
+        logger.exception(f"Error fetching report images for report_ids=%s: %s", ids, e)
 
-            # Helper to build full URL for signatures stored as relative paths
-            def build_signature_url(sig_path):
-                if not sig_path:
-                    return None
-                # If already absolute URL, return as-is
-                if sig_path.startswith('http://') or sig_path.startswith('https://') or sig_path.startswith('data:'):
-                    return sig_path
-                # Build Supabase public URL
-                bucket = os.getenv('SUPABASE_BUCKET', 'geo-tagged-photos')
-                return f"{SUPABASE_URL}/storage/v1/object/public/{bucket}/{sig_path}"
-
-            # Prepare response ensuring key names expected by frontend are present
-            report_details = {
-                # fields coming from er.* - ensure presence even if None
-                'id': data.get('id'),
-                'establishment_id': data.get('establishment_id'),
-                'establishment_name': data.get('establishment_name'),
-                'proponent_id': data.get('proponent_id') or data.get('proponent_id'),
-                'proponent_name': data.get('proponent_name'),
-                'pa_id': data.get('pa_id'),
-                'pa_name': data.get('pa_name'),
-                'enumerator_id': data.get('enumerator_id'),
-                'enumerator_name': data.get('enumerator_name') or data.get('enumerator_full_name'),
-                'geo_tagged_image_id': data.get('geo_tagged_image_id'),
-                'report_date': data.get('report_date').isoformat() if data.get('report_date') else None,
-                'enumerator_signature_date': data.get('enumerator_signature_date').isoformat() if data.get('enumerator_signature_date') else None,
-                'informant_signature_date': data.get('informant_signature_date').isoformat() if data.get('informant_signature_date') else None,
-                'enumerator_signature': build_signature_url(data.get('enumerator_signature')),
-                'informant_signature': build_signature_url(data.get('informant_signature')),
-                'informant_name': data.get('informant_name'),
-                'remarks': data.get('remarks'),
-                'created_at': data.get('created_at').isoformat() if data.get('created_at') else None,
-                'updated_at': data.get('updated_at').isoformat() if data.get('updated_at') else None,
-
-                # establishment_profile derived fields
-                'establishment_type': data.get('establishment_type'),
-                'establishment_status': data.get('establishment_status'),
-                'description': data.get('description'),
-                'lot_status': data.get('lot_status'),
-                'land_classification': data.get('land_classification'),
-                'title_no': data.get('title_no'),
-                'lot_no': data.get('lot_no'),
-                'lot_owner': data.get('lot_owner'),
-                'area_covered': data.get('area_covered'),
-                'pa_zone': data.get('pa_zone'),
-                'within_easement': data.get('within_easement'),
-                'tax_declaration_no': data.get('tax_declaration_no'),
-
-                'permits': permits,
-                'other_emb': data.get('other_emb'),
-
-                # geo image fields
-                'geo_image_url': data.get('geo_image_url'),
-                'latitude': data.get('geo_latitude') or data.get('latitude'),
-                'longitude': data.get('geo_longitude') or data.get('longitude'),
-                'location': data.get('geo_location') or data.get('location'),
-                'geo_captured_at': data.get('geo_captured_at').isoformat() if data.get('geo_captured_at') else None,
-
-                # attestation fields - build full URLs
-                'attestation_id': data.get('attestation_id'),
-                'attested_by_name': data.get('attested_by_name'),
-                'attested_by_position': data.get('attested_by_position'),
-                'attested_by_signature': build_signature_url(data.get('attested_by_signature')),
-                'noted_by_name': data.get('noted_by_name'),
-                'noted_by_position': data.get('noted_by_position'),
-                'noted_by_signature': build_signature_url(data.get('noted_by_signature'))
-            }
+    return images_by_report
 
-            return report_details
-                
-    except DatabaseError as e:
-        logger.error(f"Error fetching report details: {e}")
-        return None
-    
 
 def get_report_images(report_id):
     """
-    Fetch images related to a report from Supabase storage/join table.
+    Fetch images related to a report from the reported_images join table.
 
     Returns a list of dicts with keys: id, image, latitude, longitude, location,
     captured_at, qr_code, is_primary, image_sequence
     """
-    images = []
     if not report_id:
-        return images
+        return []
+    return get_report_images_batch([report_id]).get(int(report_id), [])
+
+
+def _load_report_payloads(report_ids, cenro_id):
+    return get_report_details_batch(report_ids, cenro_id, with_images=True)
 
-    try:
-        resp = supabase.table("reported_images") \
-            .select("image_id,is_primary,image_sequence,geo_tagged_images(id,image,latitude,longitude,location,captured_at,qr_code)") \
-            .eq("report_id", report_id) \
-            .eq("report_type", "enumerator") \
-            .execute()
 
-        reported = getattr(resp, 'data', None) or []
+def get_report_payloads(report_ids, cenro_id=None):
+    """
+    Get the report modal payload (details plus images) for several reports,
+    answering from the report-details cache where possible.
 
-        # Some Supabase client versions return unsorted results; sort by image_sequence if available
+    Returns a dict of report ID -> payload; reports that do not exist or are
+    outside the CENRO are left out.
+    """
+    ids = []
+    for report_id in report_ids:
         try:
-            reported.sort(key=lambda x: (x.get('image_sequence') is None, x.get('image_sequence') or 0))
-        except Exception:
-            pass
-
-        for ri in reported:
-            geo = ri.get('geo_tagged_images')
-            if not geo:
-                continue
-            images.append({
-                'id': geo.get('id'),
-                'image': geo.get('image'),
-                'latitude': geo.get('latitude'),
-                'longitude': geo.get('longitude'),
-                'location': geo.get('location'),
-                'captured_at': geo.get('captured_at'),
-                'qr_code': geo.get('qr_code'),
-                'is_primary': ri.get('is_primary', False),
-                'image_sequence': ri.get('image_sequence', None),
-            })
+            report_id = int(report_id)
+        except (ValueError, TypeError):
+            continue
+        if report_id not in ids:
+            ids.append(report_id)
+    ids = ids[:REPORT_DETAILS_BATCH_MAX]
 
-    except Exception as e:
-        logger.exception(f"Error fetching report images for report_id=%s: %s", report_id, e)
+    return report_cache.get_many(ids, cenro_id, lambda missing: _load_report_payloads(missing, cenro_id))
 
-    return images
 
+# attestation_notations columns written by each signing action: (name, position, signature)
+SIGNATURE_ACTIONS = {
+    'attest': ('attested_by_name', 'attested_by_position', 'attested_by_signature'),
+    'note': ('noted_by_name', 'noted_by_position', 'noted_by_signature'),
+}
+SIGN_REPORTS_BATCH_MAX = 200
 
-def save_notation(report_id, noted_by_name, noted_by_position, signature_dataurl, current_user_id=None):
-    """Save notation record and upload signature image to Supabase storage.
 
-    Returns (True, public_url) on success, or (False, error_message) on failure.
+def _apply_signature(cur, action, report_ids, name, position, signature_key, cenro_ids=None):
     """
-    try:
-        if not report_id:
-            return False, 'Invalid report id'
+    Write one signer (name, position, signature) to the attestation of every
+    report in report_ids with set-based statements.
+
+    Reports that already have an attestation_notations row get it updated;
+    the rest get a new row each, linked through enumerators_report.attestation_id.
+    Must run inside a transaction. Returns {report_id: 'updated' | 'created'}
+    for the reports that exist (and belong to one of cenro_ids, when given;
+    an empty list matches nothing).
+    """
+    name_column, position_column, signature_column = SIGNATURE_ACTIONS[action]
 
-        if not signature_dataurl or not signature_dataurl.startswith('data:'):
-            return False, 'Invalid signature data'
+    query = """
+        SELECT er.id, er.attestation_id
+        FROM enumerators_report er
+    """
+    params = [list(report_ids)]
+    if cenro_ids is not None:
+        query += " JOIN users u ON er.enumerator_id = u.id WHERE er.id = ANY(%s) AND u.cenro_id = ANY(%s)"
+        params.append(list(cenro_ids))
+    else:
+        query += " WHERE er.id = ANY(%s)"
+    # Lock the reports so a concurrent signer cannot link a second row to the same report
+    cur.execute(query + " ORDER BY er.id FOR UPDATE OF er;", params)
+    rows = cur.fetchall()
+
+    existing = {report_id: attestation_id for report_id, attestation_id in rows if attestation_id}
+    unlinked = [report_id for report_id, attestation_id in rows if not attestation_id]
+
+    if existing:
+        cur.execute(
+            f"""
+            UPDATE attestation_notations
+            SET {name_column} = %s,
+                {position_column} = %s,
+                {signature_column} = %s
+            WHERE id = ANY(%s);
+            """,
+            [name, position, signature_key, list(set(existing.values()))]
+        )
+
+    if unlinked:
+        # Every new row is identical, so any new id can go to any unlinked report
+        cur.execute(
+            f"""
+            INSERT INTO attestation_notations ({name_column}, {position_column}, {signature_column})
+            SELECT %s, %s, %s FROM generate_series(1, %s)
+            RETURNING id;
+            """,
+            [name, position, signature_key, len(unlinked)]
+        )
+        new_ids = [row[0] for row in cur.fetchall()]
+        cur.execute(
+            """
+            UPDATE enumerators_report er
+            SET attestation_id = link.attestation_id
+            FROM unnest(%s::bigint[], %s::bigint[]) AS link(report_id, attestation_id)
+            WHERE er.id = link.report_id;
+            """,
+            [unlinked, new_ids]
+        )
 
-        header, encoded = signature_dataurl.split(',', 1)
-        try:
-            data = base64.b64decode(encoded)
-        except Exception as e:
-            return False, f'Decoding error: {e}'
+    outcome = {report_id: 'updated' for report_id in existing}
+    outcome.update((report_id, 'created') for report_id in unlinked)
+    return outcome
 
-        bucket = os.getenv('SUPABASE_BUCKET', 'geo-tagged-photos')
-        filename = f"attestation/report_{report_id}_noted_{int(time.time())}.png"
 
+def sign_reports(action, report_ids, name, position, signature_dataurl, cenro_ids=None):
+    """
+    Attest or note many reports with one signature.
+
+    The signature is ingested (and queued for upload) once, and every
+    attestation_notations row and report link is written in a single transaction.
+
+    Args:
+        action: 'attest' or 'note'
+        report_ids: Report IDs to sign (at most SIGN_REPORTS_BATCH_MAX)
+        cenro_ids: Optional CENRO IDs the signer may sign for; reports outside
+            them are reported as not found
+
+    Returns (True, {'signature_url', 'results'}) where results lists
+    {'report_id', 'status'} per requested id with status 'created', 'updated',
+    'not_found' or 'invalid_id'; or (False, error_message) on failure.
+    """
+    if action not in SIGNATURE_ACTIONS:
+        return False, 'Invalid action'
+
+    ids, results = [], []
+    for raw_id in report_ids or []:
         try:
-            from_call = supabase.storage.from_(bucket)
-            upload_resp = from_call.upload(filename, data, {"content-type": "image/png"})
-            signature_url_to_store = filename
-        except Exception as e:
-            logger.exception('Supabase upload failed: %s', e)
-            return False, f'Upload failed: {str(e)}'
+            report_id = int(raw_id)
+        except (ValueError, TypeError):
+            results.append({'report_id': raw_id, 'status': 'invalid_id'})
+            continue
+        if report_id not in ids:
+            ids.append(report_id)
+    if not ids:
+        return False, 'No valid report ids'
+    if len(ids) > SIGN_REPORTS_BATCH_MAX:
+        return False, f'At most {SIGN_REPORTS_BATCH_MAX} reports can be signed at once'
 
-        with connection.cursor() as cur:
-            cur.execute("SELECT attestation_id FROM enumerators_report WHERE id = %s;", [report_id])
-            row = cur.fetchone()
-            existing_id = row[0] if row else None
-
-            if existing_id:
-                cur.execute(
-                    """
-                    UPDATE attestation_notations
-                    SET noted_by_name = %s,
-                        noted_by_position = %s,
-                        noted_by_signature = %s
-                    WHERE id = %s
-                    RETURNING id;
-                    """,
-                    [noted_by_name, noted_by_position, signature_url_to_store, existing_id]
-                )
-                cur.fetchone()
-            else:
-                cur.execute(
-                    """
-                    INSERT INTO attestation_notations (noted_by_name, noted_by_position, noted_by_signature)
-                    VALUES (%s, %s, %s)
-                    RETURNING id;
-                    """,
-                    [noted_by_name, noted_by_position, signature_url_to_store]
-                )
-                new_id = cur.fetchone()[0]
-                cur.execute("UPDATE enumerators_report SET attestation_id = %s WHERE id = %s;", [new_id, report_id])
+    try:
+        try:
+            signature_key = signatures.ingest_signature(signature_dataurl)
+        except ValueError as e:
+            return False, str(e)
 
-        full_url = f"{SUPABASE_URL}/storage/v1/object/public/{bucket}/{signature_url_to_store}"
-        return True, full_url
+        with transaction.atomic(), connection.cursor() as cur:
+            outcome = _apply_signature(cur, action, ids, name, position, signature_key, cenro_ids)
+
+        report_cache.invalidate_reports(list(outcome))
+        activity_log.log_activity(action, {'report_ids': sorted(outcome), 'bulk': True})
+
+        results.extend({'report_id': report_id, 'status': outcome.get(report_id, 'not_found')} for report_id in ids)
+        return True, {
+            'signature_url': signatures.signature_url(signature_key),
+            'results': results,
+        }
 
     except DatabaseError as e:
-        logger.exception('DB error saving notation: %s', e)
+        logger.exception('DB error signing reports: %s', e)
         return False, str(e)
     except Exception as e:
-        logger.exception('Unexpected error saving notation: %s', e)
+        logger.exception('Unexpected error signing reports: %s', e)
         return False, str(e)
 
 
-def save_attestation(report_id, attested_by_name, attested_by_position, signature_dataurl, current_user_id=None):
-    """Save attestation record and upload signature image to Supabase storage.
-
-    Returns (True, public_url) on success, or (False, error_message) on failure.
-    """
+def _sign_report(action, report_id, name, position, signature_dataurl):
     try:
         if not report_id:
             return False, 'Invalid report id'
 
-        # Decode data URL
-        if not signature_dataurl or not signature_dataurl.startswith('data:'):
-            return False, 'Invalid signature data'
-
-        header, encoded = signature_dataurl.split(',', 1)
+        # Cropped, content-addressed PNG; the upload itself happens in the background
         try:
-            data = base64.b64decode(encoded)
-        except Exception as e:
-            return False, f'Decoding error: {e}'
+            signature_url_to_store = signatures.ingest_signature(signature_dataurl)
+        except ValueError as e:
+            return False, str(e)
 
-        # Prepare file path in attestation folder
-        bucket = os.getenv('SUPABASE_BUCKET', 'geo-tagged-photos')
-        filename = f"attestation/report_{report_id}_attested_{int(time.time())}.png"
+        with transaction.atomic(), connection.cursor() as cur:
+            outcome = _apply_signature(cur, action, [int(report_id)], name, position, signature_url_to_store)
+        if not outcome:
+            return False, 'Report not found'
 
-        # Upload to Supabase storage
-        try:
-            from_call = supabase.storage.from_(bucket)
-            upload_resp = from_call.upload(filename, data, {"content-type": "image/png"})
-            signature_url_to_store = filename
-        except Exception as e:
-            logger.exception('Supabase upload failed: %s', e)
-            return False, f'Upload failed: {str(e)}'
+        report_cache.invalidate_reports([report_id])
+        activity_log.log_activity(action, {'report_id': report_id})
 
-        # Insert or update attestation_notations and link to enumerators_report
-        with connection.cursor() as cur:
-            # Check existing attestation_id
-            cur.execute("SELECT attestation_id FROM enumerators_report WHERE id = %s;", [report_id])
-            row = cur.fetchone()
-            existing_id = row[0] if row else None
-
-            if existing_id:
-                cur.execute(
-                    """
-                    UPDATE attestation_notations
-                    SET attested_by_name = %s,
-                        attested_by_position = %s,
-                        attested_by_signature = %s
-                    WHERE id = %s
-                    RETURNING id;
-                    """,
-                    [attested_by_name, attested_by_position, signature_url_to_store, existing_id]
-                )
-                cur.fetchone()
-            else:
-                cur.execute(
-                    """
-                    INSERT INTO attestation_notations (attested_by_name, attested_by_position, attested_by_signature)
-                    VALUES (%s, %s, %s)
-                    RETURNING id;
-                    """,
-                    [attested_by_name, attested_by_position, signature_url_to_store]
-                )
-                new_id = cur.fetchone()[0]
-                cur.execute("UPDATE enumerators_report SET attestation_id = %s WHERE id = %s;", [new_id, report_id])
-
-        # Return full URL for response
-        full_url = f"{SUPABASE_URL}/storage/v1/object/public/{bucket}/{signature_url_to_store}"
+        full_url = signatures.signature_url(signature_url_to_store)
         return True, full_url
 
     except DatabaseError as e:
-        logger.exception('DB error saving attestation: %s', e)
+        logger.exception('DB error saving %s: %s', action, e)
         return False, str(e)
     except Exception as e:
-        logger.exception('Unexpected error saving attestation: %s', e)
+        logger.exception('Unexpected error saving %s: %s', action, e)
         return False, str(e)
 
 
+def save_notation(report_id, noted_by_name, noted_by_position, signature_dataurl, current_user_id=None):
+    """Save notation record and queue the signature image for upload to storage.
+
+    Returns (True, signature_url) on success, or (False, error_message) on failure.
+    """
+    return _sign_report('note', report_id, noted_by_name, noted_by_position, signature_dataurl)
+
+
+def save_attestation(report_id, attested_by_name, attested_by_position, signature_dataurl, current_user_id=None):
+    """Save attestation record and queue the signature image for upload to storage.
 
+    Returns (True, signature_url) on success, or (False, error_message) on failure.
+    """
+    return _sign_report('attest', report_id, attested_by_name, attested_by_position, signature_dataurl)
+
+
+# =========================
+# ACTIVITY LOGS
+# =========================
+ACTIVITY_LOGS_PAGE_SIZE = 50
+ACTIVITY_LOGS_MAX_PAGE_SIZE = 200
+
+_ACTIVITY_LOG_SELECT = """
+    SELECT
+        al.id,
+        al.user_id,
+        u.username,
+        NULLIF(TRIM(CONCAT(u.first_name, ' ', u.last_name)), '') AS name,
+        al.action,
+        al.details,
+        al.ip_address,
+        al.created_at
+    FROM activity_logs al
+    LEFT JOIN users u ON al.user_id = u.id
+    WHERE TRUE
+"""
+
+
+def _build_activity_log_filters(user_id=None, region_id=None, penro_id=None, cenro_id=None,
+                                action=None, from_date=None, to_date=None):
+    """
+    Build the WHERE conditions (appended after 'WHERE TRUE') and params for an activity-log query.
+
+    The office scope is the narrowest of cenro_id, penro_id and region_id that is
+    given, and covers every action taken by a user assigned anywhere inside that
+    office at the time. Each row carries its whole office chain (see
+    activity_log._write_batch), so the scope is a single indexed column.
+    """
+    sql = ""
+    params = []
+
+    if cenro_id:
+        sql += " AND al.cenro_id = %s"
+        params.append(cenro_id)
+    elif penro_id:
+        sql += " AND al.penro_id = %s"
+        params.append(penro_id)
+    elif region_id:
+        sql += " AND al.region_id = %s"
+        params.append(region_id)
+
+    if user_id:
+        sql += " AND al.user_id = %s"
+        params.append(user_id)
+
+    if action:
+        sql += " AND al.action = %s"
+        params.append(action)
+
+    if from_date:
+        sql += " AND al.created_at >= %s"
+        params.append(from_date)
+
+    if to_date:
+        # to_date is inclusive: everything before the start of the next day
+        sql += " AND al.created_at < %s::date + 1"
+        params.append(to_date)
+
+    return sql, params
+
+
+def _encode_activity_log_cursor(log):
+    """Encode the (created_at, id) sort key of a log row as an opaque page token."""
+    key = [log['created_at'].isoformat() if log.get('created_at') else None, log['id']]
+    raw = json.dumps(key, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_activity_log_cursor(token):
+    """Decode a page token back into its sort key, or None if the token is malformed."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created_at, log_id = json.loads(raw.decode('utf-8'))
+        if not created_at:
+            return None
+        return created_at, int(log_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def get_activity_logs_page(user_id=None, region_id=None, penro_id=None, cenro_id=None, action=None,
+                           from_date=None, to_date=None, cursor=None, page_size=ACTIVITY_LOGS_PAGE_SIZE):
+    """
+    Fetch one page of activity logs, newest first, using keyset pagination on (created_at, id).
+
+    Unfiltered, per-user, per-action and office-scoped pages are each an index
+    range scan (see create_activity_logs_function.sql), so browsing months back
+    costs the same as the first page. Combining filters scans the most selective
+    of those indexes and checks the rest row by row.
+
+    Args:
+        user_id: Only this user's actions
+        region_id / penro_id / cenro_id: Office scope (the narrowest given wins)
+        action: Exact action name, e.g. 'login'
+        from_date / to_date: Inclusive date range on created_at
+        cursor: Page token returned as next_cursor by the previous page (None for the first page)
+        page_size: Rows per page, capped at ACTIVITY_LOGS_MAX_PAGE_SIZE
+
+    Returns:
+        Dict with keys: logs, next_cursor (None on the last page), has_more, page_size
+    """
+    try:
+        page_size = int(page_size)
+    except (ValueError, TypeError):
+        page_size = ACTIVITY_LOGS_PAGE_SIZE
+    page_size = max(1, min(page_size, ACTIVITY_LOGS_MAX_PAGE_SIZE))
+
+    logs = []
+    has_more = False
 
-def get_activity_logs():
-    """Fetch activity logs via DB function `get_activity_logs()` using Django connection."""
     try:
         with connection.cursor() as cur:
-            cur.execute("SELECT * FROM get_activity_logs();")
-            logs = cur.fetchall()
-
-            log_list = []
-            for row in logs:
-                log_list.append({
-                    "task": row[0],
-                    "user_id": row[1],
-                    "name": row[2],
-                    "timestamp": row[3],
-                })
+            filters_sql, params = _build_activity_log_filters(
+                user_id, region_id, penro_id, cenro_id, action, from_date, to_date
+            )
+            query = _ACTIVITY_LOG_SELECT + filters_sql
 
-            return log_list
-    except Exception as e:
-        logger.exception("Error fetching activity logs: %s", e)
+            key = _decode_activity_log_cursor(cursor)
+            if key:
+                query += " AND (al.created_at, al.id) < (%s, %s)"
+                params += list(key)
+
+            query += """
+                ORDER BY al.created_at DESC, al.id DESC
+                LIMIT %s;
+            """
+            # One extra row tells us whether another page exists without a COUNT(*)
+            params.append(page_size + 1)
+
+            cur.execute(query, params)
+
+            columns = [desc[0] for desc in cur.description]
+            for row in cur.fetchall():
+                logs.append(dict(zip(columns, row)))
+
+    except DatabaseError as e:
+        logger.error(f"Error fetching activity logs page: {e}")
+
+    if len(logs) > page_size:
+        has_more = True
+        logs = logs[:page_size]
+
+    return {
+        'logs': logs,
+        'next_cursor': _encode_activity_log_cursor(logs[-1]) if has_more else None,
+        'has_more': has_more,
+        'page_size': page_size,
+    }
+
+
+def get_activity_action_names():
+    """Distinct action names recorded so far, for filter dropdowns."""
+    try:
+        with connection.cursor() as cur:
+            # Loose index scan: one index probe per distinct action instead of reading every row
+            cur.execute("""
+                WITH RECURSIVE actions AS (
+                    (SELECT action FROM activity_logs WHERE action IS NOT NULL ORDER BY action LIMIT 1)
+                    UNION ALL
+                    SELECT (SELECT al.action FROM activity_logs al
+                            WHERE al.action > a.action ORDER BY al.action LIMIT 1)
+                    FROM actions a
+                    WHERE a.action IS NOT NULL
+                )
+                SELECT action FROM actions WHERE action IS NOT NULL;
+            """)
+            return [row[0] for row in cur.fetchall()]
+    except DatabaseError as e:
+        logger.error(f"Error fetching activity action names: {e}")
         return []
 
 
+def get_activity_logs():
+    """Fetch the latest activity logs (first page, all offices)."""
+    return get_activity_logs_page()['logs']
+
+
 # =========================
 # PROTECTED AREAS MANAGEMENT
 # =========================
@@ -1214,29 +1793,28 @@ def add_protected_area(name, file_obj):
         else:
             return False, 'Invalid file type. Upload KML or ZIP (containing shapefile).'
 
-        # Upload file to Supabase storage
-        bucket = os.getenv('SUPABASE_BUCKET', 'geo-tagged-photos')
+        # Upload file to storage
         file_path = f"protected-areas/{int(time.time())}_{file_obj.name}"
         
         try:
             file_data = file_obj.read()
-            from_call = supabase.storage.from_(bucket)
-            upload_resp = from_call.upload(file_path, file_data, {"content-type": file_obj.content_type or "application/octet-stream"})
+            storage.upload(file_path, file_data, file_obj.content_type or "application/octet-stream")
         except Exception as e:
-            logger.exception('Supabase file upload failed: %s', e)
+            logger.exception('Protected area file upload failed: %s', e)
             return False, f'File upload failed: {str(e)}'
 
-        # Insert into Supabase table
+        # Insert into protected_areas table
         try:
-            result = supabase.table('protected_areas').insert({
+            storage.insert('protected_areas', {
                 'name': name,
                 'file_type': file_type,
                 'file_path': file_path
-            }).execute()
+            })
+            activity_log.log_activity(activity_log.PROTECTED_AREA_ADD, {'name': name, 'file_path': file_path})
             
             return True, 'Protected area added successfully'
         except Exception as e:
-            logger.exception('Supabase insert failed: %s', e)
+            logger.exception('Protected area insert failed: %s', e)
             return False, f'Database insert failed: {str(e)}'
 
     except Exception as e:
@@ -1245,10 +1823,9 @@ def add_protected_area(name, file_obj):
 
 
 def get_protected_areas():
-    """Fetch all protected areas from Supabase."""
+    """Fetch all protected areas from the protected_areas table."""
     try:
-        result = supabase.table('protected_areas').select('*').order('created_at', desc=True).execute()
-        return result.data if result.data else []
+        return storage.select('protected_areas', order='created_at', desc=True)
     except Exception as e:
         logger.exception('Error fetching protected areas: %s', e)
         return []
@@ -1258,21 +1835,22 @@ def delete_protected_area(pa_id):
     """Delete protected area and its file from Supabase."""
     try:
         # Get file path before deleting
-        result = supabase.table('protected_areas').select('file_path').eq('id', pa_id).execute()
+        rows = storage.select('protected_areas', 'file_path', filters={'id': pa_id})
         
-        if result.data and len(result.data) > 0:
-            file_path = result.data[0].get('file_path')
+        if rows:
+            file_path = rows[0].get('file_path')
             
             # Delete file from storage
             if file_path:
                 try:
-                    bucket = os.getenv('SUPABASE_BUCKET', 'geo-tagged-photos')
-                    supabase.storage.from_(bucket).remove([file_path])
+                    storage.remove([file_path])
                 except Exception as e:
                     logger.warning('Failed to delete file from storage: %s', e)
+                geojson_cache.invalidate(file_path)
             
             # Delete from table
-            supabase.table('protected_areas').delete().eq('id', pa_id).execute()
+            storage.delete('protected_areas', {'id': pa_id})
+            activity_log.log_activity(activity_log.PROTECTED_AREA_DELETE, {'pa_id': pa_id, 'file_path': file_path})
             return True, 'Protected area deleted successfully'
         else:
             return False, 'Protected area not found'
@@ -1282,25 +1860,93 @@ def delete_protected_area(pa_id):
         return False, str(e)
 
 
-def export_reports(reports, format_type):
-    """Export reports to PDF, Word, or Excel format"""
-    from io import BytesIO
-    from django.http import HttpResponse
-    
+def load_shapefile_geojson(file_path):
+    """
+    Download a shapefile (zip or loose .shp/.shx/.dbf components) from Supabase
+    storage and convert it to a GeoJSON FeatureCollection dict.
+
+    Raises ValueError when a zip holds no .shp file.
+    """
+    import tempfile
+    import zipfile
+    import fiona
+
+    start = time.perf_counter()
+    source = 'zip'
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Try as zip first
+        try:
+            file_data = storage.download(file_path)
+            zip_path = os.path.join(tmpdir, 'shapefile.zip')
+            with open(zip_path, 'wb') as f:
+                f.write(file_data)
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                zip_ref.extractall(tmpdir)
+            shp_file = next((f for f in os.listdir(tmpdir) if f.endswith('.shp')), None)
+            if not shp_file:
+                raise ValueError('No .shp file in zip')
+            shp_path = os.path.join(tmpdir, shp_file)
+        except zipfile.BadZipFile:
+            # Not a zip, treat as individual shapefile components
+            source = 'components'
+            # Get base name without extension
+            base_name = os.path.basename(file_path).rsplit('.', 1)[0]
+            dir_path = os.path.dirname(file_path)
+
+            # Download all components with same base name
+            extensions = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+            for ext in extensions:
+                try:
+                    component_path = f"{dir_path}/{base_name}{ext}"
+                    component_data = storage.download(component_path)
+                    with open(os.path.join(tmpdir, f'{base_name}{ext}'), 'wb') as f:
+                        f.write(component_data)
+                except Exception:
+                    if ext in ['.shp', '.shx', '.dbf']:  # Required files
+                        raise
+
+            shp_path = os.path.join(tmpdir, f'{base_name}.shp')
+
+        # Convert to GeoJSON
+        features = []
+        with fiona.open(shp_path) as src:
+            for feature in src:
+                features.append({
+                    'type': 'Feature',
+                    'properties': dict(feature['properties']),
+                    'geometry': dict(feature['geometry'])
+                })
+
+    metrics.GEOJSON_CONVERT_SECONDS.observe(time.perf_counter() - start, source)
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+EXPORT_FORMATS = {
+    'pdf': ('application/pdf', 'reports.pdf'),
+    'word': ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', 'reports.docx'),
+    'excel': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'reports.xlsx'),
+    'csv': ('text/csv', 'reports.csv'),
+}
+
+
+def normalize_export_format(format_type):
+    """Map an export format request onto EXPORT_FORMATS; anything unknown falls back to PDF."""
+    return format_type if format_type in EXPORT_FORMATS else 'pdf'
+
+
+def write_export(reports, format_type, fileobj):
+    """Render reports in the given format into a binary file object."""
+    format_type = normalize_export_format(format_type)
+
     if format_type == 'excel':
         from openpyxl import Workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = 'Reports'
-        ws.append(['Report ID', 'Date', 'Establishment', 'Type', 'Status', 'Protected Area', 'Proponent', 'Enumerator', 'Remarks'])
+        # Write-only workbooks spool rows to disk instead of keeping cell objects around
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('Reports')
+        ws.append(EXPORT_HEADERS)
         for report in reports:
-            ws.append([report.get('id'), str(report.get('report_date') or ''), report.get('establishment_name') or '', report.get('establishment_type') or '', report.get('establishment_status') or '', report.get('pa_name') or '', report.get('proponent_name') or '', report.get('enumerator_name') or '', report.get('remarks') or ''])
-        buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        response = HttpResponse(buffer.read(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename="reports.xlsx"'
-        return response
+            ws.append(_export_row(report))
+        wb.save(fileobj)
     
     elif format_type == 'word':
         from docx import Document
@@ -1323,20 +1969,22 @@ def export_reports(reports, format_type):
             row[6].text = report.get('proponent_name') or ''
             row[7].text = report.get('enumerator_name') or ''
             row[8].text = report.get('remarks') or ''
-        buffer = BytesIO()
-        doc.save(buffer)
-        buffer.seek(0)
-        response = HttpResponse(buffer.read(), content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
-        response['Content-Disposition'] = 'attachment; filename="reports.docx"'
-        return response
+        doc.save(fileobj)
+
+    elif format_type == 'csv':
+        wrapper = io.TextIOWrapper(fileobj, encoding='utf-8', newline='')
+        for block in _iter_csv(reports):
+            wrapper.write(block)
+        # Hand the underlying file back to the caller instead of closing it
+        wrapper.flush()
+        wrapper.detach()
     
     else:  # PDF
         from reportlab.lib.pagesizes import letter, landscape
         from reportlab.lib import colors
         from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
         from reportlab.lib.styles import getSampleStyleSheet
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=landscape(letter))
+        doc = SimpleDocTemplate(fileobj, pagesize=landscape(letter))
         elements = []
         data = [['ID', 'Date', 'Establishment', 'Type', 'Status', 'PA', 'Proponent', 'Enumerator', 'Remarks']]
         for report in reports:
@@ -1345,7 +1993,186 @@ def export_reports(reports, format_type):
         table.setStyle(TableStyle([('BACKGROUND', (0, 0), (-1, 0), colors.grey), ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke), ('ALIGN', (0, 0), (-1, -1), 'CENTER'), ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'), ('FONTSIZE', (0, 0), (-1, 0), 10), ('BOTTOMPADDING', (0, 0), (-1, 0), 12), ('BACKGROUND', (0, 1), (-1, -1), colors.beige), ('GRID', (0, 0), (-1, -1), 1, colors.black)]))
         elements.append(table)
         doc.build(elements)
-        buffer.seek(0)
-        response = HttpResponse(buffer.read(), content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="reports.pdf"'
-        return response
+
+
+def export_reports(reports, format_type):
+    """Export reports to PDF, Word, Excel or CSV format"""
+    from io import BytesIO
+    from django.http import HttpResponse
+
+    format_type = normalize_export_format(format_type)
+    buffer = BytesIO()
+    with metrics.EXPORT_RENDER_SECONDS.time(format_type, 'buffered'):
+        write_export(reports, format_type, buffer)
+    content_type, filename = EXPORT_FORMATS[format_type]
+    response = HttpResponse(buffer.getvalue(), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# =========================
+# STREAMING EXPORT (CSV / write-only XLSX)
+# =========================
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_STREAM_BLOCK = 64 * 1024
+EXPORT_HEADERS = ['Report ID', 'Date', 'Establishment', 'Type', 'Status', 'Protected Area', 'Proponent', 'Enumerator', 'Remarks']
+
+
+def iter_enumerator_reports(cenro_id=None, from_date=None, to_date=None, establishment_type=None, pa_id=None,
+                            establishment_status=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the same report dictionaries as get_enumerator_reports, reading them
+    from a server-side (named) cursor chunk_size rows at a time so memory stays
+    flat however many reports match. Database errors propagate.
+    """
+    filters_sql, params = _build_report_filters(
+        cenro_id, from_date, to_date, establishment_type, pa_id, establishment_status
+    )
+    query = _REPORT_LIST_SELECT + filters_sql + " ORDER BY er.report_date DESC, er.created_at DESC"
+
+    try:
+        # A transaction keeps the named cursor alive without WITH HOLD, which would
+        # make Postgres materialize the whole result set up front.
+        with transaction.atomic(), connection.chunked_cursor() as cur:
+            cur.execute(query, params)
+            columns = None
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                # Named cursors only fill in description after the first fetch
+                if columns is None:
+                    columns = [desc[0] for desc in cur.description]
+                for row in rows:
+                    yield dict(zip(columns, row))
+    except DatabaseError as e:
+        # Re-raise: stopping quietly would pass a truncated export off as complete
+        logger.error(f"Error streaming enumerator reports: {e}")
+        raise
+
+
+def count_enumerator_reports(cenro_id=None, from_date=None, to_date=None, establishment_type=None, pa_id=None,
+                             establishment_status=None):
+    """Count the reports matching the same filters as get_enumerator_reports (None on DB error)."""
+    filters_sql, params = _build_report_filters(
+        cenro_id, from_date, to_date, establishment_type, pa_id, establishment_status
+    )
+    query = """
+        SELECT COUNT(*)
+        FROM enumerators_report er
+        LEFT JOIN users u ON er.enumerator_id = u.id
+        LEFT JOIN establishment_profile ep ON er.establishment_id = ep.id
+        WHERE 1=1
+    """ + filters_sql
+
+    try:
+        with connection.cursor() as cur:
+            cur.execute(query, params)
+            return cur.fetchone()[0]
+    except DatabaseError as e:
+        logger.error(f"Error counting enumerator reports: {e}")
+        return None
+
+
+def _export_row(report):
+    return [
+        report.get('id'),
+        str(report.get('report_date') or ''),
+        report.get('establishment_name') or '',
+        report.get('establishment_type') or '',
+        report.get('establishment_status') or '',
+        report.get('pa_name') or '',
+        report.get('proponent_name') or '',
+        report.get('enumerator_name') or '',
+        report.get('remarks') or '',
+    ]
+
+
+class _Echo:
+    """File-like object whose write() hands the value straight back, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _iter_csv(reports):
+    writer = csv.writer(_Echo())
+    block = [writer.writerow(EXPORT_HEADERS)]
+    size = 0
+    for report in reports:
+        line = writer.writerow(_export_row(report))
+        block.append(line)
+        size += len(line)
+        if size >= EXPORT_STREAM_BLOCK:
+            yield ''.join(block)
+            block, size = [], 0
+    if block:
+        yield ''.join(block)
+
+
+def _iter_xlsx(reports):
+    with tempfile.TemporaryFile() as tmp:
+        write_export(reports, 'excel', tmp)
+        tmp.seek(0)
+        while True:
+            chunk = tmp.read(EXPORT_STREAM_BLOCK)
+            if not chunk:
+                break
+            yield chunk
+
+
+STREAMING_EXPORT_FORMATS = {
+    'csv': _iter_csv,
+    'excel': _iter_xlsx,
+}
+
+
+def _timed_stream(chunks, format_type):
+    # Observed when the body is exhausted or the client goes away
+    with metrics.EXPORT_RENDER_SECONDS.time(format_type, 'stream'):
+        yield from chunks
+
+
+async def _aiter_chunks(chunks):
+    """
+    Serve a blocking chunk iterator to an async server one chunk at a time.
+
+    Every step runs through thread-sensitive sync_to_async, i.e. on the same
+    thread, so the server-side cursor and its transaction stay on one
+    connection; closing the iterator there too ends that transaction when the
+    client goes away.
+    """
+    chunks = iter(chunks)
+    next_chunk = sync_to_async(next)
+    done = object()
+    try:
+        while True:
+            chunk = await next_chunk(chunks, done)
+            if chunk is done:
+                break
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def stream_export_reports(reports, format_type, asynchronous=False):
+    """
+    Export reports as CSV or Excel through a StreamingHttpResponse.
+
+    `reports` can be any iterable of report dictionaries; pass
+    iter_enumerator_reports(...) to keep memory constant for large exports.
+    Pass asynchronous=True when serving under ASGI, which would otherwise
+    collect a synchronous body into a list before sending any of it.
+    """
+    from django.http import StreamingHttpResponse
+
+    render_rows = STREAMING_EXPORT_FORMATS[format_type]
+    content_type, filename = EXPORT_FORMATS[format_type]
+    chunks = _timed_stream(render_rows(reports), format_type)
+    if asynchronous:
+        chunks = _aiter_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,163 @@
+# principal.py
+"""
+The logged-in user of a request, resolved once per request.
+
+PrincipalMiddleware attaches request.principal, a lazy Principal built from the
+session on first use, so the access decorators, get_current_user_info() and
+views all share one session read and one role normalization.
+
+Sessions can be revoked per user: revoke_user_sessions() records a cut-off
+time in users.sessions_revoked_at (see create_session_revocation.sql), and
+any session that logged in before it resolves as anonymous (and is flushed).
+This works with every session engine, including signed cookies that have no
+server-side row to delete. The cut-off is cached for
+SESSION_REVOCATION_CHECK_TTL seconds, so every process honours a revocation
+within that time whatever cache backend is configured.
+"""
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.utils.functional import SimpleLazyObject
+
+logger = logging.getLogger(__name__)
+
+
+class Principal:
+    """Identity and office assignment of the current user (role is lowercase, e.g. 'super admin')."""
+
+    __slots__ = ('id', 'username', 'role', 'first_name', 'last_name', 'region_id', 'penro_id', 'cenro_id')
+
+    def __init__(self, id=None, username=None, role='', first_name=None, last_name=None,
+                 region_id=None, penro_id=None, cenro_id=None):
+        self.id = id
+        self.username = username
+        self.role = (role or '').strip().lower()
+        self.first_name = first_name
+        self.last_name = last_name
+        self.region_id = region_id
+        self.penro_id = penro_id
+        self.cenro_id = cenro_id
+
+    @property
+    def is_authenticated(self):
+        return self.id is not None
+
+    @property
+    def full_name(self):
+        return f"{(self.first_name or '').strip()} {(self.last_name or '').strip()}".strip()
+
+    def has_role(self, roles):
+        return self.role in {role.lower() for role in roles}
+
+    def office(self):
+        """(role, region_id, penro_id, cenro_id), the shape get_current_user_info() returns."""
+        if not self.is_authenticated:
+            return None, None, None, None
+        return self.role, self.region_id, self.penro_id, self.cenro_id
+
+    def __repr__(self):
+        return f"<Principal id={self.id} role={self.role!r}>"
+
+
+ANONYMOUS = Principal()
+
+_SESSION_FIELDS = ('user_id', 'username', 'role', 'first_name', 'last_name', 'region_id', 'penro_id', 'cenro_id')
+
+
+def _revoked_key(user_id):
+    return f"principal_revoked:{user_id}"
+
+
+def revoke_user_sessions(user_id):
+    """
+    Log a user out everywhere: every session created before now stops
+    authenticating. Returns False if there is no such user.
+    """
+    with connection.cursor() as cur:
+        cur.execute(
+            "UPDATE users SET sessions_revoked_at = now() WHERE id = %s "
+            "RETURNING EXTRACT(EPOCH FROM sessions_revoked_at);",
+            [user_id],
+        )
+        row = cur.fetchone()
+    if not row:
+        return False
+    # Takes effect at once in this process; others pick it up when their cached copy expires
+    cache.set(_revoked_key(user_id), float(row[0]), settings.SESSION_REVOCATION_CHECK_TTL)
+    return True
+
+
+def _revoked_at(user_id):
+    """The user's session cut-off as a Unix timestamp, 0 if never revoked."""
+    revoked_at = cache.get(_revoked_key(user_id))
+    if revoked_at is not None:
+        return revoked_at
+    try:
+        with connection.cursor() as cur:
+            # Savepoint, so a missing column doesn't abort an enclosing transaction
+            with transaction.atomic():
+                cur.execute("SELECT EXTRACT(EPOCH FROM sessions_revoked_at) FROM users WHERE id = %s;", [user_id])
+                row = cur.fetchone()
+    except DatabaseError as e:
+        logger.warning(f"Could not read session revocation of user {user_id}: {e}")
+        return 0
+    revoked_at = float(row[0]) if row and row[0] is not None else 0
+    cache.set(_revoked_key(user_id), revoked_at, settings.SESSION_REVOCATION_CHECK_TTL)
+    return revoked_at
+
+
+def mark_session_login(request):
+    """Stamp the session with its login time (call right after a successful login)."""
+    request.session['auth_at'] = time.time()
+    request.principal = resolve_principal(request)
+
+
+def resolve_principal(request):
+    """Build the Principal for a request from its session."""
+    session = request.session
+    user_id = session.get('user_id')
+    if not user_id:
+        return ANONYMOUS
+
+    revoked_at = _revoked_at(user_id)
+    if revoked_at and session.get('auth_at', 0) < revoked_at:
+        session.flush()
+        return ANONYMOUS
+
+    values = {field: session.get(field) for field in _SESSION_FIELDS}
+    values['id'] = values.pop('user_id')
+    return Principal(**values)
+
+
+def get_principal(request):
+    """The request's Principal, resolving it when PrincipalMiddleware did not run."""
+    principal = getattr(request, 'principal', None)
+    if principal is None:
+        principal = request.principal = resolve_principal(request)
+    return principal
+
+
+class PrincipalMiddleware:
+    """Attaches request.principal, resolved from the session on first access."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.principal = SimpleLazyObject(lambda: resolve_principal(request))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.principal = SimpleLazyObject(lambda: resolve_principal(request))
+        return await self.get_response(request)
@@ -0,0 +1,81 @@
+# report_cache.py
+"""
+Cache of assembled report-details payloads (details + images) for the report modal.
+
+Every report has a version number stored in the cache, and payload keys embed
+it. Write paths call invalidate_reports(), which bumps the version, so a
+payload cached before a signature or notation change can never be read again;
+the old entry simply ages out.
+
+Versions only work if every process sees the same ones, so payloads are
+cached only when the cache is shared (settings.CACHE_SHARED); with a
+per-process cache every call goes straight to the loader.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _version_key(report_id):
+    return f"report_details_version:{report_id}"
+
+
+def _payload_key(report_id, cenro_id, version):
+    return f"report_details:{report_id}:c{cenro_id or 'all'}:v{version}"
+
+
+def _versions(report_ids):
+    keys = {report_id: _version_key(report_id) for report_id in report_ids}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for report_id, key in keys.items():
+        version = found.get(key)
+        if version is None:
+            # Start from a fresh, never-used number so an evicted version can't
+            # line up with a payload that is still cached under an old key
+            cache.add(key, time.time_ns(), timeout=None)
+            version = cache.get(key)
+        versions[report_id] = version
+    return versions
+
+
+def get_many(report_ids, cenro_id, loader):
+    """
+    Return {report_id: payload} for the given reports, calling
+    loader(missing_ids) -> {report_id: payload} only for cache misses.
+    """
+    report_ids = list(report_ids)
+    if not report_ids:
+        return {}
+    if not settings.CACHE_SHARED:
+        # Another worker could not invalidate our copy, so don't keep one
+        return loader(report_ids)
+
+    versions = _versions(report_ids)
+    keys = {report_id: _payload_key(report_id, cenro_id, versions[report_id]) for report_id in report_ids}
+    cached = cache.get_many(keys.values())
+
+    payloads = {report_id: cached[key] for report_id, key in keys.items() if key in cached}
+    missing = [report_id for report_id in report_ids if report_id not in payloads]
+    if missing:
+        loaded = loader(missing)
+        cache.set_many(
+            {keys[report_id]: payload for report_id, payload in loaded.items() if report_id in keys},
+            timeout=settings.REPORT_DETAILS_CACHE_TTL,
+        )
+        payloads.update(loaded)
+    return payloads
+
+
+def invalidate_reports(report_ids):
+    """Make every cached payload of these reports unreachable."""
+    if not settings.CACHE_SHARED:
+        return
+    for report_id in report_ids:
+        key = _version_key(report_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # No version yet, so nothing can be cached under one
+            pass
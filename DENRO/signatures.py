@@ -0,0 +1,247 @@
+# signatures.py
+"""
+Signature ingestion for attestations and notations.
+
+A signature arrives as a canvas data URL. It is cropped to the ink plus a small
+margin, re-encoded as an optimized palette PNG and named by the SHA-256 of the
+result, so a head who signs many reports with the same image stores it once.
+
+Uploads never happen on the request thread. The PNG is written durably to an
+outbox directory (settings.SIGNATURE_OUTBOX_DIR) and a background worker pushes
+it to storage, retrying with backoff until it succeeds; a file left behind by a
+crash or restart is picked up again. Until the upload lands, signature_url()
+points at the app's own endpoint, which serves the bytes from the outbox.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.urls import reverse
+
+from .storage import storage
+
+logger = logging.getLogger(__name__)
+
+# Storage folder for content-addressed signatures
+SIGNATURE_PREFIX = 'attestation/signatures'
+# Transparent margin kept around the ink, in pixels
+SIGNATURE_PADDING = 8
+# Pixels lighter than this count as background on canvases without transparency
+SIGNATURE_INK_THRESHOLD = 245
+SIGNATURE_MAX_RETRY_DELAY = 300
+
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+_KEY_RE = re.compile(r'^%s/([0-9a-f]{64})\.png$' % re.escape(SIGNATURE_PREFIX))
+
+_worker = None
+_worker_lock = threading.Lock()
+_wakeup = threading.Event()
+# digest -> (failed attempts, monotonic time of next attempt)
+_backoff = {}
+
+
+def decode_signature(signature_dataurl):
+    """Return the raw bytes of a data URL; raises ValueError when it is not a usable image payload."""
+    if not signature_dataurl or not signature_dataurl.startswith('data:'):
+        raise ValueError('Invalid signature data')
+    try:
+        header, encoded = signature_dataurl.split(',', 1)
+        data = base64.b64decode(encoded, validate=True)
+    except (ValueError, binascii.Error) as e:
+        raise ValueError(f'Decoding error: {e}')
+    if len(data) > settings.SIGNATURE_MAX_BYTES:
+        raise ValueError('Signature image is too large')
+    return data
+
+
+def normalize_signature(data):
+    """
+    Crop an image to its ink and return it as an optimized palette PNG.
+
+    An opaque canvas has its background lifted to transparency, so the same
+    drawing gives identical bytes whether or not the canvas was transparent.
+    """
+    from PIL import Image, ImageMath, ImageOps
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception as e:
+        raise ValueError(f'Invalid signature image: {e}')
+
+    image = image.convert('RGBA')
+    alpha = image.getchannel('A')
+    opaque = alpha.getextrema()[0] == 255
+    if opaque:
+        # Opaque canvas: the ink is whatever is darker than the background
+        ink = ImageOps.invert(image.convert('L')).point(lambda v: 255 if v > 255 - SIGNATURE_INK_THRESHOLD else 0)
+        bbox = ink.getbbox()
+    else:
+        # Transparent canvas: the ink is whatever is not fully transparent
+        bbox = alpha.getbbox()
+    if not bbox:
+        raise ValueError('Signature is empty')
+
+    left, top, right, bottom = bbox
+    image = image.crop((
+        max(0, left - SIGNATURE_PADDING),
+        max(0, top - SIGNATURE_PADDING),
+        min(image.width, right + SIGNATURE_PADDING),
+        min(image.height, bottom + SIGNATURE_PADDING),
+    ))
+
+    if opaque:
+        # Ink over white: opacity is the darkness, and the colour is un-mixed from the white
+        alpha = ImageOps.invert(image.convert('L')).point(lambda v: v if v > 255 - SIGNATURE_INK_THRESHOLD else 0)
+        bands = [
+            ImageMath.lambda_eval(
+                lambda args: 255 - args['min']((255 - args['c']) * 255 / args['max'](args['a'], 1), 255),
+                c=band, a=alpha,
+            ).convert('L')
+            for band in image.split()[:3]
+        ]
+        image = Image.merge('RGBA', (*bands, alpha))
+    else:
+        alpha = image.getchannel('A')
+
+    # Fully transparent pixels keep no colour, so hidden canvas state cannot change the bytes
+    blank = Image.new('RGBA', image.size, (0, 0, 0, 0))
+    image = Image.composite(image, blank, alpha.point(lambda v: 255 if v else 0))
+
+    out = io.BytesIO()
+    image.quantize(colors=256, method=Image.Quantize.FASTOCTREE).save(out, format='PNG', optimize=True)
+    return out.getvalue()
+
+
+def signature_key(data):
+    """Storage path of a normalized signature."""
+    return f"{SIGNATURE_PREFIX}/{hashlib.sha256(data).hexdigest()}.png"
+
+
+def _digest(key):
+    match = _KEY_RE.match(key or '')
+    return match.group(1) if match else None
+
+
+def _outbox_dir():
+    path = settings.SIGNATURE_OUTBOX_DIR
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _outbox_path(digest):
+    return os.path.join(_outbox_dir(), f"{digest}.png")
+
+
+def enqueue_upload(key, data):
+    """Durably queue a signature for upload and wake the background worker."""
+    path = _outbox_path(_digest(key))
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    ensure_worker()
+    _wakeup.set()
+
+
+def ingest_signature(signature_dataurl):
+    """
+    Decode, normalize and queue a signature for upload.
+
+    Returns the storage key to record in attestation_notations. Raises
+    ValueError for payloads that are not a drawable signature.
+    """
+    data = normalize_signature(decode_signature(signature_dataurl))
+    key = signature_key(data)
+    enqueue_upload(key, data)
+    return key
+
+
+def pending_signature(digest):
+    """Bytes of a signature that is still waiting in the outbox, or None."""
+    if not _DIGEST_RE.match(digest or ''):
+        return None
+    try:
+        with open(_outbox_path(digest), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def signature_url(key):
+    """URL a browser can load a signature from, whether or not its upload has finished."""
+    digest = _digest(key)
+    if digest and os.path.exists(_outbox_path(digest)):
+        ensure_worker()
+        return reverse('signature-image', args=[digest])
+    return storage.public_url(key)
+
+
+# =========================
+# Outbox worker
+# =========================
+def drain_outbox():
+    """
+    Upload every queued signature that is due. Returns (uploaded, failed).
+
+    Safe to run from several processes at once: uploads are upserts of
+    content-addressed objects, so a duplicate upload writes the same bytes.
+    """
+    uploaded = failed = 0
+    now = time.monotonic()
+    for name in sorted(os.listdir(_outbox_dir())):
+        if not name.endswith('.png'):
+            continue
+        digest = name[:-4]
+        if not _DIGEST_RE.match(digest):
+            continue
+        attempts, next_try = _backoff.get(digest, (0, 0))
+        if next_try > now:
+            continue
+        data = pending_signature(digest)
+        if data is None:
+            continue
+        try:
+            storage.upload(f"{SIGNATURE_PREFIX}/{digest}.png", data, 'image/png', upsert=True)
+        except Exception as e:
+            attempts += 1
+            _backoff[digest] = (attempts, now + min(2 ** attempts, SIGNATURE_MAX_RETRY_DELAY))
+            logger.warning('Signature upload %s failed (attempt %s): %s', digest, attempts, e)
+            failed += 1
+            continue
+        _backoff.pop(digest, None)
+        try:
+            os.remove(_outbox_path(digest))
+        except FileNotFoundError:
+            pass
+        uploaded += 1
+    return uploaded, failed
+
+
+def _run_worker():
+    while True:
+        _wakeup.clear()
+        try:
+            drain_outbox()
+        except Exception:
+            logger.exception('Signature outbox drain failed')
+        _wakeup.wait(settings.SIGNATURE_OUTBOX_POLL_SECONDS)
+
+
+def ensure_worker():
+    """Start this process's outbox worker thread if it is not running yet."""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name='denro-signature-outbox', daemon=True)
+            _worker.start()
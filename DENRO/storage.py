@@ -0,0 +1,523 @@
+# storage.py
+"""
+Single gateway for object storage and Supabase table access.
+
+Every storage upload/download/remove and PostgREST table call in the app goes
+through `storage`, which:
+
+  - builds its backend lazily on first use, so importing the app does not need
+    Supabase credentials;
+  - keeps one pooled keep-alive HTTP client per process;
+  - applies a per-call timeout and retries transient failures;
+  - records call count, errors and latency per operation (see `stats()`).
+
+Set STORAGE_BACKEND=local to keep objects and tables on the local filesystem
+under STORAGE_LOCAL_ROOT instead of talking to Supabase, STORAGE_BACKEND=memory
+to keep them in process memory, or STORAGE_BACKEND=simulated to put either one
+behind injected latency, bandwidth limits and failures (STORAGE_SIM_* settings)
+to see how the app behaves against slow or flaky storage.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class StorageError(Exception):
+    """Raised when a storage or table call fails after all retries."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class _TransientStorageError(StorageError):
+    """A failure that is worth retrying (timeouts, dropped connections, 5xx)."""
+
+    def __init__(self, message, status=None, sent=True):
+        super().__init__(message, status)
+        # False only when the request provably never reached the server
+        self.sent = sent
+
+
+# =========================
+# Supabase (HTTP) backend
+# =========================
+class SupabaseBackend:
+    """Talks to Supabase Storage and PostgREST over one pooled httpx client."""
+
+    def __init__(self, url, key, pool_size, timeout):
+        import httpx
+
+        if not url or not key:
+            raise StorageError('SUPABASE_URL and SUPABASE_SERVICE_KEY must be set')
+
+        self.url = url.rstrip('/')
+        self._httpx = httpx
+        self._client = httpx.Client(
+            base_url=self.url,
+            headers={'apikey': key, 'Authorization': f'Bearer {key}'},
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=60,
+            ),
+        )
+
+    def _request(self, method, path, timeout, **kwargs):
+        try:
+            response = self._client.request(method, path, timeout=timeout, **kwargs)
+        except self._httpx.TransportError as e:
+            # Only a failed connect is guaranteed not to have reached the server
+            sent = not isinstance(e, (self._httpx.ConnectError, self._httpx.ConnectTimeout))
+            raise _TransientStorageError(f'{method} {path}: {e}', sent=sent)
+        if response.status_code >= 500:
+            raise _TransientStorageError(f'{method} {path}: HTTP {response.status_code} {response.text[:200]}', response.status_code)
+        if response.status_code >= 400:
+            raise StorageError(f'{method} {path}: HTTP {response.status_code} {response.text[:200]}', response.status_code)
+        return response
+
+    @staticmethod
+    def _object_path(bucket, path):
+        return f"/storage/v1/object/{quote(bucket)}/{quote(path)}"
+
+    def upload(self, bucket, path, data, content_type, timeout, upsert=False):
+        headers = {'content-type': content_type}
+        if upsert:
+            headers['x-upsert'] = 'true'
+        self._request('POST', self._object_path(bucket, path), timeout, content=data, headers=headers)
+
+    def download(self, bucket, path, timeout):
+        return self._request('GET', self._object_path(bucket, path), timeout).content
+
+    def remove(self, bucket, paths, timeout):
+        self._request('DELETE', f"/storage/v1/object/{quote(bucket)}", timeout, json={'prefixes': list(paths)})
+
+    def public_url(self, bucket, path):
+        return f"{self.url}/storage/v1/object/public/{bucket}/{path}"
+
+    @staticmethod
+    def _filter_params(filters):
+        params = {}
+        for column, value in (filters or {}).items():
+            if isinstance(value, (list, tuple, set)):
+                params[column] = f"in.({','.join(str(v) for v in value)})"
+            else:
+                params[column] = f'eq.{value}'
+        return params
+
+    def select(self, table, columns, filters, order, desc, limit, timeout):
+        params = {'select': columns}
+        params.update(self._filter_params(filters))
+        if order:
+            params['order'] = f"{order}.{'desc' if desc else 'asc'}"
+        if limit:
+            params['limit'] = limit
+        return self._request('GET', f'/rest/v1/{table}', timeout, params=params).json()
+
+    def insert(self, table, row, timeout):
+        response = self._request('POST', f'/rest/v1/{table}', timeout, json=row,
+                                 headers={'Prefer': 'return=representation'})
+        return response.json()
+
+    def delete(self, table, filters, timeout):
+        response = self._request('DELETE', f'/rest/v1/{table}', timeout, params=self._filter_params(filters),
+                                 headers={'Prefer': 'return=representation'})
+        return response.json()
+
+    def close(self):
+        self._client.close()
+
+
+# =========================
+# Local filesystem backend
+# =========================
+class LocalBackend:
+    """
+    Keeps objects under <root>/storage/<bucket>/ and each table as a JSON list
+    in <root>/tables/<table>.json. Meant for development and offline testing;
+    embedded resources in select() (e.g. 'geo_tagged_images(...)') are ignored.
+    """
+
+    def __init__(self, root, public_base_url):
+        self.root = str(root)
+        self.public_base_url = public_base_url.rstrip('/')
+        self._lock = threading.Lock()
+
+    def _object_file(self, bucket, path):
+        base = os.path.realpath(os.path.join(self.root, 'storage', bucket))
+        target = os.path.realpath(os.path.join(base, path))
+        if not target.startswith(base + os.sep):
+            raise StorageError(f'Invalid object path: {path}', 400)
+        return target
+
+    def upload(self, bucket, path, data, content_type, timeout, upsert=False):
+        target = self._object_file(bucket, path)
+        if not upsert and os.path.exists(target):
+            raise StorageError(f'Object already exists: {bucket}/{path}', 409)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f'{target}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, target)
+
+    def download(self, bucket, path, timeout):
+        try:
+            with open(self._object_file(bucket, path), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise StorageError(f'Object not found: {bucket}/{path}', 404)
+
+    def remove(self, bucket, paths, timeout):
+        for path in paths:
+            try:
+                os.remove(self._object_file(bucket, path))
+            except FileNotFoundError:
+                pass
+
+    def public_url(self, bucket, path):
+        return f"{self.public_base_url}/{bucket}/{path}"
+
+    def _table_file(self, table):
+        return os.path.join(self.root, 'tables', f'{table}.json')
+
+    def _load(self, table):
+        try:
+            with open(self._table_file(table), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def _save(self, table, rows):
+        path = self._table_file(table)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, default=str)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _matches(row, filters):
+        for column, value in (filters or {}).items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            if str(row.get(column)) not in {str(v) for v in values}:
+                return False
+        return True
+
+    def select(self, table, columns, filters, order, desc, limit, timeout):
+        with self._lock:
+            rows = [row for row in self._load(table) if self._matches(row, filters)]
+        if order:
+            rows.sort(key=lambda row: (row.get(order) is None, row.get(order)), reverse=desc)
+        if limit:
+            rows = rows[:limit]
+        wanted = [c.strip() for c in columns.split(',') if c.strip() and '(' not in c]
+        if '*' not in wanted:
+            rows = [{c: row.get(c) for c in wanted} for row in rows]
+        return rows
+
+    def insert(self, table, row, timeout):
+        with self._lock:
+            rows = self._load(table)
+            new_row = dict(row)
+            new_row.setdefault('id', max((r.get('id') or 0 for r in rows), default=0) + 1)
+            new_row.setdefault('created_at', time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime()))
+            rows.append(new_row)
+            self._save(table, rows)
+        return [new_row]
+
+    def delete(self, table, filters, timeout):
+        with self._lock:
+            rows = self._load(table)
+            deleted = [row for row in rows if self._matches(row, filters)]
+            self._save(table, [row for row in rows if not self._matches(row, filters)])
+        return deleted
+
+    def close(self):
+        pass
+
+
+# =========================
+# In-memory backend
+# =========================
+class MemoryBackend(LocalBackend):
+    """
+    LocalBackend semantics with objects and tables held in process memory.
+    Nothing is shared between processes and everything is lost on restart,
+    which is what offline tests and load runs want.
+    """
+
+    def __init__(self, public_base_url):
+        super().__init__('', public_base_url)
+        self._objects = {}
+        self._tables = {}
+
+    def upload(self, bucket, path, data, content_type, timeout, upsert=False):
+        with self._lock:
+            if not upsert and (bucket, path) in self._objects:
+                raise StorageError(f'Object already exists: {bucket}/{path}', 409)
+            self._objects[(bucket, path)] = bytes(data)
+
+    def download(self, bucket, path, timeout):
+        with self._lock:
+            data = self._objects.get((bucket, path))
+        if data is None:
+            raise StorageError(f'Object not found: {bucket}/{path}', 404)
+        return data
+
+    def remove(self, bucket, paths, timeout):
+        with self._lock:
+            for path in paths:
+                self._objects.pop((bucket, path), None)
+
+    def _load(self, table):
+        return list(self._tables.get(table, []))
+
+    def _save(self, table, rows):
+        self._tables[table] = rows
+
+
+# =========================
+# Fault-injecting wrapper
+# =========================
+class SimulatedBackend:
+    """
+    Wraps another backend and makes it behave like a remote service:
+
+      - every call waits latency_ms plus up to jitter_ms;
+      - object bytes moved by upload/download also wait for bandwidth_kbps;
+      - error_rate of calls fail with a retryable HTTP 503, and timeout_rate of
+        calls hang for the full timeout and then fail;
+      - a call whose simulated time exceeds its timeout fails as a timeout.
+
+    Only the operations listed in `operations` are affected. Failures are
+    raised the way SupabaseBackend raises them, so the gateway's retries and
+    error handling run unchanged.
+    """
+
+    OPERATIONS = ('upload', 'download', 'remove', 'select', 'insert', 'delete')
+
+    def __init__(self, inner, latency_ms=0, jitter_ms=0, bandwidth_kbps=0, error_rate=0.0, timeout_rate=0.0,
+                 operations=None, seed=None):
+        self.inner = inner
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.bytes_per_second = bandwidth_kbps * 1024 / 8 if bandwidth_kbps else 0
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.operations = set(operations or self.OPERATIONS)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.injected = {'errors': 0, 'timeouts': 0, 'delay_seconds': 0.0}
+
+    def _simulate(self, operation, timeout, nbytes=0):
+        if operation not in self.operations:
+            return
+        with self._lock:
+            roll = self._random.random()
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        if self.bytes_per_second:
+            delay += nbytes / self.bytes_per_second
+
+        if roll < self.timeout_rate or (timeout and delay > timeout):
+            time.sleep(timeout or 0)
+            with self._lock:
+                self.injected['timeouts'] += 1
+                self.injected['delay_seconds'] += timeout or 0
+            raise _TransientStorageError(f'{operation}: simulated timeout after {timeout}s')
+
+        time.sleep(delay)
+        with self._lock:
+            self.injected['delay_seconds'] += delay
+            if roll < self.timeout_rate + self.error_rate:
+                self.injected['errors'] += 1
+                raise _TransientStorageError(f'{operation}: simulated HTTP 503', 503)
+
+    def upload(self, bucket, path, data, content_type, timeout, upsert=False):
+        self._simulate('upload', timeout, len(data))
+        return self.inner.upload(bucket, path, data, content_type, timeout, upsert=upsert)
+
+    def download(self, bucket, path, timeout):
+        data = self.inner.download(bucket, path, timeout)
+        self._simulate('download', timeout, len(data))
+        return data
+
+    def remove(self, bucket, paths, timeout):
+        self._simulate('remove', timeout)
+        return self.inner.remove(bucket, paths, timeout)
+
+    def public_url(self, bucket, path):
+        return self.inner.public_url(bucket, path)
+
+    def select(self, table, columns, filters, order, desc, limit, timeout):
+        self._simulate('select', timeout)
+        return self.inner.select(table, columns, filters, order, desc, limit, timeout)
+
+    def insert(self, table, row, timeout):
+        self._simulate('insert', timeout)
+        return self.inner.insert(table, row, timeout)
+
+    def delete(self, table, filters, timeout):
+        self._simulate('delete', timeout)
+        return self.inner.delete(table, filters, timeout)
+
+    def close(self):
+        self.inner.close()
+
+
+def _simulated_backend():
+    inner = settings.STORAGE_SIM_BACKEND
+    if inner not in BACKENDS or inner == 'simulated':
+        raise StorageError(f'Unknown STORAGE_SIM_BACKEND: {inner}')
+    return SimulatedBackend(
+        BACKENDS[inner](),
+        latency_ms=settings.STORAGE_SIM_LATENCY_MS,
+        jitter_ms=settings.STORAGE_SIM_JITTER_MS,
+        bandwidth_kbps=settings.STORAGE_SIM_BANDWIDTH_KBPS,
+        error_rate=settings.STORAGE_SIM_ERROR_RATE,
+        timeout_rate=settings.STORAGE_SIM_TIMEOUT_RATE,
+        operations=settings.STORAGE_SIM_OPERATIONS,
+        seed=settings.STORAGE_SIM_SEED,
+    )
+
+
+BACKENDS = {
+    'supabase': lambda: SupabaseBackend(
+        os.getenv('SUPABASE_URL'),
+        os.getenv('SUPABASE_SERVICE_KEY'),  # ⚠️ service role key, never expose to frontend
+        settings.STORAGE_POOL_SIZE,
+        settings.STORAGE_TIMEOUT,
+    ),
+    'local': lambda: LocalBackend(settings.STORAGE_LOCAL_ROOT, settings.STORAGE_LOCAL_URL),
+    'memory': lambda: MemoryBackend(settings.STORAGE_LOCAL_URL),
+    'simulated': _simulated_backend,
+}
+
+
+# =========================
+# Gateway
+# =========================
+class StorageGateway:
+    def __init__(self):
+        self._backend = None
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    name = settings.STORAGE_BACKEND
+                    if name not in BACKENDS:
+                        raise StorageError(f'Unknown STORAGE_BACKEND: {name}')
+                    self._backend = BACKENDS[name]()
+        return self._backend
+
+    def configure(self, backend):
+        """Swap in a backend instance (closing the current one), e.g. for tests or load runs."""
+        with self._lock:
+            if self._backend is not None:
+                self._backend.close()
+            self._backend = backend
+
+    @property
+    def default_bucket(self):
+        return os.getenv('SUPABASE_BUCKET', 'geo-tagged-photos')
+
+    def _record(self, operation, seconds, ok):
+        with self._stats_lock:
+            entry = self._stats.setdefault(operation, {'count': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            entry['count'] += 1
+            entry['total_seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+            if not ok:
+                entry['errors'] += 1
+        metrics.STORAGE_SECONDS.observe(seconds, operation, 'ok' if ok else 'error')
+
+    def _call(self, operation, fn, *args, timeout=None, retries=None, idempotent=True, **kwargs):
+        timeout = settings.STORAGE_TIMEOUT if timeout is None else timeout
+        retries = settings.STORAGE_RETRIES if retries is None else retries
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                result = fn(*args, timeout=timeout, **kwargs)
+            except _TransientStorageError as e:
+                self._record(operation, time.perf_counter() - start, False)
+                # Writes are only retried when the first attempt never reached the server
+                if attempt >= retries or (e.sent and not idempotent):
+                    raise StorageError(str(e), e.status)
+                attempt += 1
+                logger.warning('Storage %s failed (attempt %s), retrying: %s', operation, attempt, e)
+                time.sleep(min(0.2 * 2 ** (attempt - 1), 2.0))
+            except Exception:
+                self._record(operation, time.perf_counter() - start, False)
+                raise
+            else:
+                elapsed = time.perf_counter() - start
+                self._record(operation, elapsed, True)
+                logger.debug('Storage %s took %.1f ms', operation, elapsed * 1000)
+                return result
+
+    # Object storage
+    def upload(self, path, data, content_type='application/octet-stream', bucket=None, timeout=None, upsert=False):
+        """
+        Store `data` at `path`. With upsert=True an existing object is overwritten
+        instead of failing, which also makes the call safe to retry.
+        """
+        if upsert:
+            result = self._call('upload', self.backend.upload, bucket or self.default_bucket, path, data, content_type,
+                                timeout=timeout, upsert=True)
+        else:
+            result = self._call('upload', self.backend.upload, bucket or self.default_bucket, path, data, content_type,
+                                timeout=timeout, idempotent=False)
+        metrics.STORAGE_BYTES.inc(len(data), 'upload')
+        return result
+
+    def download(self, path, bucket=None, timeout=None):
+        data = self._call('download', self.backend.download, bucket or self.default_bucket, path, timeout=timeout)
+        metrics.STORAGE_BYTES.inc(len(data or b''), 'download')
+        return data
+
+    def remove(self, paths, bucket=None, timeout=None):
+        return self._call('remove', self.backend.remove, bucket or self.default_bucket, paths, timeout=timeout)
+
+    def public_url(self, path, bucket=None):
+        return self.backend.public_url(bucket or self.default_bucket, path)
+
+    # Tables
+    def select(self, table, columns='*', filters=None, order=None, desc=False, limit=None, timeout=None):
+        """
+        Return the rows of `table` matching `filters` as a list of dicts.
+
+        Filter values are matched for equality; a list/tuple/set value matches any of its items.
+        """
+        return self._call('select', self.backend.select, table, columns, filters, order, desc, limit, timeout=timeout)
+
+    def insert(self, table, row, timeout=None):
+        """Insert one row and return the inserted rows."""
+        return self._call('insert', self.backend.insert, table, row, timeout=timeout, idempotent=False)
+
+    def delete(self, table, filters, timeout=None):
+        """Delete the rows matching equality `filters` and return them."""
+        return self._call('delete', self.backend.delete, table, filters, timeout=timeout)
+
+    def stats(self):
+        """Per-operation call count, error count and latency (seconds) since process start."""
+        with self._stats_lock:
+            return {operation: dict(entry) for operation, entry in self._stats.items()}
+
+
+storage = StorageGateway()
@@ -1,3 +1,839 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import tempfile
+import time
+from collections import deque
+from datetime import date, datetime
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import IntegrityError, OperationalError
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from . import (
+    activity_log,
+    dashboard_stats,
+    export_jobs,
+    geometry,
+    login_guard,
+    metrics,
+    report_cache,
+    signatures,
+    storage as storage_module,
+)
+from .geojson_cache import GeoJSONCache
+from .operation import (
+    _decode_report_cursor,
+    _decode_search_cursor,
+    _encode_report_cursor,
+    _encode_search_cursor,
+)
+from .storage import (
+    LocalBackend,
+    MemoryBackend,
+    SimulatedBackend,
+    StorageError,
+    StorageGateway,
+    _TransientStorageError,
+)
+
+
+# =========================
+# Report statistics buckets
+# =========================
+class BucketTests(SimpleTestCase):
+    def test_bucket_start(self):
+        self.assertEqual(dashboard_stats.bucket_start(date(2026, 10, 16), 'day'), date(2026, 10, 16))
+        # Weeks start on Monday
+        self.assertEqual(dashboard_stats.bucket_start(date(2026, 10, 16), 'week'), date(2026, 10, 12))
+        self.assertEqual(dashboard_stats.bucket_start(date(2026, 10, 12), 'week'), date(2026, 10, 12))
+        self.assertEqual(dashboard_stats.bucket_start(date(2026, 10, 31), 'month'), date(2026, 10, 1))
+
+    def test_next_bucket_month_rollover(self):
+        self.assertEqual(dashboard_stats.next_bucket(date(2026, 1, 1), 'month'), date(2026, 2, 1))
+        self.assertEqual(dashboard_stats.next_bucket(date(2026, 2, 1), 'month'), date(2026, 3, 1))
+        self.assertEqual(dashboard_stats.next_bucket(date(2026, 12, 1), 'month'), date(2027, 1, 1))
+        self.assertEqual(dashboard_stats.next_bucket(date(2026, 12, 28), 'week'), date(2027, 1, 4))
+        self.assertEqual(dashboard_stats.next_bucket(date(2024, 2, 28), 'day'), date(2024, 2, 29))
+
+    def test_bucket_starts(self):
+        self.assertEqual(
+            dashboard_stats.bucket_starts(date(2026, 11, 15), date(2027, 2, 1), 'month'),
+            [date(2026, 11, 1), date(2026, 12, 1), date(2027, 1, 1), date(2027, 2, 1)],
+        )
+        with self.assertRaises(ValueError):
+            dashboard_stats.bucket_starts(date(2020, 1, 1), date(2026, 1, 1), 'day')
+
+    def test_default_range(self):
+        self.assertEqual(
+            dashboard_stats.default_range('month', date(2026, 10, 16)),
+            (date(2025, 11, 1), date(2026, 10, 16)),
+        )
+
+    def test_bucket_key_depends_on_cenros(self):
+        start = date(2026, 10, 1)
+        self.assertEqual(
+            dashboard_stats._bucket_key('penro:1', [3, 2], 'month', start),
+            dashboard_stats._bucket_key('penro:1', [2, 3], 'month', start),
+        )
+        self.assertNotEqual(
+            dashboard_stats._bucket_key('penro:1', [2, 3], 'month', start),
+            dashboard_stats._bucket_key('penro:1', [2, 3, 4], 'month', start),
+        )
+
+    def test_load_buckets_grouping_bits(self):
+        start, other = date(2026, 10, 1), date(2026, 11, 1)
+        rows = [
+            (start, 7, None, None, None, None, 10),
+            (start, 3, 'Resort', None, None, None, 6),
+            (start, 5, None, 'Operational', None, None, 8),
+            (start, 6, None, None, 9, 'PA Nine', 3),
+            (start, 6, None, None, 4, 'PA Four', 7),
+            # Not one of the requested buckets
+            (date(2026, 9, 1), 7, None, None, None, None, 99),
+        ]
+        cursor = mock.MagicMock()
+        cursor.fetchall.return_value = rows
+        with mock.patch.object(dashboard_stats, 'connection') as connection:
+            connection.cursor.return_value.__enter__.return_value = cursor
+            buckets = dashboard_stats._load_buckets([1], 'month', [start, other])
+
+        self.assertEqual(set(buckets), {start, other})
+        self.assertEqual(buckets[start]['total'], 10)
+        self.assertEqual(buckets[start]['by_type'], {'Resort': 6})
+        self.assertEqual(buckets[start]['by_status'], {'Operational': 8})
+        self.assertEqual([pa['pa_id'] for pa in buckets[start]['by_pa']], [4, 9])
+        self.assertEqual(buckets[other], dashboard_stats._empty_bucket(other))
+
+
+# =========================
+# Report list cursors
+# =========================
+class ReportCursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        report = {'report_date': date(2026, 10, 16), 'created_at': datetime(2026, 10, 16, 8, 30), 'id': 42}
+        self.assertEqual(
+            _decode_report_cursor(_encode_report_cursor(report)),
+            ('2026-10-16', '2026-10-16T08:30:00', 42),
+        )
+
+    def test_null_dates(self):
+        report = {'report_date': None, 'created_at': None, 'id': 7}
+        self.assertEqual(_decode_report_cursor(_encode_report_cursor(report)), ('-infinity', '-infinity', 7))
+
+    def test_malformed(self):
+        self.assertIsNone(_decode_report_cursor(None))
+        self.assertIsNone(_decode_report_cursor(''))
+        self.assertIsNone(_decode_report_cursor('not a cursor'))
+        self.assertIsNone(_decode_report_cursor('WzEsMl0'))  # [1,2]: too few fields
+
+
+# =========================
+# Report search cursors
+# =========================
+class SearchCursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        self.assertEqual(_decode_search_cursor(_encode_search_cursor({'rank': 1.25, 'id': 9})), (1.25, 9))
+
+    def test_malformed(self):
+        self.assertIsNone(_decode_search_cursor(None))
+        self.assertIsNone(_decode_search_cursor('not a cursor'))
+        self.assertIsNone(_decode_search_cursor('WyJ4IiwxXQ'))  # ["x",1]: rank is not a number
+
+
+# =========================
+# Metrics
+# =========================
+class MetricsRenderTests(SimpleTestCase):
+    def test_counter_render(self):
+        counter = metrics.Counter('test_events_total', 'Events.', ('kind',))
+        self.addCleanup(metrics._registry.remove, counter)
+        counter.inc(2, 'a"b')
+        counter.inc(1, 'a"b')
+        self.assertEqual(counter.render(), [
+            '# HELP test_events_total Events.',
+            '# TYPE test_events_total counter',
+            'test_events_total{kind="a\\"b"} 3',
+        ])
+
+    def test_histogram_render(self):
+        histogram = metrics.Histogram('test_seconds', 'Latency.', ('view',), buckets=(0.1, 1.0))
+        self.addCleanup(metrics._registry.remove, histogram)
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, 'home')
+        self.assertEqual(histogram.render(), [
+            '# HELP test_seconds Latency.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{view="home",le="0.1"} 2',
+            'test_seconds_bucket{view="home",le="1.0"} 3',
+            'test_seconds_bucket{view="home",le="+Inf"} 4',
+            'test_seconds_sum{view="home"} 2.65',
+            'test_seconds_count{view="home"} 4',
+        ])
+
+    def test_render_includes_registry_and_collectors(self):
+        collector = metrics.register_collector(lambda: [('test_gauge', 'gauge', 'A gauge.', [({}, 5)])])
+        self.addCleanup(metrics._collectors.remove, collector)
+        output = metrics.render()
+        self.assertTrue(output.endswith('\n'))
+        self.assertIn('# TYPE denro_request_seconds histogram\n', output)
+        self.assertIn('# TYPE test_gauge gauge\ntest_gauge 5\n', output)
+
+
+# =========================
+# Login throttling
+# =========================
+@override_settings(
+    LOGIN_THROTTLE_ENABLED=True,
+    LOGIN_THROTTLE_WINDOW=900,
+    LOGIN_THROTTLE_USERNAME_LIMIT=3,
+    LOGIN_THROTTLE_IP_LIMIT=100,
+    LOGIN_THROTTLE_BASE_LOCKOUT=30,
+    LOGIN_THROTTLE_MAX_LOCKOUT=100,
+)
+class LoginGuardTests(SimpleTestCase):
+    # Start of a 900-second window
+    NOW = 900 * 2_000_000
+
+    def setUp(self):
+        backend = mock.patch.object(login_guard, '_backend', login_guard.MemoryBackend(1000))
+        backend.start()
+        self.addCleanup(backend.stop)
+
+    def fail_at(self, now, times=1):
+        with mock.patch.object(login_guard.time, 'time', return_value=now):
+            for _ in range(times):
+                login_guard.record_login_failure('Juan', None)
+
+    def check_at(self, now):
+        with mock.patch.object(login_guard.time, 'time', return_value=now):
+            return login_guard.check_login_allowed('juan', None)
+
+    def test_locks_out_at_limit(self):
+        self.fail_at(self.NOW, 2)
+        self.assertEqual(self.check_at(self.NOW), (True, 0))
+        self.fail_at(self.NOW)
+        self.assertEqual(self.check_at(self.NOW), (False, 31))
+        self.assertEqual(self.check_at(self.NOW + 31), (True, 0))
+
+    def test_lockout_doubles_up_to_max(self):
+        self.fail_at(self.NOW, 4)
+        self.assertEqual(self.check_at(self.NOW), (False, 61))
+        self.fail_at(self.NOW, 3)
+        self.assertEqual(self.check_at(self.NOW), (False, 101))
+
+    def test_previous_window_is_weighted(self):
+        self.fail_at(self.NOW, 2)
+        # Half-way through the next window the 2 earlier failures count as 1
+        self.fail_at(self.NOW + 900 + 450)
+        self.assertEqual(self.check_at(self.NOW + 900 + 450), (True, 0))
+        self.fail_at(self.NOW + 900 + 450)
+        self.assertEqual(self.check_at(self.NOW + 900 + 450), (False, 31))
+
+    def test_success_clears_username(self):
+        self.fail_at(self.NOW, 3)
+        with mock.patch.object(login_guard.time, 'time', return_value=self.NOW):
+            login_guard.record_login_success('juan', None)
+        self.assertEqual(self.check_at(self.NOW), (True, 0))
+
+
+# =========================
+# Activity log
+# =========================
+class ClientIpTests(SimpleTestCase):
+    def request(self, forwarded=None):
+        extra = {'REMOTE_ADDR': '10.0.0.5'}
+        if forwarded is not None:
+            extra['HTTP_X_FORWARDED_FOR'] = forwarded
+        return RequestFactory().get('/', **extra)
+
+    @override_settings(USE_X_FORWARDED_FOR=False)
+    def test_header_ignored_when_off(self):
+        self.assertEqual(activity_log.client_ip(self.request('203.0.113.9')), '10.0.0.5')
+
+    @override_settings(USE_X_FORWARDED_FOR=True, TRUSTED_PROXY_COUNT=1)
+    def test_client_written_entries_ignored(self):
+        # The client sent "127.0.0.1, 1.2.3.4"; our proxy appended the address it saw
+        self.assertEqual(activity_log.client_ip(self.request('127.0.0.1, 1.2.3.4, 203.0.113.9')), '203.0.113.9')
+        self.assertEqual(activity_log.client_ip(self.request('203.0.113.9')), '203.0.113.9')
+
+    @override_settings(USE_X_FORWARDED_FOR=True, TRUSTED_PROXY_COUNT=2)
+    def test_two_proxies(self):
+        self.assertEqual(activity_log.client_ip(self.request('127.0.0.1, 203.0.113.9, 10.0.0.2')), '203.0.113.9')
+        # Fewer entries than trusted proxies: not a request that came through them
+        self.assertEqual(activity_log.client_ip(self.request('203.0.113.9')), '10.0.0.5')
+        self.assertEqual(activity_log.client_ip(self.request()), '10.0.0.5')
+
+
+class OfficeChainTests(SimpleTestCase):
+    def test_parents_filled_in(self):
+        tree = mock.Mock()
+        tree.cenro_penro_id.return_value = 20
+        tree.penro_region_id.return_value = 3
+        with mock.patch.object(activity_log, 'get_office_tree', return_value=tree):
+            self.assertEqual(activity_log._office_chain(None, None, 100), (3, 20, 100))
+            self.assertEqual(activity_log._office_chain(None, 21, None), (3, 21, None))
+        tree.penro_region_id.assert_called_with(21)
+        self.assertEqual(activity_log._office_chain(4, None, None), (4, None, None))
+
+
+@override_settings(ACTIVITY_LOG_BATCH_SIZE=10, ACTIVITY_LOG_BUFFER_MAX=5)
+class ActivityLogFlushTests(SimpleTestCase):
+    def setUp(self):
+        self.buffer = deque()
+        self.stats = dict.fromkeys(activity_log._stats, 0)
+        self.written = []
+        for name, value in (('_buffer', self.buffer), ('_stats', self.stats)):
+            patcher = mock.patch.object(activity_log, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def event(self, user_id):
+        return (user_id, 'login', None, None, None)
+
+    def write_batch(self, events):
+        if any(event[0] == 'deleted' for event in events):
+            raise IntegrityError('activity_logs_user_id_fkey')
+        self.written.extend(events)
+
+    def test_rejected_rows_are_dropped(self):
+        self.buffer.extend([self.event(1), self.event('deleted'), self.event(2)])
+        with mock.patch.object(activity_log, '_write_batch', self.write_batch):
+            self.assertEqual(activity_log.flush(), 2)
+        self.assertEqual([event[0] for event in self.written], [1, 2])
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.stats['rejected'], 1)
+        self.assertEqual(self.stats['written'], 2)
+
+    def test_unreachable_database_requeues_within_cap(self):
+        self.buffer.extend(self.event(i) for i in range(4))
+        with mock.patch.object(activity_log, '_write_batch', side_effect=OperationalError('down')):
+            self.assertEqual(activity_log.flush(), 0)
+        self.assertEqual([event[0] for event in self.buffer], [0, 1, 2, 3])
+        self.assertEqual(self.stats['failed_flushes'], 1)
+
+        # New events arriving while the batch was out push the oldest past the cap
+        def write_batch(events):
+            self.buffer.extend(self.event(i) for i in range(10, 13))
+            raise OperationalError('down')
+        with mock.patch.object(activity_log, '_write_batch', write_batch):
+            activity_log.flush()
+        self.assertEqual([event[0] for event in self.buffer], [2, 3, 10, 11, 12])
+        self.assertEqual(self.stats['dropped'], 2)
+
+
+# =========================
+# Signatures
+# =========================
+def _png(image):
+    out = io.BytesIO()
+    image.save(out, format='PNG')
+    return out.getvalue()
+
+
+def _signature_drawing(background, ink):
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGBA', (200, 80), background)
+    draw = ImageDraw.Draw(image)
+    draw.line((30, 40, 90, 20, 150, 50), fill=ink, width=4)
+    draw.rectangle((60, 55, 120, 60), fill=ink)
+    return _png(image)
+
+
+class SignatureNormalizeTests(SimpleTestCase):
+    def test_same_drawing_same_bytes(self):
+        transparent = signatures.normalize_signature(_signature_drawing((0, 0, 0, 0), (0, 0, 0, 255)))
+        opaque = signatures.normalize_signature(_signature_drawing((255, 255, 255, 255), (0, 0, 0, 255)))
+        self.assertEqual(transparent, opaque)
+        self.assertEqual(signatures.signature_key(transparent), signatures.signature_key(opaque))
+
+    def test_hidden_colour_ignored(self):
+        # A transparent canvas cleared to white-but-transparent is the same drawing
+        cleared = signatures.normalize_signature(_signature_drawing((255, 255, 255, 0), (0, 0, 0, 255)))
+        transparent = signatures.normalize_signature(_signature_drawing((0, 0, 0, 0), (0, 0, 0, 255)))
+        self.assertEqual(cleared, transparent)
+
+    def test_cropped_to_ink(self):
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(signatures.normalize_signature(
+            _signature_drawing((255, 255, 255, 255), (0, 0, 0, 255)))))
+        self.assertLess(image.width, 200)
+        self.assertLess(image.height, 80)
+
+    def test_empty_rejected(self):
+        from PIL import Image
+
+        with self.assertRaises(ValueError):
+            signatures.normalize_signature(_png(Image.new('RGBA', (50, 50), (255, 255, 255, 255))))
+        with self.assertRaises(ValueError):
+            signatures.normalize_signature(_png(Image.new('RGBA', (50, 50), (0, 0, 0, 0))))
+        with self.assertRaises(ValueError):
+            signatures.normalize_signature(b'not an image')
+
+
+class SignatureDecodeTests(SimpleTestCase):
+    def test_round_trip(self):
+        dataurl = 'data:image/png;base64,' + base64.b64encode(b'signature').decode()
+        self.assertEqual(signatures.decode_signature(dataurl), b'signature')
+
+    def test_rejected(self):
+        for value in ('', None, 'hello', 'https://example.com/a.png', 'data:image/png;base64,@@@',
+                      'data:image/png;base64'):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                signatures.decode_signature(value)
+
+    @override_settings(SIGNATURE_MAX_BYTES=16)
+    def test_oversized(self):
+        self.assertEqual(len(signatures.decode_signature(
+            'data:image/png;base64,' + base64.b64encode(b'x' * 16).decode())), 16)
+        with self.assertRaises(ValueError):
+            signatures.decode_signature('data:image/png;base64,' + base64.b64encode(b'x' * 17).decode())
+
+
+class SignatureOutboxTests(SimpleTestCase):
+    def setUp(self):
+        outbox = tempfile.TemporaryDirectory()
+        self.addCleanup(outbox.cleanup)
+        settings_patch = override_settings(SIGNATURE_OUTBOX_DIR=outbox.name)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+
+        self.backend = MemoryBackend('/media')
+        self.storage = StorageGateway()
+        self.storage.configure(self.backend)
+        for patch in (
+            mock.patch.object(signatures, 'storage', self.storage),
+            mock.patch.object(signatures, '_backoff', {}),
+            mock.patch.object(signatures, 'ensure_worker'),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.data = b'normalized signature'
+        self.key = signatures.signature_key(self.data)
+        self.digest = signatures._digest(self.key)
+        signatures.enqueue_upload(self.key, self.data)
+        self.path = os.path.join(outbox.name, f'{self.digest}.png')
+
+    def test_upload_removes_file(self):
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(signatures.drain_outbox(), (1, 0))
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self.storage.download(self.key), self.data)
+        self.assertEqual(signatures.drain_outbox(), (0, 0))
+
+    def test_failure_backs_off(self):
+        with mock.patch.object(self.storage, 'upload', side_effect=StorageError('down', 503)) as upload:
+            self.assertEqual(signatures.drain_outbox(), (0, 1))
+            self.assertTrue(os.path.exists(self.path))
+            self.assertEqual(signatures._backoff[self.digest][0], 1)
+            # Not due yet: the next drain leaves it alone
+            self.assertEqual(signatures.drain_outbox(), (0, 0))
+            self.assertEqual(upload.call_count, 1)
+
+        # Once due it is retried, and success clears the backoff
+        signatures._backoff[self.digest] = (1, 0)
+        self.assertEqual(signatures.drain_outbox(), (1, 0))
+        self.assertNotIn(self.digest, signatures._backoff)
+        self.assertFalse(os.path.exists(self.path))
+
+
+# =========================
+# Storage gateway
+# =========================
+@override_settings(STORAGE_TIMEOUT=5, STORAGE_RETRIES=2)
+class StorageRetryTests(SimpleTestCase):
+    def setUp(self):
+        patch = mock.patch.object(storage_module.time, 'sleep')
+        self.sleep = patch.start()
+        self.addCleanup(patch.stop)
+        self.gateway = StorageGateway()
+
+    def test_read_retried(self):
+        fn = mock.Mock(side_effect=[_TransientStorageError('503', 503), 'rows'])
+        self.assertEqual(self.gateway._call('select', fn), 'rows')
+        self.assertEqual(fn.call_count, 2)
+        fn.assert_called_with(timeout=5)
+        self.sleep.assert_called_once_with(0.2)
+
+    def test_read_gives_up(self):
+        fn = mock.Mock(side_effect=_TransientStorageError('503', 503))
+        with self.assertRaises(StorageError) as raised:
+            self.gateway._call('select', fn)
+        self.assertNotIsInstance(raised.exception, _TransientStorageError)
+        self.assertEqual(raised.exception.status, 503)
+        self.assertEqual(fn.call_count, 3)
+        self.assertEqual(self.gateway.stats()['select']['errors'], 3)
+
+    def test_write_retried_only_when_unsent(self):
+        fn = mock.Mock(side_effect=[_TransientStorageError('connect', sent=False), 'row'])
+        self.assertEqual(self.gateway._call('insert', fn, idempotent=False), 'row')
+        self.assertEqual(fn.call_count, 2)
+
+        fn = mock.Mock(side_effect=_TransientStorageError('read timeout'))
+        with self.assertRaises(StorageError):
+            self.gateway._call('insert', fn, idempotent=False)
+        self.assertEqual(fn.call_count, 1)
+        self.sleep.assert_called_once()
+
+    def test_plain_error_not_retried(self):
+        fn = mock.Mock(side_effect=StorageError('not found', 404))
+        with self.assertRaises(StorageError):
+            self.gateway._call('download', fn)
+        self.assertEqual(fn.call_count, 1)
+        self.sleep.assert_not_called()
+
+    def test_simulated_failures(self):
+        backend = SimulatedBackend(MemoryBackend('/media'), error_rate=1.0, operations=['upload'], seed=1)
+        self.gateway.configure(backend)
+        # A plain upload may already have landed, so it is not repeated
+        with self.assertRaises(StorageError):
+            self.gateway.upload('a.png', b'png')
+        self.assertEqual(backend.injected['errors'], 1)
+        # An upsert writes the same bytes again, so it is
+        with self.assertRaises(StorageError):
+            self.gateway.upload('a.png', b'png', upsert=True)
+        self.assertEqual(backend.injected['errors'], 4)
+        # Operations not listed pass straight through
+        with self.assertRaises(StorageError) as raised:
+            self.gateway.download('a.png')
+        self.assertEqual(raised.exception.status, 404)
+
+
+class LocalBackendPathTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = os.path.realpath(root.name)
+        self.backend = LocalBackend(self.root, '/media')
+
+    def test_inside_bucket(self):
+        self.assertEqual(self.backend._object_file('photos', 'reports/1/a.jpg'),
+                         os.path.join(self.root, 'storage', 'photos', 'reports', '1', 'a.jpg'))
+
+    def test_traversal_rejected(self):
+        for path in ('../a.jpg', '../photos2/a.jpg', 'reports/../../a.jpg', '/etc/passwd', '', '.'):
+            with self.subTest(path=path), self.assertRaises(StorageError) as raised:
+                self.backend._object_file('photos', path)
+            self.assertEqual(raised.exception.status, 400)
+
+    def test_symlink_out_rejected(self):
+        outside = tempfile.TemporaryDirectory()
+        self.addCleanup(outside.cleanup)
+        os.makedirs(os.path.join(self.root, 'storage', 'photos'))
+        os.symlink(outside.name, os.path.join(self.root, 'storage', 'photos', 'link'))
+        with self.assertRaises(StorageError):
+            self.backend._object_file('photos', 'link/a.jpg')
+
+    def test_upload_outside_refused(self):
+        gateway = StorageGateway()
+        gateway.configure(self.backend)
+        with self.assertRaises(StorageError):
+            gateway.upload('../../escaped.txt', b'x', bucket='photos')
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'escaped.txt')))
+
+
+# =========================
+# Export jobs
+# =========================
+class ExportJobKeyTests(SimpleTestCase):
+    def test_stable(self):
+        filters = {'date_from': date(2024, 1, 1), 'status': 'approved'}
+        key = export_jobs.export_job_key(7, 'csv', filters)
+        self.assertEqual(key, export_jobs.export_job_key(7, 'csv', {'status': 'approved', 'date_from': date(2024, 1, 1)}))
+        self.assertRegex(key, r'^[0-9a-f]{32}$')
+        # Unknown formats render as PDF, so they share its job
+        self.assertEqual(export_jobs.export_job_key(7, 'bogus', {}), export_jobs.export_job_key(7, 'pdf', {}))
+
+    def test_differs(self):
+        base = export_jobs.export_job_key(7, 'csv', {'status': 'approved'})
+        for other in (
+            export_jobs.export_job_key(8, 'csv', {'status': 'approved'}),
+            export_jobs.export_job_key(7, 'excel', {'status': 'approved'}),
+            export_jobs.export_job_key(7, 'csv', {'status': 'pending'}),
+            export_jobs.export_job_key(7, 'csv', {'status': 'approved', 'date_from': date(2024, 1, 1)}),
+        ):
+            self.assertNotEqual(base, other)
+
+
+@override_settings(EXPORT_ARTIFACT_TTL=900)
+class ExportJobStatusTests(SimpleTestCase):
+    def setUp(self):
+        artifacts = tempfile.TemporaryDirectory()
+        self.addCleanup(artifacts.cleanup)
+        self.dir = artifacts.name
+        settings_patch = override_settings(EXPORT_ARTIFACT_DIR=self.dir)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        inflight = mock.patch.object(export_jobs, '_inflight', set())
+        inflight.start()
+        self.addCleanup(inflight.stop)
+
+    def job(self, job_id, status, age=0, finished_age=None, artifact=True):
+        now = time.time()
+        record = {
+            'job_id': job_id,
+            'cenro_id': 7,
+            'format': 'csv',
+            'status': status,
+            'updated_at': now - age,
+            'finished_at': None if finished_age is None else now - finished_age,
+            'error': None,
+        }
+        with open(os.path.join(self.dir, f'{job_id}.json'), 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        if artifact:
+            with open(os.path.join(self.dir, f'{job_id}.csv'), 'wb') as f:
+                f.write(b'id\n')
+        return record
+
+    def test_fresh(self):
+        self.assertTrue(export_jobs._is_fresh(self.job('a', 'done', finished_age=60)))
+        self.assertFalse(export_jobs._is_fresh(self.job('b', 'done', finished_age=1000)))
+        self.assertFalse(export_jobs._is_fresh(self.job('c', 'done', finished_age=60, artifact=False)))
+        self.assertFalse(export_jobs._is_fresh(self.job('d', 'running')))
+
+    def test_alive(self):
+        self.assertTrue(export_jobs._is_alive(self.job('a', 'queued')))
+        self.assertTrue(export_jobs._is_alive(self.job('b', 'running', age=export_jobs.EXPORT_JOB_STALE_AFTER - 10)))
+        self.assertFalse(export_jobs._is_alive(self.job('c', 'running', age=export_jobs.EXPORT_JOB_STALE_AFTER + 10)))
+        self.assertFalse(export_jobs._is_alive(self.job('d', 'done')))
+
+    def test_status_transitions(self):
+        self.assertIsNone(export_jobs.get_export_status('missing'))
+
+        self.job('done', 'done', finished_age=60)
+        self.assertEqual(export_jobs.get_export_status('done')['status'], 'done')
+        self.assertIsNotNone(export_jobs.get_export_artifact('done'))
+
+        self.job('old', 'done', finished_age=1000)
+        self.assertEqual(export_jobs.get_export_status('old')['status'], 'expired')
+        self.assertIsNone(export_jobs.get_export_artifact('old'))
+
+        self.job('running', 'running', age=10)
+        self.assertEqual(export_jobs.get_export_status('running')['status'], 'running')
+
+        self.job('stuck', 'running', age=export_jobs.EXPORT_JOB_STALE_AFTER + 10)
+        status = export_jobs.get_export_status('stuck')
+        self.assertEqual(status['status'], 'failed')
+        self.assertEqual(status['error'], 'Export job stopped responding')
+
+    def test_purge_keeps_running_jobs(self):
+        self.job('running', 'running', age=10)
+        # Quiet for longer than the TTL, but its worker still holds it
+        self.job('busy', 'running', age=1000)
+        export_jobs._inflight.add('busy')
+        self.job('recent', 'done', age=60, finished_age=60)
+        self.job('old', 'done', age=1000, finished_age=1000)
+        self.job('dead', 'running', age=1000)
+
+        export_jobs.purge_expired_exports()
+
+        remaining = set(os.listdir(self.dir))
+        for job_id in ('running', 'busy', 'recent'):
+            self.assertIn(f'{job_id}.json', remaining)
+            self.assertIn(f'{job_id}.csv', remaining)
+        for job_id in ('old', 'dead'):
+            self.assertNotIn(f'{job_id}.json', remaining)
+            self.assertNotIn(f'{job_id}.csv', remaining)
+
+
+# =========================
+# Report details cache
+# =========================
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'denro-tests-report-cache',
+}})
+class ReportCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.loader = mock.Mock(side_effect=lambda ids: {report_id: {'id': report_id} for report_id in ids})
+
+    @override_settings(CACHE_SHARED=True)
+    def test_invalidate_reloads(self):
+        self.assertEqual(report_cache.get_many([1, 2], 7, self.loader), {1: {'id': 1}, 2: {'id': 2}})
+        self.assertEqual(report_cache.get_many([1, 2], 7, self.loader), {1: {'id': 1}, 2: {'id': 2}})
+        self.loader.assert_called_once_with([1, 2])
+
+        report_cache.invalidate_reports([2])
+        self.assertEqual(report_cache.get_many([1, 2], 7, self.loader), {1: {'id': 1}, 2: {'id': 2}})
+        self.assertEqual(self.loader.call_count, 2)
+        self.loader.assert_called_with([2])
+
+    @override_settings(CACHE_SHARED=True)
+    def test_scoped_by_office(self):
+        report_cache.get_many([1], 7, self.loader)
+        report_cache.get_many([1], None, self.loader)
+        self.assertEqual(self.loader.call_count, 2)
+
+    @override_settings(CACHE_SHARED=False)
+    def test_not_shared_not_cached(self):
+        report_cache.get_many([1, 2], 7, self.loader)
+        report_cache.get_many([1, 2], 7, self.loader)
+        self.assertEqual(self.loader.call_count, 2)
+        report_cache.invalidate_reports([1])
+        self.assertIsNone(cache.get(report_cache._version_key(1)))
+        self.assertIsNone(cache.get(report_cache._version_key(2)))
+
+
+# =========================
+# GeoJSON cache
+# =========================
+class GeoJSONCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.dir = cache_dir.name
+
+    def disk_files(self):
+        return {name for name in os.listdir(self.dir) if name.endswith('.geojson')}
+
+    def test_memory_lru(self):
+        cache = GeoJSONCache(self.dir, memory_bytes=10, disk_bytes=1000)
+        cache.set('a.zip', 1, b'aaaa')
+        cache.set('b.zip', 1, b'bbbb')
+        self.assertEqual(cache.get('a.zip', 1), b'aaaa')
+        cache.set('c.zip', 1, b'cccc')
+        # b was the least recently used, so it left memory but is still on disk
+        self.assertEqual(set(cache._memory), {cache._disk_path('a.zip', 1), cache._disk_path('c.zip', 1)})
+        self.assertEqual(cache._memory_size, 8)
+        self.assertEqual(cache.get('b.zip', 1), b'bbbb')
+        # Entries larger than the whole tier are not kept in memory at all
+        cache.set('big.zip', 1, b'x' * 11)
+        self.assertNotIn(cache._disk_path('big.zip', 1), cache._memory)
+
+    def test_disk_lru(self):
+        cache = GeoJSONCache(self.dir, memory_bytes=1000, disk_bytes=10)
+        cache.set('a.zip', 1, b'aaaa')
+        cache.set('b.zip', 1, b'bbbb')
+        os.utime(cache._disk_path('a.zip', 1), (2000, 2000))
+        os.utime(cache._disk_path('b.zip', 1), (1000, 1000))
+        cache.set('c.zip', 1, b'cccc')
+        self.assertEqual(self.disk_files(), {
+            os.path.basename(cache._disk_path('a.zip', 1)),
+            os.path.basename(cache._disk_path('c.zip', 1)),
+        })
+        # A fresh process only has the disk tier to go on
+        other = GeoJSONCache(self.dir, memory_bytes=1000, disk_bytes=10)
+        self.assertIsNone(other.get('b.zip', 1))
+        self.assertEqual(other.get('a.zip', 1), b'aaaa')
+
+    def test_invalidate_all_versions(self):
+        cache = GeoJSONCache(self.dir, memory_bytes=1000, disk_bytes=1000)
+        cache.set('a.zip', 1, b'one')
+        cache.set('a.zip', 2, b'two')
+        cache.set('b.zip', 1, b'bbb')
+        cache.invalidate('a.zip')
+        self.assertIsNone(cache.get('a.zip', 1))
+        self.assertIsNone(cache.get('a.zip', 2))
+        self.assertEqual(cache.get('b.zip', 1), b'bbb')
+        self.assertEqual(set(cache._memory), {cache._disk_path('b.zip', 1)})
+        self.assertEqual(self.disk_files(), {os.path.basename(cache._disk_path('b.zip', 1))})
+
+    def test_memory_hit_needs_disk_file(self):
+        cache = GeoJSONCache(self.dir, memory_bytes=1000, disk_bytes=1000)
+        cache.set('a.zip', 1, b'aaaa')
+        # Another process invalidated the entry
+        os.remove(cache._disk_path('a.zip', 1))
+        self.assertIsNone(cache.get('a.zip', 1))
+        self.assertEqual(cache._memory_size, 0)
+        self.assertFalse(cache._memory)
+
+
+# =========================
+# Map geometry
+# =========================
+def _feature(coordinates, bbox=None, name='area'):
+    feature = {'type': 'Feature', 'properties': {'name': name}, 'geometry': {'type': 'Polygon', 'coordinates': coordinates}}
+    if bbox:
+        feature['bbox'] = bbox
+    return feature
+
+
+class ZoomLevelTests(SimpleTestCase):
+    def test_zoom(self):
+        self.assertIsNone(geometry.resolve_zoom_level())
+        self.assertEqual(geometry.resolve_zoom_level(zoom=0), 6)
+        self.assertEqual(geometry.resolve_zoom_level(zoom=6), 6)
+        self.assertEqual(geometry.resolve_zoom_level(zoom=6.5), 8)
+        self.assertEqual(geometry.resolve_zoom_level(zoom=14), 14)
+        self.assertIsNone(geometry.resolve_zoom_level(zoom=14.01))
+        self.assertIsNone(geometry.resolve_zoom_level(zoom=18))
+
+    def test_tolerance(self):
+        for level in geometry.SIMPLIFY_ZOOM_LEVELS:
+            with self.subTest(level=level):
+                tolerance = geometry.zoom_to_tolerance(level)
+                self.assertEqual(geometry.resolve_zoom_level(tolerance=tolerance), level)
+                # A slightly coarser tolerance still needs this level, not the next one
+                self.assertEqual(geometry.resolve_zoom_level(tolerance=tolerance * 1.01), level)
+        self.assertEqual(geometry.resolve_zoom_level(tolerance=geometry.zoom_to_tolerance(9)), 10)
+        self.assertIsNone(geometry.resolve_zoom_level(tolerance=geometry.zoom_to_tolerance(14) * 0.99))
+        self.assertIsNone(geometry.resolve_zoom_level(tolerance=0))
+        self.assertIsNone(geometry.resolve_zoom_level(tolerance=-1))
+        # An explicit zoom wins over a tolerance
+        self.assertEqual(geometry.resolve_zoom_level(zoom=8, tolerance=geometry.zoom_to_tolerance(14)), 8)
+
+
+class BboxTests(SimpleTestCase):
+    def test_parse(self):
+        self.assertEqual(geometry.parse_bbox('120.5,13,121,14.25'), (120.5, 13.0, 121.0, 14.25))
+        self.assertEqual(geometry.parse_bbox('1,1,1,1'), (1.0, 1.0, 1.0, 1.0))
+        for value in (None, '', '1,2,3', '1,2,3,4,5', 'a,b,c,d', '1,2,,4', '3,0,1,1', '0,3,1,1'):
+            with self.subTest(value=value):
+                self.assertIsNone(geometry.parse_bbox(value))
+
+    def test_filter(self):
+        inside = _feature([[[1, 1], [2, 1], [2, 2], [1, 1]]], bbox=[1, 1, 2, 2], name='inside')
+        touching = _feature([[[3, 3], [4, 3], [4, 4], [3, 3]]], bbox=[3, 3, 4, 4], name='touching')
+        outside = _feature([[[5, 5], [6, 5], [6, 6], [5, 5]]], bbox=[5, 5, 6, 6], name='outside')
+        # No bbox member: bounds come from the geometry itself
+        unboxed = _feature([[[0, 0], [0.5, 0], [0.5, 0.5], [0, 0]]], name='unboxed')
+        empty = {'type': 'Feature', 'properties': {}, 'geometry': None}
+        collection = {'type': 'FeatureCollection', 'features': [inside, touching, outside, unboxed, empty]}
+
+        kept = geometry.filter_bbox(collection, (0.25, 0.25, 3, 3))
+        self.assertEqual([f['properties']['name'] for f in kept['features']], ['inside', 'touching', 'unboxed'])
+        self.assertEqual(geometry.filter_bbox(collection, (10, 10, 11, 11))['features'], [])
+
+
+class TopoJSONTests(SimpleTestCase):
+    @staticmethod
+    def decode_arc(arc, transform):
+        (kx, ky), (x0, y0) = transform['scale'], transform['translate']
+        x = y = 0
+        positions = []
+        for dx, dy in arc:
+            x += dx
+            y += dy
+            positions.append((x * kx + x0, y * ky + y0))
+        return positions
+
+    def test_polygon_round_trip(self):
+        shell = [[120.0, 13.0], [121.0, 13.0], [121.0, 14.0], [120.0, 14.0], [120.0, 13.0]]
+        hole = [[120.25, 13.25], [120.25, 13.5], [120.5, 13.5], [120.25, 13.25]]
+        collection = {'type': 'FeatureCollection', 'features': [_feature([shell, hole], name='park')]}
+
+        topology = geometry.to_topojson(collection, quantization=1001)
+        self.assertEqual(topology['type'], 'Topology')
+        [encoded] = topology['objects']['protected_area']['geometries']
+        self.assertEqual(encoded['type'], 'Polygon')
+        self.assertEqual(encoded['properties'], {'name': 'park'})
+        self.assertEqual(encoded['arcs'], [[0], [1]])
+
+        for index, ring in enumerate((shell, hole)):
+            decoded = self.decode_arc(topology['arcs'][index], topology['transform'])
+            self.assertEqual(len(decoded), len(ring))
+            for (x, y), (expected_x, expected_y) in zip(decoded, ring):
+                self.assertAlmostEqual(x, expected_x, places=6)
+                self.assertAlmostEqual(y, expected_y, places=6)
+
+    def test_empty(self):
+        topology = geometry.to_topojson({'type': 'FeatureCollection', 'features': []})
+        self.assertEqual(topology['arcs'], [])
+        self.assertEqual(topology['objects']['protected_area']['geometries'], [])
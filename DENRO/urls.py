@@ -1,6 +1,8 @@
 # urls.py
-from django.urls import path
+from django.conf import settings
+from django.urls import path, re_path
 from django.shortcuts import redirect
+from django.views.static import serve
 from . import views, operation
 
 urlpatterns = [
@@ -16,6 +18,13 @@ urlpatterns = [
     # Cascading select APIs
     path('api/penros/<int:region_id>/', operation.api_penros_by_region, name='api-penros-by-region'),
     path('api/cenros/<int:penro_id>/', operation.api_cenros_by_penro, name='api-cenros-by-penro'),
+    path('api/offices/', operation.api_office_tree, name='api-office-tree'),
+    path('api/activity-logs/', views.api_activity_logs, name='api-activity-logs'),
+    path('api/report-stats/', views.api_report_stats, name='api-report-stats'),
+    path('api/reports/search/', views.api_report_search, name='api-report-search'),
+    path('api/login-throttle/stats/', views.api_login_throttle_stats, name='api-login-throttle-stats'),
+    path('api/db-pool/stats/', views.api_db_pool_stats, name='api-db-pool-stats'),
+    path('metrics', views.metrics_endpoint, name='metrics'),
 
     # Dashboards
     path('sa/dashboard/',     views.superadmin_dashboard, name='SA-dashboard'),
@@ -41,9 +50,15 @@ urlpatterns = [
     path('penro/user-management/', views.penro_usermanagement, name='PENRO-usermanagement'),
     path('penro/profile/', views.penro_profile, name='PENRO-profile'),
     path('cenro/reports/export/', views.cenro_export_reports, name='CENRO-reports-export'),
+    path('cenro/reports/export/jobs/', views.cenro_export_job_create, name='CENRO-export-job-create'),
+    path('cenro/reports/export/jobs/<str:job_id>/', views.cenro_export_job_status, name='CENRO-export-job-status'),
+    path('cenro/reports/export/jobs/<str:job_id>/download/', views.cenro_export_job_download, name='CENRO-export-job-download'),
+    path('cenro/reports/details/', views.cenro_report_details_batch, name='CENRO-report-details-batch'),
     path('cenro/reports/<int:report_id>/details/', views.cenro_report_details, name='CENRO-report-details'),
     path('cenro/reports/<int:report_id>/attest/', views.cenro_attest_report, name='CENRO-report-attest'),
     path('cenro/reports/<int:report_id>/note/', views.cenro_note_report, name='CENRO-report-note'),
+    path('cenro/reports/sign/', views.cenro_sign_reports, name='CENRO-reports-sign'),
+    path('signatures/<str:digest>.png', views.signature_image, name='signature-image'),
     path('cenro/templates/',     views.cenro_templates,    name='CENRO-templates'),
     path("cenro/activity-logs/", views.cenro_activitylogs, name="cenro_activity_logs"),
 
@@ -51,4 +66,15 @@ urlpatterns = [
     path('admin/protected-areas/', views.protected_areas, name='protected-areas'),
     path('admin/protected-areas/convert/<path:file_path>/', views.convert_shapefile_to_geojson, name='convert-shapefile'),
 
-]
\ No newline at end of file
+]
+
+# Local storage backend: serve stored objects the way Supabase serves public URLs
+if settings.STORAGE_BACKEND == 'local':
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.STORAGE_LOCAL_URL.lstrip('/'), serve,
+                {'document_root': settings.STORAGE_LOCAL_ROOT / 'storage'}),
+    ]
+elif settings.STORAGE_BACKEND in ('memory', 'simulated'):
+    urlpatterns += [
+        re_path(r'^%s(?P<bucket>[^/]+)/(?P<path>.+)$' % settings.STORAGE_LOCAL_URL.lstrip('/'), views.storage_object),
+    ]
@@ -1,21 +1,47 @@
 # views.py
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.http import JsonResponse, FileResponse, HttpResponse, Http404
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from asgiref.sync import sync_to_async
 from .operation import (
     login_user,
     create_account,
     get_enumerator_reports,
+    get_enumerator_reports_page,
+    search_enumerator_reports,
     get_establishment_types_for_cenro,
     get_protected_areas_for_cenro,
-    get_report_details,
-    get_report_images,
+    get_report_payloads,
+    sign_reports,
     get_activity_logs,
+    get_activity_logs_page,
+    get_activity_action_names,
+    ACTIVITY_LOGS_PAGE_SIZE,
     export_reports,
+    iter_enumerator_reports,
+    stream_export_reports,
+    STREAMING_EXPORT_FORMATS,
+    REPORTS_PAGE_SIZE,
+    REPORT_SEARCH_MIN_LENGTH,
 )
 from django.contrib import messages
 from .decorators import login_required, role_required, can_create_users
+from .office_tree import get_office_tree
+from .principal import get_principal
+from . import activity_log, dashboard_stats, export_jobs, geometry, login_guard, metrics, signatures
+from .io_pool import gather_io, run_io
+from .db_pool import pool_stats
+from .storage import StorageError, storage
+from .geojson_cache import geojson_cache
 from datetime import datetime 
-import os
+import functools
+import hmac
+import json
+import mimetypes
 from django.shortcuts import render
 # moved get_activity_logs import into the grouped import above
 
@@ -32,7 +58,7 @@ def create_account_view(request):
 @login_required
 @role_required(['Super Admin'])
 def superadmin_dashboard(request):
-    return render(request, 'SUPER_ADMIN/SA_dashboard.html')
+    return render(request, 'SUPER_ADMIN/SA_dashboard.html', dashboard_stats.get_user_counts())
 
 @login_required
 @role_required(['Super Admin'])
@@ -49,10 +75,34 @@ def sa_pending_registration(request):
 def sa_authentication_logs(request):
     return render(request, 'SUPER_ADMIN/authentication_logs.html')
 
+@login_required
+@role_required(['Super Admin'])
+def api_login_throttle_stats(request):
+    """Login throttle counters of this worker process (attempts, failures, lockouts, rejections)."""
+    return JsonResponse(login_guard.stats())
+
+@login_required
+@role_required(['Super Admin'])
+def api_db_pool_stats(request):
+    """Database connection pool usage of this worker process (null when pooling is off)."""
+    return JsonResponse({'default': pool_stats()})
+
+def metrics_endpoint(request):
+    """Prometheus scrape target for this worker process (bearer METRICS_TOKEN, or METRICS_ALLOWED_IPS)."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if settings.METRICS_TOKEN:
+        allowed = hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {settings.METRICS_TOKEN}")
+    else:
+        allowed = activity_log.client_ip(request) in settings.METRICS_ALLOWED_IPS
+    if not allowed:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @login_required
 @role_required(['Super Admin'])
 def sa_activity_logs(request):
-    return render(request, 'SUPER_ADMIN/activity_logs.html')
+    return render(request, 'SUPER_ADMIN/activity_logs.html', _activity_logs_context(request))
 
 @login_required
 @role_required(['Super Admin'])
@@ -77,7 +127,7 @@ def penro_dashboard(request):
 @login_required
 @role_required(['PENRO'])
 def penro_activitylogs(request):
-    return render(request, 'PENRO/PENRO_activitylogs.html')
+    return render(request, 'PENRO/PENRO_activitylogs.html', _activity_logs_context(request))
 
 @login_required
 @role_required(['PENRO'])
@@ -102,58 +152,233 @@ def cenro_dashboard(request):
 @login_required
 @role_required(['CENRO'])
 def cenro_activitylogs(request):
-    return render(request, 'CENRO/CENRO_activitylogs.html')
+    return render(request, 'CENRO/CENRO_activitylogs.html', _activity_logs_context(request))
+
+def _activity_log_scope(request):
+    """Office scope of the logged-in user; Super Admins see every office."""
+    principal = get_principal(request)
+    office_keys = {'cenro': 'cenro_id', 'penro': 'penro_id', 'admin': 'region_id'}
+    if principal.role not in office_keys:
+        return {}
+    office_id = getattr(principal, office_keys[principal.role])
+    if not office_id:
+        # No office assigned: only the user's own actions
+        return {'user_id': principal.id}
+    return {office_keys[principal.role]: office_id}
+
+def _parse_activity_log_filters(request):
+    """Read the activity-log filter query parameters, dropping values that do not parse."""
+    def parse_date(value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+        except (ValueError, TypeError):
+            return None
 
-@login_required
-@role_required(['CENRO'])
-def cenro_reports(request):
-    # Get current user's CENRO ID from session
-    cenro_id = request.session.get('cenro_id')
-    
-    # Get filter parameters from query string
-    from_date_str = request.GET.get('from_date', None)
-    to_date_str = request.GET.get('to_date', None)
-    establishment_type = request.GET.get('establishment_type', None)
-    pa_id_str = request.GET.get('pa_id', None)
-    establishment_status = request.GET.get('establishment_status', None)
-    
-    # Convert date strings to date objects
-    from_date = None
-    to_date = None
-    
-    if from_date_str:
+    user_id = None
+    user_id_str = request.GET.get('user_id', None)
+    if user_id_str:
         try:
-            from_date = datetime.strptime(from_date_str, '%Y-%m-%d').date()
+            user_id = int(user_id_str)
         except (ValueError, TypeError):
-            from_date = None
-    
-    if to_date_str:
+            user_id = None
+
+    return {
+        'user_id': user_id,
+        'action': request.GET.get('action', None) or None,
+        'from_date': parse_date(request.GET.get('from_date', None)),
+        'to_date': parse_date(request.GET.get('to_date', None)),
+    }
+
+def _get_activity_logs_page(request):
+    filters = _parse_activity_log_filters(request)
+    page = get_activity_logs_page(
+        cursor=request.GET.get('cursor') or None,
+        page_size=request.GET.get('page_size') or ACTIVITY_LOGS_PAGE_SIZE,
+        **{**filters, **_activity_log_scope(request)}
+    )
+    return filters, page
+
+def _activity_logs_context(request):
+    filters, page = _get_activity_logs_page(request)
+    return {
+        'logs': page['logs'],
+        'actions': get_activity_action_names(),
+        'next_cursor': page['next_cursor'],
+        'has_more': page['has_more'],
+        'is_first_page': not request.GET.get('cursor'),
+        **filters,
+    }
+
+@login_required
+@role_required(['Super Admin', 'Admin', 'PENRO', 'CENRO'])
+def api_activity_logs(request):
+    """
+    JSON page of activity logs within the user's office, newest first.
+
+    Query: action, user_id, from_date, to_date (YYYY-MM-DD), cursor, page_size
+    """
+    filters, page = _get_activity_logs_page(request)
+    return JsonResponse({
+        'logs': page['logs'],
+        'next_cursor': page['next_cursor'],
+        'has_more': page['has_more'],
+        'page_size': page['page_size'],
+    })
+
+def _report_stats_scope(request):
+    """(cache scope, CENRO ids) whose reports the caller's statistics cover, or (None, []) when out of scope."""
+    principal = get_principal(request)
+    if principal.role == 'cenro':
+        return f"cenro:{principal.cenro_id}", [principal.cenro_id] if principal.cenro_id else []
+
+    cenro_ids = [cenro['id'] for cenro in get_office_tree().cenro_list(principal.penro_id)]
+    requested = request.GET.get('cenro_id')
+    if requested:
+        # A PENRO can narrow its statistics to one of its CENROs
+        try:
+            requested = int(requested)
+        except ValueError:
+            return None, []
+        if requested not in cenro_ids:
+            return None, []
+        return f"cenro:{requested}", [requested]
+    return f"penro:{principal.penro_id}", cenro_ids
+
+@login_required
+@role_required(['PENRO', 'CENRO'])
+def api_report_stats(request):
+    """
+    Report counts of the user's office per day, week or month, each broken down
+    by establishment type, establishment status and protected area.
+
+    Query: granularity (day, week or month; default day), from_date, to_date
+    (YYYY-MM-DD; default the last 30 days / 12 weeks / 12 months), and for
+    PENRO users an optional cenro_id. Buckets are whole days, weeks (from
+    Monday) or calendar months.
+    """
+    granularity = request.GET.get('granularity', 'day')
+    if granularity not in dashboard_stats.REPORT_STATS_GRANULARITIES:
+        return JsonResponse({'error': 'granularity must be day, week or month'}, status=400)
+
+    today = timezone.localdate()
+    from_date, to_date = dashboard_stats.default_range(granularity, today)
+    try:
+        if request.GET.get('from_date'):
+            from_date = datetime.strptime(request.GET['from_date'], '%Y-%m-%d').date()
+        if request.GET.get('to_date'):
+            to_date = datetime.strptime(request.GET['to_date'], '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'error': 'Dates must be YYYY-MM-DD'}, status=400)
+    if from_date > to_date:
+        return JsonResponse({'error': 'from_date is after to_date'}, status=400)
+
+    scope, cenro_ids = _report_stats_scope(request)
+    if scope is None:
+        return JsonResponse({'error': 'Office not found'}, status=404)
+
+    try:
+        buckets = dashboard_stats.get_report_stats(scope, cenro_ids, granularity, from_date, to_date, today)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'granularity': granularity,
+        'from_date': from_date.isoformat(),
+        'to_date': to_date.isoformat(),
+        'total': sum(bucket['total'] for bucket in buckets),
+        'buckets': buckets,
+    })
+
+def _report_search_scope(request):
+    """CENRO ids whose reports the caller may search, or None for every CENRO."""
+    principal = get_principal(request)
+    if principal.role == 'super admin':
+        return None
+    if principal.role == 'cenro':
+        return [principal.cenro_id] if principal.cenro_id else []
+    tree = get_office_tree()
+    if principal.role == 'penro':
+        return [cenro['id'] for cenro in tree.cenro_list(principal.penro_id)]
+    return [cenro['id']
+            for penro in tree.penro_list(principal.region_id)
+            for cenro in tree.cenro_list(penro['id'])]
+
+@login_required
+@role_required(['Super Admin', 'Admin', 'PENRO', 'CENRO'])
+def api_report_search(request):
+    """
+    Ranked search over reports within the user's office, best match first.
+
+    Query: q (establishment, proponent, informant or remark text), the report
+    filters (from_date, to_date, establishment_type, pa_id, establishment_status),
+    cursor, page_size
+    """
+    query = request.GET.get('q', '')
+    if len(query.strip()) < REPORT_SEARCH_MIN_LENGTH:
+        return JsonResponse({'error': f'q must be at least {REPORT_SEARCH_MIN_LENGTH} characters'}, status=400)
+
+    page = search_enumerator_reports(
+        query,
+        cenro_ids=_report_search_scope(request),
+        cursor=request.GET.get('cursor') or None,
+        page_size=request.GET.get('page_size') or REPORTS_PAGE_SIZE,
+        **_parse_report_filters(request)
+    )
+    return JsonResponse(page, encoder=DjangoJSONEncoder)
+
+def _parse_report_filters(request):
+    """Read the report filter query parameters, dropping values that do not parse."""
+    def parse_date(value):
         try:
-            to_date = datetime.strptime(to_date_str, '%Y-%m-%d').date()
+            return datetime.strptime(value, '%Y-%m-%d').date() if value else None
         except (ValueError, TypeError):
-            to_date = None
-    
-    # Convert pa_id to int if present
+            return None
+
     pa_id = None
+    pa_id_str = request.GET.get('pa_id', None)
     if pa_id_str:
         try:
             pa_id = int(pa_id_str)
         except (ValueError, TypeError):
             pa_id = None
+
+    return {
+        'from_date': parse_date(request.GET.get('from_date', None)),
+        'to_date': parse_date(request.GET.get('to_date', None)),
+        'establishment_type': request.GET.get('establishment_type', None) or None,
+        'pa_id': pa_id,
+        'establishment_status': request.GET.get('establishment_status', None) or None,
+    }
+
+@login_required
+@role_required(['CENRO'])
+async def cenro_reports(request):
+    # Get current user's CENRO ID from session
+    cenro_id = request.session.get('cenro_id')
     
-    # Fetch reports for this CENRO
-    reports = get_enumerator_reports(
-        cenro_id=cenro_id, 
-        from_date=from_date,
-        to_date=to_date,
-        establishment_type=establishment_type,
-        pa_id=pa_id,
-        establishment_status=establishment_status
-    )
+    # Get filter parameters from query string
+    filters = _parse_report_filters(request)
     
-    # Get list of establishment types and protected areas for dropdowns
-    establishment_types = get_establishment_types_for_cenro(cenro_id) if cenro_id else []
-    protected_areas = get_protected_areas_for_cenro(cenro_id) if cenro_id else []
+    def _no_options():
+        return []
+    
+    # One page of reports for this CENRO plus the dropdown options, fetched concurrently
+    page, establishment_types, protected_areas = await gather_io(
+        (functools.partial(
+            get_enumerator_reports_page,
+            cenro_id=cenro_id,
+            cursor=request.GET.get('cursor') or None,
+            page_size=request.GET.get('page_size') or REPORTS_PAGE_SIZE,
+            **filters
+        ),),
+        (get_establishment_types_for_cenro, cenro_id) if cenro_id else (_no_options,),
+        (get_protected_areas_for_cenro, cenro_id) if cenro_id else (_no_options,),
+    )
+    reports = page['reports']
+    from_date = filters['from_date']
+    to_date = filters['to_date']
+    establishment_type = filters['establishment_type']
+    pa_id = filters['pa_id']
+    establishment_status = filters['establishment_status']
     
     # Pass reports and filter options to template
     context = {
@@ -165,12 +390,13 @@ def cenro_reports(request):
         'pa_id': pa_id,
         'protected_areas': protected_areas,
         'establishment_status': establishment_status,
-        # 🆕 ADD THESE TWO LINES FOR SUPABASE SUPPORT
-        'supabase_url': os.getenv('SUPABASE_URL'),
-        'supabase_bucket': os.getenv('SUPABASE_BUCKET', 'images'),
+        'next_cursor': page['next_cursor'],
+        'has_more': page['has_more'],
+        'is_first_page': not request.GET.get('cursor'),
+        'page_size': page['page_size'],
     }
     
-    return render(request, 'CENRO/CENRO_reports.html', context)
+    return await sync_to_async(render)(request, 'CENRO/CENRO_reports.html', context)
 
 @login_required
 @role_required(['CENRO'])
@@ -180,44 +406,170 @@ def cenro_templates(request):
 @login_required
 @role_required(['CENRO'])
 def cenro_export_reports(request):
-    """Export filtered reports as PDF, Word, or Excel"""
+    """Export filtered reports as PDF, Word, Excel or CSV"""
     cenro_id = request.session.get('cenro_id')
     format_type = request.GET.get('format', 'pdf')
     
-    from_date_str = request.GET.get('from_date')
-    to_date_str = request.GET.get('to_date')
-    establishment_type = request.GET.get('establishment_type')
-    pa_id_str = request.GET.get('pa_id')
-    establishment_status = request.GET.get('establishment_status')
+    filters = _parse_report_filters(request)
+    activity_log.log_activity(activity_log.EXPORT, {'format': format_type, **filters}, request=request)
     
-    from_date = datetime.strptime(from_date_str, '%Y-%m-%d').date() if from_date_str else None
-    to_date = datetime.strptime(to_date_str, '%Y-%m-%d').date() if to_date_str else None
-    pa_id = int(pa_id_str) if pa_id_str else None
+    # CSV and Excel rows are streamed straight from a server-side cursor
+    if format_type in STREAMING_EXPORT_FORMATS:
+        return stream_export_reports(iter_enumerator_reports(cenro_id, **filters), format_type,
+                                     asynchronous=isinstance(request, ASGIRequest))
     
-    reports = get_enumerator_reports(cenro_id, from_date, to_date, establishment_type, pa_id, establishment_status)
+    reports = get_enumerator_reports(cenro_id, **filters)
     return export_reports(reports, format_type)
 
+def _export_job_payload(status):
+    payload = {
+        'job_id': status['job_id'],
+        'format': status['format'],
+        'status': status['status'],
+        'processed': status.get('processed', 0),
+        'total': status.get('total'),
+        'progress': status.get('progress', 0.0),
+        'error': status.get('error'),
+        'status_url': reverse('CENRO-export-job-status', args=[status['job_id']]),
+    }
+    if status['status'] == 'done':
+        payload['download_url'] = reverse('CENRO-export-job-download', args=[status['job_id']])
+    return payload
+
 @login_required
 @role_required(['CENRO'])
-def cenro_report_details(request, report_id):
+def cenro_export_job_create(request):
+    """Queue a background export of the filtered reports (or reuse a still-valid one)"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    cenro_id = request.session.get('cenro_id')
+    format_type = request.GET.get('format', 'pdf')
+    filters = _parse_report_filters(request)
+
+    status = export_jobs.enqueue_export(cenro_id, format_type, filters)
+    activity_log.log_activity(activity_log.EXPORT, {'format': format_type, 'job_id': status['job_id'], **filters},
+                              request=request)
+    return JsonResponse(_export_job_payload(status), status=202)
+
+@login_required
+@role_required(['CENRO'])
+def cenro_export_job_status(request, job_id):
+    """Report progress of a background export job"""
+    status = export_jobs.get_export_status(job_id)
+    if not status or status.get('cenro_id') != request.session.get('cenro_id'):
+        return JsonResponse({'error': 'Export job not found'}, status=404)
+    return JsonResponse(_export_job_payload(status))
+
+@login_required
+@role_required(['CENRO'])
+def cenro_export_job_download(request, job_id):
+    """Download the artifact of a finished export job"""
+    status = export_jobs.get_export_status(job_id)
+    artifact = export_jobs.get_export_artifact(job_id)
+    if not status or not artifact or status.get('cenro_id') != request.session.get('cenro_id'):
+        return JsonResponse({'error': 'Export not available'}, status=404)
+
+    path, content_type, filename = artifact
+    return FileResponse(open(path, 'rb'), content_type=content_type, as_attachment=True, filename=filename)
+
+@login_required
+@role_required(['CENRO'])
+async def cenro_report_details(request, report_id):
     """
     API endpoint to get detailed report information for the modal
     """
     cenro_id = request.session.get('cenro_id')
 
-    # Get report details (existing DB-backed function)
-    report_data = get_report_details(report_id, cenro_id)
+    # Details and images, served from the report-details cache when possible
+    report_data = (await run_io(get_report_payloads, [report_id], cenro_id)).get(report_id)
 
     if not report_data:
         return JsonResponse({'error': 'Report not found or access denied'}, status=404)
 
-    # New: fetch images via Supabase
-    images = get_report_images(report_id)
-    report_data['images'] = images
-
     return JsonResponse(report_data)
 
 
+@login_required
+@role_required(['CENRO'])
+def cenro_report_details_batch(request):
+    """
+    API endpoint returning details and images for several reports (?ids=1,2,3)
+    with one database query, so the report modal can prefetch the next reports.
+    """
+    cenro_id = request.session.get('cenro_id')
+    requested = [part.strip() for part in request.GET.get('ids', '').split(',') if part.strip()]
+
+    reports = get_report_payloads(requested, cenro_id)
+
+    return JsonResponse({
+        'reports': {str(report_id): report_data for report_id, report_data in reports.items()},
+        'missing': [report_id for report_id in requested if not report_id.isdigit() or int(report_id) not in reports],
+    })
+
+
+@login_required
+@role_required(['CENRO', 'PENRO'])
+def cenro_sign_reports(request):
+    """Attest or note many reports with one signature.
+
+    Expects POST JSON: { action: 'attest' | 'note', report_ids: [...], name, position, signature_dataurl }
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        payload = json.loads(request.body.decode('utf-8') or '{}')
+    except Exception:
+        return JsonResponse({'error': 'Invalid JSON payload'}, status=400)
+
+    report_ids = payload.get('report_ids')
+    signature_dataurl = payload.get('signature_dataurl')
+    if not isinstance(report_ids, list) or not report_ids:
+        return JsonResponse({'error': 'report_ids must be a non-empty list'}, status=400)
+    if not signature_dataurl:
+        return JsonResponse({'error': 'Signature data is required'}, status=400)
+
+    name = payload.get('name') or f"{request.session.get('first_name','').strip()} {request.session.get('last_name','').strip()}".strip()
+    position = payload.get('position') or ''
+    # CENRO heads sign their own office's reports, PENRO heads those of the CENROs under them
+    principal = get_principal(request)
+    if principal.role == 'cenro' and principal.cenro_id:
+        cenro_ids = [principal.cenro_id]
+    elif principal.role == 'penro' and principal.penro_id:
+        cenro_ids = [cenro['id'] for cenro in get_office_tree().cenro_list(principal.penro_id)]
+    else:
+        return JsonResponse({'error': 'Your account is not assigned to an office'}, status=403)
+
+    ok, info = sign_reports(payload.get('action'), report_ids, name, position, signature_dataurl, cenro_ids)
+    if not ok:
+        return JsonResponse({'error': info or 'Failed to sign reports'}, status=400)
+    return JsonResponse({'success': True, **info})
+
+
+@login_required
+def signature_image(request, digest):
+    """Serve a signature still queued for upload, or redirect to its stored copy."""
+    data = signatures.pending_signature(digest)
+    if data is None:
+        return redirect(signatures.signature_url(f"{signatures.SIGNATURE_PREFIX}/{digest}.png"))
+    response = HttpResponse(data, content_type='image/png')
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def storage_object(request, bucket, path):
+    """Public URL of an object held by the memory or simulated storage backend (Supabase serves these itself)."""
+    try:
+        data = storage.download(path, bucket=bucket)
+    except StorageError as e:
+        if e.status == 404:
+            raise Http404(path)
+        raise
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    return HttpResponse(data, content_type=content_type)
+
+
 @login_required
 @role_required(['CENRO', 'PENRO'])
 def cenro_note_report(request, report_id):
@@ -347,75 +699,103 @@ def protected_areas(request):
     
     # GET request - display protected areas
     protected_areas_list = op.get_protected_areas()
+    for pa in protected_areas_list:
+        pa['file_url'] = storage.public_url(pa['file_path']) if pa.get('file_path') else ''
     
     return render(request, 'ADMIN/ProtectedArea.html', {
         'protected_areas': protected_areas_list,
-        'supabase_url': os.getenv('SUPABASE_URL'),
-        'supabase_bucket': os.getenv('SUPABASE_BUCKET', 'geo-tagged-photos'),
     })
 
 
+def _full_geojson(file_path, version):
+    """Full-resolution GeoJSON bytes for a shapefile, converted on a cache miss."""
+    from . import operation as op
+
+    data = geojson_cache.get(file_path, version)
+    if data is None:
+        geojson = op.load_shapefile_geojson(file_path)
+        data = json.dumps(geojson, cls=DjangoJSONEncoder).encode('utf-8')
+        geojson_cache.set(file_path, version, data)
+    return data
+
+
+def _simplified_geojson(file_path, version, level):
+    """GeoJSON bytes simplified for a zoom level; all levels are computed together on first use."""
+    data = geojson_cache.get(file_path, f"{version}|z{level}")
+    if data is None:
+        full = json.loads(_full_geojson(file_path, version))
+        for zoom in geometry.SIMPLIFY_ZOOM_LEVELS:
+            level_data = json.dumps(geometry.simplify_feature_collection(full, zoom), cls=DjangoJSONEncoder).encode('utf-8')
+            geojson_cache.set(file_path, f"{version}|z{zoom}", level_data)
+            if zoom == level:
+                data = level_data
+    return data
+
+
+def _shapefile_version(file_path):
+    """
+    Cache version of a protected area's shapefile: its row's last change, so a
+    re-upload never hits a stale entry. None when no protected area uses file_path.
+    """
+    rows = storage.select('protected_areas', filters={'file_path': file_path}, limit=1)
+    if not rows:
+        return None
+    row = rows[0]
+    return f"{row.get('id')}|{row.get('updated_at') or row.get('created_at') or ''}"
+
+
 @login_required
 @role_required(['Admin'])
 def convert_shapefile_to_geojson(request, file_path):
-    """Convert shapefile to GeoJSON for map viewing."""
-    import tempfile
-    import zipfile
-    from supabase import create_client
-    
+    """
+    Convert shapefile to GeoJSON for map viewing (served from the GeoJSON cache when possible).
+
+    Optional query parameters:
+        zoom / tolerance: simplify for a Leaflet zoom level or a tolerance in degrees
+        bbox: minx,miny,maxx,maxy - only return features intersecting this box
+        format: geojson (default) or topojson
+    """
+    # Derived from the protected_areas row; the client's ?v= only busts the browser cache
     try:
-        supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_SERVICE_KEY'))
-        bucket = os.getenv('SUPABASE_BUCKET', 'geo-tagged-photos')
-        
-        with tempfile.TemporaryDirectory() as tmpdir:
-            # Try as zip first
-            try:
-                file_data = supabase.storage.from_(bucket).download(file_path)
-                zip_path = os.path.join(tmpdir, 'shapefile.zip')
-                with open(zip_path, 'wb') as f:
-                    f.write(file_data)
-                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                    zip_ref.extractall(tmpdir)
-                shp_file = next((f for f in os.listdir(tmpdir) if f.endswith('.shp')), None)
-                if shp_file:
-                    shp_path = os.path.join(tmpdir, shp_file)
-                else:
-                    return JsonResponse({'error': 'No .shp file in zip'}, status=400)
-            except zipfile.BadZipFile:
-                # Not a zip, treat as individual shapefile components
-                # Get base name without extension
-                base_name = os.path.basename(file_path).rsplit('.', 1)[0]
-                dir_path = os.path.dirname(file_path)
-                
-                # Download all components with same base name
-                extensions = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
-                for ext in extensions:
-                    try:
-                        component_path = f"{dir_path}/{base_name}{ext}"
-                        component_data = supabase.storage.from_(bucket).download(component_path)
-                        with open(os.path.join(tmpdir, f'{base_name}{ext}'), 'wb') as f:
-                            f.write(component_data)
-                    except:
-                        if ext in ['.shp', '.shx', '.dbf']:  # Required files
-                            raise
-                
-                shp_path = os.path.join(tmpdir, f'{base_name}.shp')
-            
-            # Convert to GeoJSON
-            import fiona
-            
-            features = []
-            with fiona.open(shp_path) as src:
-                for feature in src:
-                    features.append({
-                        'type': 'Feature',
-                        'properties': dict(feature['properties']),
-                        'geometry': dict(feature['geometry'])
-                    })
-            
-            return JsonResponse({'type': 'FeatureCollection', 'features': features})
-    
+        version = _shapefile_version(file_path)
+    except StorageError as e:
+        return JsonResponse({'error': str(e)}, status=503)
+    if version is None:
+        return JsonResponse({'error': 'Protected area not found'}, status=404)
+    output_format = request.GET.get('format', 'geojson')
+    bbox = geometry.parse_bbox(request.GET.get('bbox'))
+
+    try:
+        zoom = float(request.GET['zoom']) if request.GET.get('zoom') else None
+        tolerance = float(request.GET['tolerance']) if request.GET.get('tolerance') else None
+    except ValueError:
+        return JsonResponse({'error': 'zoom and tolerance must be numbers'}, status=400)
+    level = geometry.resolve_zoom_level(zoom, tolerance)
+
+    try:
+        if level is None:
+            data = _full_geojson(file_path, version)
+        else:
+            data = _simplified_geojson(file_path, version, level)
+
+        if output_format == 'topojson' and not bbox:
+            topo_version = f"{version}|z{level if level is not None else 'full'}|topojson"
+            topo = geojson_cache.get(file_path, topo_version)
+            if topo is None:
+                topo = json.dumps(geometry.to_topojson(json.loads(data)), cls=DjangoJSONEncoder).encode('utf-8')
+                geojson_cache.set(file_path, topo_version, topo)
+            data = topo
+        elif bbox:
+            collection = geometry.filter_bbox(json.loads(data), bbox)
+            if output_format == 'topojson':
+                collection = geometry.to_topojson(collection)
+            data = json.dumps(collection, cls=DjangoJSONEncoder).encode('utf-8')
+
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         import logging
         logging.exception('Error converting shapefile')
-        return JsonResponse({'error': str(e)}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': str(e)}, status=500)
+
+    return HttpResponse(data, content_type='application/json')
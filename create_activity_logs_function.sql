@@ -1,30 +1,45 @@
--- SQL function to fetch activity logs
+-- Indexes for activity logs
 -- Run this in your PostgreSQL database
 
-CREATE OR REPLACE FUNCTION get_activity_logs()
-RETURNS TABLE (
-    id INTEGER,
-    user_id INTEGER,
-    username VARCHAR,
-    action VARCHAR,
-    details TEXT,
-    ip_address VARCHAR,
-    created_at TIMESTAMP
-) AS $$
-BEGIN
-    -- Adjust this query based on your actual activity_logs table structure
-    RETURN QUERY
-    SELECT 
-        al.id,
-        al.user_id,
-        u.username,
-        al.action,
-        al.details,
-        al.ip_address,
-        al.created_at
-    FROM activity_logs al
-    LEFT JOIN users u ON al.user_id = u.id
-    ORDER BY al.created_at DESC
-    LIMIT 100;
-END;
-$$ LANGUAGE plpgsql;
+-- Office of the acting user when the action was logged, written by the app
+-- (DENRO/activity_log.py) so office-scoped pages don't have to join users.
+-- Apply this before deploying the writer that fills them.
+ALTER TABLE activity_logs ADD COLUMN IF NOT EXISTS region_id BIGINT;
+ALTER TABLE activity_logs ADD COLUMN IF NOT EXISTS penro_id BIGINT;
+ALTER TABLE activity_logs ADD COLUMN IF NOT EXISTS cenro_id BIGINT;
+
+-- Backfill older rows from the users' current offices
+UPDATE activity_logs al
+SET cenro_id = u.cenro_id,
+    penro_id = COALESCE(u.penro_id, c.penro_id),
+    region_id = COALESCE(u.region_id, p.region_id)
+FROM users u
+LEFT JOIN cenros c ON c.id = u.cenro_id
+LEFT JOIN penros p ON p.id = COALESCE(u.penro_id, c.penro_id)
+WHERE al.user_id = u.id
+  AND al.region_id IS NULL AND al.penro_id IS NULL AND al.cenro_id IS NULL;
+
+-- The app pages through activity_logs newest first on (created_at, id); each
+-- filter below has an index with that order, so its pages are range scans.
+CREATE INDEX IF NOT EXISTS activity_logs_created_at_id_idx
+    ON activity_logs (created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS activity_logs_user_created_at_idx
+    ON activity_logs (user_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS activity_logs_action_created_at_idx
+    ON activity_logs (action, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS activity_logs_region_created_at_idx
+    ON activity_logs (region_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS activity_logs_penro_created_at_idx
+    ON activity_logs (penro_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS activity_logs_cenro_created_at_idx
+    ON activity_logs (cenro_id, created_at DESC, id DESC);
+
+-- Logs are read by operation.get_activity_logs_page; the old get_activity_logs()
+-- SQL functions are no longer used.
+DROP FUNCTION IF EXISTS get_activity_logs();
+DROP FUNCTION IF EXISTS get_activity_logs(INTEGER, TIMESTAMP, INTEGER, INTEGER, VARCHAR, TIMESTAMP, TIMESTAMP);
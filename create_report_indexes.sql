@@ -0,0 +1,23 @@
+-- Indexes backing the paginated report listing (get_enumerator_reports_page)
+-- Run this in your PostgreSQL database
+
+-- Keyset pagination on (report_date, created_at, id); the expressions must match
+-- the ORDER BY in operation.get_enumerator_reports_page exactly.
+CREATE INDEX IF NOT EXISTS enumerators_report_keyset_idx
+    ON enumerators_report (
+        (COALESCE(report_date, '-infinity')) DESC,
+        (COALESCE(created_at, '-infinity')) DESC,
+        id DESC
+    );
+
+-- CENRO scoping goes through the enumerator's user row
+CREATE INDEX IF NOT EXISTS users_cenro_id_idx ON users (cenro_id);
+CREATE INDEX IF NOT EXISTS enumerators_report_enumerator_id_idx ON enumerators_report (enumerator_id);
+
+-- Report images are looked up by report, ordered by image_sequence
+CREATE INDEX IF NOT EXISTS reported_images_report_idx
+    ON reported_images (report_id, report_type, image_sequence);
+
+-- Dashboard report statistics count an office's reports over a report_date range
+CREATE INDEX IF NOT EXISTS enumerators_report_enumerator_date_idx
+    ON enumerators_report (enumerator_id, report_date);
@@ -0,0 +1,34 @@
+-- Full-text and fuzzy search over enumerator reports (operation.search_enumerator_reports)
+-- Run this in your PostgreSQL database
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Weighted document kept current by Postgres on every insert/update:
+-- establishment name (A), proponent and informant (B), remarks (C).
+-- The 'simple' configuration does no stemming, which suits personal and business names.
+ALTER TABLE enumerators_report
+    ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', COALESCE(establishment_name, '')), 'A') ||
+        setweight(to_tsvector('simple', COALESCE(proponent_name, '')), 'B') ||
+        setweight(to_tsvector('simple', COALESCE(informant_name, '')), 'B') ||
+        setweight(to_tsvector('simple', COALESCE(remarks, '')), 'C')
+    ) STORED;
+
+-- Lowercased text of the same fields for typo-tolerant trigram matching
+ALTER TABLE enumerators_report
+    ADD COLUMN IF NOT EXISTS search_text TEXT GENERATED ALWAYS AS (
+        LOWER(
+            COALESCE(establishment_name, '') || ' ' ||
+            COALESCE(proponent_name, '') || ' ' ||
+            COALESCE(informant_name, '') || ' ' ||
+            COALESCE(remarks, '')
+        )
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS enumerators_report_search_vector_idx
+    ON enumerators_report USING GIN (search_vector);
+
+CREATE INDEX IF NOT EXISTS enumerators_report_search_text_trgm_idx
+    ON enumerators_report USING GIN (search_text gin_trgm_ops);
+
+ANALYZE enumerators_report;
@@ -0,0 +1,5 @@
+-- Per-user session cut-off (principal.revoke_user_sessions / manage.py revoke_sessions)
+-- Run this in your PostgreSQL database
+
+-- Sessions that logged in before this time no longer authenticate
+ALTER TABLE users ADD COLUMN IF NOT EXISTS sessions_revoked_at TIMESTAMPTZ;
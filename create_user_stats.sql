@@ -0,0 +1,56 @@
+-- Aggregate user counts for the Super Admin dashboard
+-- Run this in your PostgreSQL database
+
+-- Accounts can be deactivated without deleting them
+ALTER TABLE users ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT TRUE;
+
+-- One row per (role, is_active); the dashboard reads this instead of counting users.
+-- Roles are stored lowercased and trimmed, e.g. 'admin', 'penro', 'cenro', 'evaluator'.
+CREATE TABLE IF NOT EXISTS user_role_counts (
+    role VARCHAR(50) NOT NULL,
+    is_active BOOLEAN NOT NULL,
+    user_count BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (role, is_active)
+);
+
+CREATE OR REPLACE FUNCTION bump_user_role_count(p_role VARCHAR, p_is_active BOOLEAN, p_delta INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO user_role_counts AS c (role, is_active, user_count, updated_at)
+    VALUES (LOWER(TRIM(COALESCE(p_role, ''))), COALESCE(p_is_active, TRUE), p_delta, now())
+    ON CONFLICT (role, is_active)
+    DO UPDATE SET user_count = c.user_count + EXCLUDED.user_count, updated_at = now();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Keeps user_role_counts in step with every insert, delete, role change and (de)activation
+CREATE OR REPLACE FUNCTION users_maintain_role_counts()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM bump_user_role_count(NEW.role, NEW.is_active, 1);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM bump_user_role_count(OLD.role, OLD.is_active, -1);
+    ELSIF NEW.role IS DISTINCT FROM OLD.role OR NEW.is_active IS DISTINCT FROM OLD.is_active THEN
+        PERFORM bump_user_role_count(OLD.role, OLD.is_active, -1);
+        PERFORM bump_user_role_count(NEW.role, NEW.is_active, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_role_counts_trigger ON users;
+CREATE TRIGGER users_role_counts_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF role, is_active ON users
+    FOR EACH ROW EXECUTE FUNCTION users_maintain_role_counts();
+
+-- Backfill (and repair) the counts from the users table
+BEGIN;
+LOCK TABLE users IN SHARE MODE;
+DELETE FROM user_role_counts;
+INSERT INTO user_role_counts (role, is_active, user_count)
+SELECT LOWER(TRIM(COALESCE(role, ''))), is_active, COUNT(*)
+FROM users
+GROUP BY 1, 2;
+COMMIT;